@@ -1,44 +1,87 @@
 BASEDIR=$1
 COMMIT=$2
 
-# Remove destination directory - but only if it's a /tmp dir:
-if [[ "$BASEDIR" =~ ^/tmp/.* ]] ;
-then
-  echo Removing $BASEDIR
-  rm -rf $BASEDIR
+REPO=https://github.com/NYPL/discovery-api.git
+
+# Persistent caches shared by every checkout:
+CACHE_DIR=${SRT_CACHE_DIR:-/tmp/srt/cache}
+MIRROR=$CACHE_DIR/discovery-api.git
+NODE_MODULES_CACHE=$CACHE_DIR/discovery-api-node_modules
+
+mkdir -p $CACHE_DIR $NODE_MODULES_CACHE
+
+# Create bare mirror of the repo, or fetch incrementally into existing one:
+if [ ! -d "$MIRROR" ]; then
+  echo git clone --bare $REPO $MIRROR
+  git clone --bare --quiet $REPO $MIRROR
+  git --git-dir=$MIRROR config remote.origin.fetch '+refs/heads/*:refs/heads/*'
+elif [ "$COMMIT" = "HEAD" ] || ! git --git-dir=$MIRROR cat-file -e "$COMMIT^{commit}" 2>/dev/null; then
+  echo Fetching into $MIRROR
+  git --git-dir=$MIRROR fetch --prune --quiet origin
 fi
 
-# Clone repo:
-if [ ! -d "$BASEDIR" ]; then
-  echo git clone https://github.com/NYPL/discovery-api.git $BASEDIR  # --quiet
-  git clone https://github.com/NYPL/discovery-api.git $BASEDIR  # --quiet
+# Commits no longer reachable from a branch must be fetched explicitly:
+if ! git --git-dir=$MIRROR cat-file -e "$COMMIT^{commit}" 2>/dev/null; then
+  echo Fetching $COMMIT into $MIRROR
+  git --git-dir=$MIRROR fetch --quiet origin $COMMIT
 fi
 
-cd $BASEDIR
+SHA=`git --git-dir=$MIRROR rev-parse "$COMMIT^{commit}"`
 
-# Checkout commit:
-echo git checkout $COMMIT  # --quiet
-git checkout $COMMIT --quiet
+# Check out commit in a worktree of the mirror. Reuse the worktree if
+# BASEDIR is already one, so that only changed files are written:
+if [ -f "$BASEDIR/.git" ] && grep -q "$MIRROR/worktrees/" "$BASEDIR/.git" ; then
+  echo git checkout $SHA in existing worktree $BASEDIR
+  git -C $BASEDIR checkout --detach --force --quiet $SHA
+  git -C $BASEDIR clean -fdxq -e node_modules
+elif [ -d "$BASEDIR/.git" ] ; then
+  # BASEDIR is an independent clone (e.g. a local checkout outside /tmp):
+  echo git checkout $COMMIT in $BASEDIR
+  git -C $BASEDIR checkout $COMMIT --quiet
+else
+  # Remove destination directory - but only if it's a /tmp dir:
+  if [[ "$BASEDIR" =~ ^/tmp/.* ]] ;
+  then
+    echo Removing $BASEDIR
+    rm -rf $BASEDIR
+  fi
 
-# echo Open files:
-# lsof -i -n -P | wc -l
+  echo git worktree add $BASEDIR $SHA
+  git --git-dir=$MIRROR worktree prune
+  git --git-dir=$MIRROR worktree add --detach --force --quiet $BASEDIR $SHA
+fi
 
-echo Beginning npm install
-# Install dependencies:
-# npm install # > /dev/null
-# export SET NODE_OPTIONS=--max-old-space-size=40
-npm install --logs-dir=. --cache=/tmp/.npm --omit=dev
+cd $BASEDIR
 
-# echo ..Open files:
-# lsof -i -n -P | wc -l
+# Dependencies are cached by a hash of the lockfile (and node version):
+LOCKFILE=package-lock.json
+if [ ! -f "$LOCKFILE" ]; then
+  LOCKFILE=package.json
+fi
+DEPS_KEY=`(cat $LOCKFILE; node --version) | sha256sum | cut -d ' ' -f 1`
+CACHED_DEPS=$NODE_MODULES_CACHE/$DEPS_KEY
 
-# echo "Installed client-kms: in $BASEDIR:"
-# ls -l ./node_modules/@aws-sdk
+if [ ! -d "$CACHED_DEPS/node_modules" ]; then
+  echo Beginning npm install
+  rm -rf node_modules
+  # Install dependencies:
+  # export SET NODE_OPTIONS=--max-old-space-size=40
+  npm install --logs-dir=. --cache=/tmp/.npm --omit=dev
+  mkdir -p node_modules
 
-# echo 'All:'
-# find $BASEDIR/node_modules/@aws-sdk/client-kms | sed -e "s/[^-][^\/]*\//  |/g" -e "s/|\([^ ]\)/|-\1/"
+  # Publish to cache atomically, so an interrupted install is never reused:
+  rm -rf $CACHED_DEPS.tmp
+  mkdir -p $CACHED_DEPS.tmp
+  mv node_modules $CACHED_DEPS.tmp/node_modules
+  mv $CACHED_DEPS.tmp $CACHED_DEPS
+else
+  echo Using cached node_modules $CACHED_DEPS
+fi
 
-# echo "has client?"
-# node -e "const resp = require('@aws-sdk/client-kms').KMSClient; console.log(resp)"
+# Hardlink cached tree into place (falling back on a copy where hardlinks
+# aren't supported):
+rm -rf node_modules
+cp -al $CACHED_DEPS/node_modules node_modules 2>/dev/null \
+  || cp -R $CACHED_DEPS/node_modules node_modules
 
 echo Done
@@ -0,0 +1,140 @@
+"""
+Compare pack/restore time and disk use of the zip packaging (as formerly done
+by package.sh/unpackage.sh) with lib.build_store.BuildStore.
+
+Simulates packaging two commits that differ by a handful of files:
+
+    python -m benchmarks.build_packages [--source DIR] [--files N] [--changed N]
+
+If --source isn't given (e.g. an initialized discovery-api checkout), a
+synthetic tree resembling a node_modules-heavy checkout is generated.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from lib.build_store import BuildStore
+
+
+def generate_tree(basedir, files, seed=1):
+    rng = random.Random(seed)
+    words = [f"token{i}" for i in range(2000)]
+    for i in range(files):
+        path = os.path.join(
+            basedir, "node_modules", f"pkg{i % 97}", "lib", f"file{i}.js"
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(" ".join(rng.choice(words) for _ in range(rng.randint(50, 2000))))
+
+
+def modify_tree(basedir, changed, seed=2):
+    rng = random.Random(seed)
+    paths = []
+    for root, _, filenames in os.walk(basedir):
+        paths.extend(os.path.join(root, f) for f in filenames)
+    for path in rng.sample(sorted(paths), min(changed, len(paths))):
+        with open(path, "a") as f:
+            f.write(f"// changed {rng.random()}\n")
+
+
+def dir_size(path):
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(root, filename))
+    return total
+
+
+def timed(fn):
+    start = time.time()
+    fn()
+    return time.time() - start
+
+
+def zip_pack(source, destination):
+    subprocess.run(
+        ["zip", "-qr", destination, ".", "--exclude", "*.git*"], cwd=source, check=True
+    )
+
+
+def zip_restore(package, destination):
+    shutil.rmtree(destination, ignore_errors=True)
+    subprocess.run(["unzip", "-q", package, "-d", destination], check=True)
+
+
+def run(source, changed):
+    workdir = tempfile.mkdtemp(prefix="srt-bench-", dir="/tmp")
+    commit1 = os.path.join(workdir, "commit1")
+    commit2 = os.path.join(workdir, "commit2")
+    shutil.copytree(source, commit1, symlinks=True)
+    shutil.copytree(source, commit2, symlinks=True)
+    modify_tree(commit2, changed)
+
+    results = {}
+
+    zip_dir = os.path.join(workdir, "zip-builds")
+    os.makedirs(zip_dir)
+    destination = os.path.join(workdir, "zip-restore")
+    results["zip"] = {
+        "pack": timed(lambda: zip_pack(commit1, os.path.join(zip_dir, "1.zip")))
+        + timed(lambda: zip_pack(commit2, os.path.join(zip_dir, "2.zip"))),
+        "restore_cold": timed(
+            lambda: zip_restore(os.path.join(zip_dir, "1.zip"), destination)
+        ),
+        "restore_warm": timed(
+            lambda: zip_restore(os.path.join(zip_dir, "2.zip"), destination)
+        ),
+        "disk": dir_size(zip_dir),
+    }
+
+    store = BuildStore(os.path.join(workdir, "store-builds"))
+    destination = os.path.join(workdir, "store-restore")
+    results["build_store"] = {
+        "pack": timed(lambda: store.pack(commit1, "1"))
+        + timed(lambda: store.pack(commit2, "2")),
+        "restore_cold": timed(lambda: store.restore("1", destination)),
+        "restore_warm": timed(lambda: store.restore("2", destination)),
+        "disk": store.disk_usage(),
+    }
+
+    shutil.rmtree(workdir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--source")
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--changed", type=int, default=20)
+    args = parser.parse_args()
+
+    source = args.source
+    tmp_source = None
+    if source is None:
+        tmp_source = source = tempfile.mkdtemp(prefix="srt-bench-src-", dir="/tmp")
+        generate_tree(source, args.files)
+
+    results = run(source, args.changed)
+
+    if tmp_source is not None:
+        shutil.rmtree(tmp_source)
+
+    print(
+        f"{'format':<12} {'pack 2 (s)':>11} {'restore cold (s)':>17} "
+        f"{'restore changed (s)':>20} {'disk (MB)':>10}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:<12} {r['pack']:>11.2f} {r['restore_cold']:>17.2f} "
+            f"{r['restore_warm']:>20.2f} {r['disk'] / 1024 / 1024:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Time and memory-profile manifest loading, score comparison, graph rendering,
+and report building against synthetic manifests (N targets x M runs x K hits):
+
+    python -m benchmarks.suite run [--targets N] [--runs M] [--hits K] [--save NAME]
+    python -m benchmarks.suite compare NAME [--threshold 0.2]
+
+`compare` re-runs the suite with the parameters of the named baseline (saved
+in benchmarks/baselines) and exits non-zero if any phase regressed by more
+than the threshold.
+"""
+
+import os
+
+# Set before loggers are created:
+os.environ.setdefault("LOG_LEVEL", "warning")
+os.environ["SRT_OFFLINE"] = "true"
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import shutil  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+
+from datetime import datetime  # noqa: E402
+
+from benchmarks.synthetic import generate  # noqa: E402
+from lib.graphs import create_graph  # noqa: E402
+from lib.models.report import Report  # noqa: E402
+from lib.models.run import Run  # noqa: E402
+from lib.report_utils import normalize_run_data  # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def phase_load_manifests(context):
+    context["runs"] = Run.all_from_manifests(context["app_config"])
+
+
+def phase_has_equivalent_scores(context):
+    runs = context["runs"]
+    for ind in range(1, len(runs)):
+        runs[ind - 1].has_equivalent_scores(runs[ind])
+
+
+def phase_create_graph(context):
+    runs = context["runs"]
+    labels = [run.app_version() for run in runs]
+    basedir = context["app_config"].local_temp_path("report")
+    os.makedirs(f"{basedir}/graphs", exist_ok=True)
+    for target in context["app_config"].targets:
+        results = [
+            r for run in runs for r in run.responses if r.target.key == target.key
+        ]
+        scores, _, elapsed_relative, counts = normalize_run_data(results)
+        create_graph(
+            labels,
+            scores,
+            elapsed_relative,
+            target.key,
+            counts=counts,
+            basedir=basedir,
+            rebuild=True,
+        )
+
+
+def phase_report_build(context):
+    report = Report(app="synthetic")
+    report.app_config = context["app_config"]
+    report.runs = context["runs"]
+    # Graphs were rendered by the previous phase:
+    report.build(rebuild_graphs=False, persist_to_s3=False)
+
+
+PHASES = [
+    ("load_manifests", phase_load_manifests),
+    ("has_equivalent_scores", phase_has_equivalent_scores),
+    ("create_graph", phase_create_graph),
+    ("report_build", phase_report_build),
+]
+
+
+def run_suite(targets, runs, hits):
+    basedir = tempfile.mkdtemp(prefix="srt-bench-", dir="/tmp")
+    try:
+        context = {"app_config": generate(basedir, targets, runs, hits)}
+
+        results = {}
+        for name, phase in PHASES:
+            start_time = time.perf_counter()
+            phase(context)
+            seconds = time.perf_counter() - start_time
+
+            # Measure memory in a separate pass, since tracing skews timing:
+            tracemalloc.start()
+            phase(context)
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[name] = {
+                "seconds": round(seconds, 4),
+                "peak_mb": round(peak / 1024 / 1024, 2),
+                "retained_mb": round(retained / 1024 / 1024, 2),
+            }
+            print(
+                f"  {name:<24} {seconds:>8.3f}s {peak / 1024 / 1024:>9.2f}MB peak"
+                f" {retained / 1024 / 1024:>9.2f}MB retained"
+            )
+    finally:
+        shutil.rmtree(basedir, ignore_errors=True)
+
+    return {
+        "params": {"targets": targets, "runs": runs, "hits": hits},
+        "phases": results,
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+    }
+
+
+def regressions(baseline, current, threshold):
+    found = []
+    for name, baseline_phase in baseline["phases"].items():
+        current_phase = current["phases"].get(name)
+        if current_phase is None:
+            continue
+        for measure in ["seconds", "peak_mb", "retained_mb"]:
+            before = baseline_phase.get(measure)
+            after = current_phase.get(measure)
+            if before is None or after is None:
+                continue
+            if before > 0 and (after - before) / before > threshold:
+                found.append(
+                    f"{name} {measure}: {before} => {after} (+{(after - before) / before:.0%})"
+                )
+    return found
+
+
+def baseline_path(name):
+    return os.path.join(BASELINES_PATH, f"{name}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["run", "compare"])
+    parser.add_argument("baseline", nargs="?")
+    parser.add_argument("--targets", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--hits", type=int, default=25)
+    parser.add_argument("--save", help="Save results as a named baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    params = {"targets": args.targets, "runs": args.runs, "hits": args.hits}
+    baseline = None
+    if args.command == "compare":
+        if args.baseline is None:
+            parser.error("compare requires a BASELINE name")
+        with open(baseline_path(args.baseline)) as f:
+            baseline = json.load(f)
+        params = baseline["params"]
+
+    print(
+        f"Running suite with {params['targets']} targets x {params['runs']} runs x {params['hits']} hits"
+    )
+    results = run_suite(**params)
+
+    if args.save:
+        os.makedirs(BASELINES_PATH, exist_ok=True)
+        with open(baseline_path(args.save), "w") as f:
+            f.write(json.dumps(results, indent=2))
+        print(f"Saved baseline {baseline_path(args.save)}")
+
+    if baseline is not None:
+        found = regressions(baseline, results, args.threshold)
+        if len(found) > 0:
+            print(f"Regressions beyond {args.threshold:.0%}:")
+            for regression in found:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
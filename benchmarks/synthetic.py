@@ -0,0 +1,118 @@
+"""
+Generates synthetic manifests (N targets x M runs x K hits) seeded from the
+test fixtures, and an AppConfig that serves them without network access.
+"""
+
+import copy
+import json
+import os
+import random
+
+from datetime import datetime, timedelta
+
+from lib.models.app_config import AppConfig
+from lib.models.search_target import SearchTarget
+
+FIXTURES = ["tests/fixtures/run-1.json", "tests/fixtures/run-2.json"]
+
+
+class SyntheticAppConfig(AppConfig):
+    """An AppConfig whose commits, targets, and temp dir are all local"""
+
+    def __init__(self, basedir, commits, targets):
+        super().__init__("synthetic")
+        self.basedir = basedir
+        self._official_commits = commits
+        self.targets = targets
+
+    def load_targets(self, **kwargs):
+        return self.targets
+
+    def local_temp_path(self, folder=None):
+        if folder is not None:
+            return os.path.join(self.basedir, folder)
+        os.makedirs(self.basedir, exist_ok=True)
+        return self.basedir
+
+
+def seed_responses():
+    responses = []
+    for path in FIXTURES:
+        with open(path) as f:
+            responses.extend(json.load(f)["responses"])
+    return responses
+
+
+def synthetic_hits(seed_hits, count, rng):
+    hits = []
+    for ind in range(count):
+        hit = copy.deepcopy(seed_hits[ind % len(seed_hits)])
+        if ind >= len(seed_hits):
+            hit["_id"] = f"{hit['_id']}-{ind}"
+        hit["_score"] = rng.uniform(1, 300)
+        hits.append(hit)
+    return hits
+
+
+def generate(basedir, targets=50, runs=10, hits=25, seed=1):
+    """
+    Write `runs` manifests, each with responses for `targets` targets with
+    `hits` matching documents, to BASEDIR/manifests.
+
+    Returns a SyntheticAppConfig serving them.
+    """
+    rng = random.Random(seed)
+    seeds = [r for r in seed_responses() if len(r["matching_documents"]) > 0]
+
+    target_jsons = []
+    for ind in range(targets):
+        target = dict(seeds[ind % len(seeds)]["target"])
+        target["q"] = f"{target['q']} {ind}"
+        target_jsons.append(target)
+
+    manifests_path = os.path.join(basedir, "manifests")
+    os.makedirs(manifests_path, exist_ok=True)
+
+    commits = []
+    start_date = datetime.fromisoformat("2025-01-01T00:00:00-04:00")
+    for run_ind in range(runs):
+        commit_id = f"{run_ind:040x}"
+        commits.append({"commit": commit_id, "description": f"Synthetic run {run_ind}"})
+
+        responses = []
+        for target_ind, target in enumerate(target_jsons):
+            seed_response = seeds[target_ind % len(seeds)]
+            response = copy.deepcopy(seed_response["response"])
+            score = rng.choice([0.0, 0.5, 1.0, rng.random()])
+            response["metric_score"] = score
+            response["details"]["report"]["metric_score"] = score
+            responses.append(
+                {
+                    "target": target,
+                    "response": response,
+                    "elapsed": rng.randint(50, 1500),
+                    "count": rng.randint(0, 100000),
+                    "matching_documents": synthetic_hits(
+                        seed_response["matching_documents"], hits, rng
+                    ),
+                }
+            )
+
+        manifest = {
+            "base_dir": "/tmp/synthetic",
+            "commit_date": (start_date + timedelta(days=run_ind)).isoformat(),
+            "commit_description": f"Synthetic run {run_ind}",
+            "commit_id": commit_id,
+            "created_date": datetime.now().isoformat(),
+            "explicit_base_dir": False,
+            "file_key": commit_id,
+            "previous_commit_id": None,
+            "responses": responses,
+            "run_date": datetime.now().isoformat(),
+        }
+        with open(os.path.join(manifests_path, f"{commit_id}.json"), "w") as f:
+            f.write(json.dumps(manifest))
+
+    return SyntheticAppConfig(
+        basedir, commits, [SearchTarget.from_json(t) for t in target_jsons]
+    )
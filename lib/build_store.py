@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import stat
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("build_store")
+
+# Files larger than this are split into several content-addressed chunks:
+CHUNK_SIZE = 4 * 1024 * 1024
+# Favor speed over ratio; zlib releases the GIL, so chunks compress in parallel:
+COMPRESSION_LEVEL = 1
+STATE_FILE = ".srt-build.json"
+
+
+def excluded(name):
+    # Matches the zip packaging, which excluded '*.git*':
+    return name.startswith(".git") or name == STATE_FILE
+
+
+class BuildStore:
+    """
+    Stores packaged app checkouts (e.g. discovery-api with node_modules) as
+    a per-commit manifest of files referencing compressed, content-addressed
+    chunks shared between all commits:
+
+        BASEDIR/COMMIT.build.json
+        BASEDIR/objects/AB/ABCDEF...
+
+    Restoring a build only writes files that differ from what's on disk.
+    """
+
+    def __init__(self, basedir, workers=None):
+        self.basedir = basedir
+        self.objects_path = os.path.join(basedir, "objects")
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 2)
+
+    def manifest_path(self, commit_id):
+        return os.path.join(self.basedir, f"{commit_id}.build.json")
+
+    def has_build(self, commit_id):
+        return os.path.isfile(self.manifest_path(commit_id))
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest)
+
+    def pack(self, source_dir, commit_id):
+        """Package source_dir as the build for commit_id"""
+        files = []
+        links = []
+        dirs = []
+        for root, dirnames, filenames in os.walk(source_dir):
+            dirnames[:] = sorted(d for d in dirnames if not excluded(d))
+            for dirname in dirnames:
+                path = os.path.join(root, dirname)
+                if os.path.islink(path):
+                    links.append(self.link_entry(source_dir, path))
+                else:
+                    dirs.append(os.path.relpath(path, source_dir))
+            for filename in sorted(filenames):
+                if excluded(filename):
+                    continue
+                path = os.path.join(root, filename)
+                if os.path.islink(path):
+                    links.append(self.link_entry(source_dir, path))
+                else:
+                    files.append(path)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            entries = list(
+                executor.map(lambda path: self.store_file(source_dir, path), files)
+            )
+
+        manifest = {"format": 1, "files": entries, "links": links, "dirs": dirs}
+        os.makedirs(self.basedir, exist_ok=True)
+        with open(self.manifest_path(commit_id), "w") as f:
+            f.write(json.dumps(manifest))
+
+        logger.info(
+            f"Packaged {len(entries)} files from {source_dir} to {self.manifest_path(commit_id)}"
+        )
+        return manifest
+
+    def link_entry(self, source_dir, path):
+        return {
+            "path": os.path.relpath(path, source_dir),
+            "target": os.readlink(path),
+        }
+
+    def store_file(self, source_dir, path):
+        chunks = []
+        size = 0
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data and len(chunks) > 0:
+                    break
+                size += len(data)
+                chunks.append(self.store_chunk(data))
+                if len(data) < CHUNK_SIZE:
+                    break
+
+        return {
+            "path": os.path.relpath(path, source_dir),
+            "mode": stat.S_IMODE(os.stat(path).st_mode),
+            "size": size,
+            "chunks": chunks,
+        }
+
+    def store_chunk(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{id(data)}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(data, COMPRESSION_LEVEL))
+            os.replace(tmp_path, path)
+        return digest
+
+    def restore(self, commit_id, destination):
+        """
+        Restore the build for commit_id into destination, writing only files
+        that differ from the last build restored there.
+        """
+        with open(self.manifest_path(commit_id)) as f:
+            manifest = json.load(f)
+
+        state_path = os.path.join(destination, STATE_FILE)
+        previous_state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                previous_state = json.load(f)
+
+        os.makedirs(destination, exist_ok=True)
+        for dirname in manifest["dirs"]:
+            path = os.path.join(destination, dirname)
+            if os.path.islink(path):
+                os.remove(path)
+            os.makedirs(path, exist_ok=True)
+
+        def restore_entry(entry):
+            path = os.path.join(destination, entry["path"])
+            signature = entry_signature(entry)
+            previous = previous_state.get(entry["path"])
+            if previous is not None and previous["signature"] == signature:
+                if not os.path.islink(path) and file_stamp(path) == previous["stamp"]:
+                    return entry["path"], previous, False
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.srt-tmp"
+            with open(tmp_path, "wb") as f:
+                for digest in entry["chunks"]:
+                    with open(self.object_path(digest), "rb") as chunk:
+                        f.write(zlib.decompress(chunk.read()))
+            os.chmod(tmp_path, entry["mode"])
+            if os.path.isdir(path) and not os.path.islink(path):
+                remove_tree(path)
+            os.replace(tmp_path, path)
+            return (
+                entry["path"],
+                {"signature": signature, "stamp": file_stamp(path)},
+                True,
+            )
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(restore_entry, manifest["files"]))
+
+        for link in manifest["links"]:
+            path = os.path.join(destination, link["path"])
+            if os.path.islink(path) and os.readlink(path) == link["target"]:
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                remove_tree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.symlink(link["target"], path)
+
+        state = {path: file_state for path, file_state, _ in results}
+
+        # Remove stale files, but (as with unzipping) only in a /tmp dir:
+        expected = set(state.keys()) | set(link["path"] for link in manifest["links"])
+        removed = 0
+        if os.path.abspath(destination).startswith(f"{os.sep}tmp{os.sep}"):
+            removed = remove_unexpected(destination, expected)
+
+        with open(state_path, "w") as f:
+            f.write(json.dumps(state))
+
+        written = len([r for r in results if r[2]])
+        logger.info(
+            f"Restored {commit_id} to {destination}: wrote {written} of {len(results)} files"
+            f", removed {removed}"
+        )
+        return {"files": len(results), "written": written, "removed": removed}
+
+    def disk_usage(self):
+        total = 0
+        for root, _, filenames in os.walk(self.basedir):
+            for filename in filenames:
+                total += os.path.getsize(os.path.join(root, filename))
+        return total
+
+
+def entry_signature(entry):
+    return f"{entry['mode']}:{entry['size']}:{','.join(entry['chunks'])}"
+
+
+def file_stamp(path):
+    """Cheap identity for a file on disk, used to detect local modifications"""
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def remove_tree(path):
+    for root, dirnames, filenames in os.walk(path, topdown=False):
+        for filename in filenames:
+            os.remove(os.path.join(root, filename))
+        for dirname in dirnames:
+            dirpath = os.path.join(root, dirname)
+            if os.path.islink(dirpath):
+                os.remove(dirpath)
+            else:
+                os.rmdir(dirpath)
+    os.rmdir(path)
+
+
+def remove_unexpected(destination, expected):
+    removed = 0
+    for root, dirnames, filenames in os.walk(destination, topdown=False):
+        for name in filenames + [
+            d for d in dirnames if os.path.islink(os.path.join(root, d))
+        ]:
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, destination)
+            if relative_path == STATE_FILE or relative_path in expected:
+                continue
+            os.remove(path)
+            removed += 1
+    return removed
@@ -0,0 +1,157 @@
+import json
+import os
+import time
+
+from lib.utils import canonical_json, content_hash
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("cassettes")
+
+# One of None (live), "record", or "replay":
+mode = None
+store = None
+# When replaying, None to respond immediately, "recorded" to sleep for the
+# recorded duration, or a number of ms to sleep for every call:
+replay_latency = None
+
+
+class CassetteMissException(Exception):
+    pass
+
+
+def configure(cassette_mode, path, latency=None):
+    """
+    Enable recording to (or replaying from) the cassette store at path.
+    Replaying implies offline mode.
+    """
+    global mode, store, replay_latency
+
+    if cassette_mode not in [None, "record", "replay"]:
+        raise ValueError(f"Invalid cassette mode: {cassette_mode}")
+
+    mode = cassette_mode
+    store = CassetteStore(path) if cassette_mode is not None else None
+    replay_latency = latency
+    if mode == "replay":
+        os.environ["SRT_OFFLINE"] = "true"
+    logger.info(f"Cassette mode: {mode} ({path})")
+
+
+def is_recording():
+    return mode == "record"
+
+
+def is_replaying():
+    return mode == "replay"
+
+
+def simulate_latency(entry):
+    if replay_latency is None:
+        return
+    elapsed = entry.get("elapsed") or 0
+    delay = elapsed if replay_latency == "recorded" else float(replay_latency)
+    time.sleep(delay / 1000)
+
+
+def cassette(kind, request, fetcher, redact=None):
+    """
+    Return the result of fetcher(), recording it as the response to the
+    given kind of request when recording. When replaying, return the
+    recorded response without calling fetcher.
+
+    If given, redact is applied to the response before it's recorded.
+    """
+    if is_replaying():
+        entry = store.play(kind, request)
+        simulate_latency(entry)
+        return entry["response"]
+
+    start_time = time.time()
+    response = fetcher()
+    if is_recording():
+        elapsed = round((time.time() - start_time) * 1000)
+        recorded = response if redact is None else redact(response)
+        store.record(kind, request, recorded, elapsed)
+    return response
+
+
+class CassetteStore:
+    """
+    Recorded request/response pairs, stored at:
+
+        BASEDIR/KIND/HASH.json
+
+    ... where HASH is a hash of the canonicalized request.
+    """
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+    def path_for(self, kind, request):
+        return os.path.join(self.basedir, kind, f"{content_hash(request)}.json")
+
+    def record(self, kind, request, response, elapsed=None):
+        path = self.path_for(kind, request)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "kind": kind,
+            "request": request,
+            "response": response,
+            "elapsed": elapsed,
+        }
+        with open(path, "w") as f:
+            f.write(canonical_json(entry))
+
+    def play(self, kind, request):
+        path = self.path_for(kind, request)
+        if not os.path.exists(path):
+            raise CassetteMissException(
+                f"No recorded {kind} for {canonical_json(request)[0:200]} in {self.basedir}"
+            )
+        with open(path) as f:
+            return json.load(f)
+
+
+class ReplayedResponse(dict):
+    """An ES response served from a cassette, with its recorded elapsed ms"""
+
+    def __init__(self, response, elapsed):
+        super().__init__(response)
+        self.recorded_elapsed = elapsed
+
+
+class CassetteClient:
+    """
+    Stands in for an Elasticsearch client (or one of its namespaces, e.g.
+    `indices`), recording calls to the wrapped client or replaying them
+    without one.
+    """
+
+    NAMESPACES = ["indices"]
+
+    def __init__(self, client=None, namespace=None):
+        self.client = client
+        self.namespace = namespace
+
+    def __getattr__(self, name):
+        qualified_name = name if self.namespace is None else f"{self.namespace}.{name}"
+        if name in self.NAMESPACES:
+            target = getattr(self.client, name) if self.client is not None else None
+            return CassetteClient(target, qualified_name)
+
+        kind = f"es.{qualified_name}"
+
+        def call(**kwargs):
+            if is_replaying():
+                entry = store.play(kind, kwargs)
+                simulate_latency(entry)
+                return ReplayedResponse(entry["response"], entry["elapsed"])
+
+            start_time = time.time()
+            response = getattr(self.client, name)(**kwargs)
+            elapsed = round((time.time() - start_time) * 1000)
+            response = getattr(response, "body", response)
+            store.record(kind, kwargs, response, elapsed)
+            return response
+
+        return call
@@ -1,29 +1,84 @@
+import threading
+
 from elasticsearch import Elasticsearch
 
+from lib import cassettes, limits
 
-es_config = None
+# The es config of the run being evaluated, per thread:
+_current = threading.local()
 
 
 def set_es_config(config):
-    global es_config
-
-    es_config = config
+    _current.es_config = config
 
 
-_es_client = None
+# Clients by cluster and credentials, shared across threads (Elasticsearch
+# clients are thread-safe):
+_es_clients = {}
+_es_clients_lock = threading.Lock()
 
 
 def es_client():
-    global _es_client
-
+    es_config = getattr(_current, "es_config", None)
     if es_config is None:
-        raise "Error: no es_config"
+        raise RuntimeError("Error: no es_config")
+
+    key = (es_config["nodes"], es_config.get("apiKey"))
+    with _es_clients_lock:
+        if key not in _es_clients:
+            _es_clients[key] = create_es_client(es_config)
+        return _es_clients[key]
+
+
+def create_es_client(config, **options):
+    """
+    Build a client for the given es config, passing options (e.g.
+    connections_per_node) to Elasticsearch
+    """
+    if cassettes.is_replaying():
+        return cassettes.CassetteClient()
+
+    nodes = config["nodes"].split(",")
+
+    api_key = config.get("apiKey")
+
+    client = Elasticsearch(nodes, api_key=api_key, **options)
+    if cassettes.is_recording():
+        client = cassettes.CassetteClient(client)
+    return ThrottledClient(client, config["nodes"])
+
+
+class ThrottledClient:
+    """
+    Stands in for an Elasticsearch client (or one of its namespaces), holding
+    one of its cluster's request slots (see lib.limits) for each call. Slots
+    are looked up per call, since clients outlive limits.configure (e.g.
+    across schedules in a warm process).
+    """
+
+    NAMESPACES = ["indices"]
+
+    def __init__(self, client, cluster):
+        self.client = client
+        self.cluster = cluster
+
+    def __getattr__(self, name):
+        target = getattr(self.client, name)
+        if name in self.NAMESPACES:
+            return ThrottledClient(target, self.cluster)
+        if not callable(target):
+            return target
 
-    if _es_client is None:
-        nodes = es_config["nodes"].split(",")
+        def call(*args, **kwargs):
+            slots = limits.es_request_slots(self.cluster)
+            if slots is None:
+                return target(*args, **kwargs)
+            with slots:
+                return target(*args, **kwargs)
 
-        api_key = es_config.get("apiKey")
+        return call
 
-        _es_client = Elasticsearch(nodes, api_key=api_key)
 
-    return _es_client
+def response_body(resp):
+    """Unwrap an ObjectApiResponse into a plain (serializable) dict"""
+    return getattr(resp, "body", resp)
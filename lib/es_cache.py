@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+
+from lib.elasticsearch import es_client
+from lib.utils import canonical_json, content_hash
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("es_cache")
+
+
+def index_fingerprint(index):
+    """
+    Return a short hash identifying the current state of the named index (or
+    alias). Any write to the index (or a rebuild under the same name) changes
+    the settings uuid, the doc counts, or a shard's max_seq_no.
+    """
+    client = es_client()
+    settings = client.indices.get_settings(index=index)
+    stats = client.indices.stats(index=index, metric="docs", level="shards")
+
+    state = {}
+    for name in sorted(settings):
+        index_stats = stats["indices"].get(name, {})
+        shards = index_stats.get("shards", {})
+        state[name] = {
+            "uuid": settings[name]["settings"]["index"]["uuid"],
+            "docs": index_stats.get("primaries", {}).get("docs"),
+            "max_seq_no": sorted(
+                [
+                    shard.get("seq_no", {}).get("max_seq_no")
+                    for shard_num in sorted(shards)
+                    for shard in shards[shard_num]
+                    if shard.get("routing", {}).get("primary", True)
+                ],
+                key=str,
+            ),
+        }
+    return content_hash(state)[:16]
+
+
+class ResponseCache:
+    """
+    Persistent cache of ES responses, keyed by the canonicalized request and
+    the state of the index it was run against. Entries are stored at:
+
+        BASEDIR/INDEX/FINGERPRINT/KEY.json
+
+    When the index fingerprint changes, entries for the old fingerprint are
+    removed, so stale responses are never served.
+    """
+
+    def __init__(self, basedir, index, enabled=True):
+        self.basedir = basedir
+        self.index = index
+        self.enabled = enabled
+        self._fingerprint = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = index_fingerprint(self.index)
+            logger.debug(f"Index {self.index} fingerprint: {self._fingerprint}")
+            self.prune()
+        return self._fingerprint
+
+    def index_path(self):
+        return os.path.join(self.basedir, self.index.replace(os.sep, "_"))
+
+    def prune(self):
+        """Remove entries cached against previous states of the index"""
+        index_path = self.index_path()
+        if not os.path.isdir(index_path):
+            return
+        for fingerprint in os.listdir(index_path):
+            if fingerprint != self._fingerprint:
+                logger.info(
+                    f"  Invalidating cached responses for {self.index}@{fingerprint}"
+                )
+                shutil.rmtree(os.path.join(index_path, fingerprint), ignore_errors=True)
+
+    def path_for(self, kind, request):
+        key = content_hash({"kind": kind, "index": self.index, "request": request})
+        return os.path.join(self.index_path(), self.fingerprint(), f"{key}.json")
+
+    def fetch(self, kind, request, fetcher):
+        """
+        Return the cached payload for the given kind of request (e.g.
+        "rank_eval") if one exists for the current index state. Otherwise
+        call fetcher() and cache what it returns.
+        """
+        if not self.enabled:
+            return fetcher()
+
+        payload = self.lookup(kind, request)
+        if payload is None:
+            payload = fetcher()
+            self.store(kind, request, payload)
+        return payload
+
+    def lookup(self, kind, request):
+        """The cached payload for request, or None (e.g. to batch misses)"""
+        path = self.path_for(kind, request)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(path) as f:
+            return json.load(f)
+
+    def store(self, kind, request, payload):
+        path = self.path_for(kind, request)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(canonical_json(payload))
+        os.replace(tmp_path, path)
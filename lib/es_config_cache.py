@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+
+from lib import shell
+from nypl_py_utils.functions.log_helper import create_log
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    # Optional: Without it, resolved configs are only cached in memory
+    Fernet = None
+
+logger = create_log("es_config_cache")
+
+# Resolved es configs (which include credentials), by fingerprint, for the
+# life of the process:
+_configs = {}
+_lock = threading.Lock()
+
+
+def disk_cipher():
+    """
+    The Fernet cipher for the on-disk cache (keyed by SRT_ES_CONFIG_CACHE_KEY,
+    e.g. from Fernet.generate_key()), or None if there's no key or the
+    cryptography package isn't installed. Configs are never written to disk
+    unencrypted.
+    """
+    key = os.environ.get("SRT_ES_CONFIG_CACHE_KEY")
+    if Fernet is None or not key:
+        return None
+    return Fernet(key)
+
+
+def read_file(base_dir, path, commit_id=None):
+    """
+    The content of path in the checkout at base_dir, or (given commit_id) in
+    that commit of its repo, without trailing whitespace (as git output is
+    captured; see lib.shell). Returns b"" for files that don't exist.
+    """
+    if commit_id is None:
+        full_path = os.path.join(base_dir, path)
+        if not os.path.isfile(full_path):
+            return b""
+        with open(full_path, "rb") as f:
+            content = f.read().decode("utf-8", errors="replace")
+    else:
+        result = git(base_dir, "show", f"{commit_id}:{path}")
+        if result.returncode != 0:
+            return b""
+        content = result.stdout
+    return content.rstrip().encode("utf-8")
+
+
+def git(base_dir, *args):
+    # Not logging its output, which may include credentials:
+    return shell.run(
+        "git",
+        "-C",
+        base_dir,
+        *args,
+        check=False,
+        timeout=shell.DEFAULT_TIMEOUTS["git"],
+        log_level=None,
+    )
+
+
+def fingerprint(app_config, base_dir, commit_id=None):
+    """
+    Hash identifying the es config of the checkout at base_dir (or of
+    commit_id of its repo): the app's config.yaml es_config_files there, its
+    get-config scripts, and ENV. Returns None (i.e. don't cache) if the app
+    doesn't declare es_config_files or the checkout (or commit) isn't there.
+    """
+    paths = app_config.config().get("es_config_files")
+    if not paths or not os.path.isdir(base_dir):
+        return None
+    if commit_id is not None:
+        result = git(base_dir, "cat-file", "-e", f"{commit_id}^{{commit}}")
+        if result.returncode != 0:
+            return None
+
+    digest = hashlib.sha256()
+    digest.update(app_config.app_name.encode("utf-8"))
+    digest.update(os.environ.get("ENV", "").encode("utf-8"))
+    scripts_dir = app_config.local_config_path()
+    for script in sorted(os.listdir(scripts_dir)):
+        if script.startswith("get-config"):
+            digest.update(read_file(scripts_dir, script))
+    for path in sorted(paths):
+        content = read_file(base_dir, path, commit_id)
+        digest.update(f"{path}:{len(content)}:".encode("utf-8"))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def disk_path(app_config, key):
+    return os.path.join(app_config.local_temp_path("es-config-cache"), f"{key}.enc")
+
+
+def get(app_config, key):
+    """The cached config for fingerprint key, or None"""
+    if key is None:
+        return None
+    with _lock:
+        if key in _configs:
+            return dict(_configs[key])
+
+    cipher = disk_cipher()
+    path = disk_path(app_config, key)
+    if cipher is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            config = json.loads(cipher.decrypt(f.read()))
+    except InvalidToken:
+        # E.g. the key was rotated:
+        logger.warning(f"Discarding undecryptable es config cache entry {path}")
+        os.remove(path)
+        return None
+    with _lock:
+        _configs[key] = config
+    return dict(config)
+
+
+def put(app_config, key, config):
+    if key is None:
+        return
+    with _lock:
+        _configs[key] = dict(config)
+
+    cipher = disk_cipher()
+    if cipher is None:
+        return
+    path = disk_path(app_config, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(cipher.encrypt(json.dumps(config).encode("utf-8")))
+    os.replace(tmp_path, path)
@@ -0,0 +1,80 @@
+def ms(nanos):
+    return round((nanos or 0) / 1000000, 2)
+
+
+def query_nodes(nodes, depth=0):
+    """Flatten a profiled query tree into (node, depth, self_nanos) tuples"""
+    for node in nodes:
+        children = node.get("children", [])
+        child_nanos = sum([child.get("time_in_nanos", 0) for child in children])
+        yield node, depth, max(node.get("time_in_nanos", 0) - child_nanos, 0)
+        yield from query_nodes(children, depth + 1)
+
+
+def condense_profile(response, top=10, description_length=300):
+    """
+    Condense the `profile` of a search response (run with profile: true) into
+    per-shard timings and the most expensive query clauses across shards.
+
+    Clauses are identified by type and description (the Lucene query), and
+    ranked by self time (i.e. excluding time spent in child clauses) summed
+    over shards.
+    """
+    profile = response.get("profile") or {}
+
+    shards = []
+    clauses = {}
+    for shard in profile.get("shards", []):
+        query_nanos = 0
+        rewrite_nanos = 0
+        collector_nanos = 0
+        for search in shard.get("searches", []):
+            query_nanos += sum([q.get("time_in_nanos", 0) for q in search["query"]])
+            rewrite_nanos += search.get("rewrite_time", 0)
+            collector_nanos += sum(
+                [c.get("time_in_nanos", 0) for c in search.get("collector", [])]
+            )
+
+            for node, depth, self_nanos in query_nodes(search["query"]):
+                key = (node["type"], node["description"])
+                clause = clauses.setdefault(
+                    key,
+                    {
+                        "type": node["type"],
+                        "description": node["description"][0:description_length],
+                        "depth": depth,
+                        "time_nanos": 0,
+                        "self_nanos": 0,
+                        "shards": 0,
+                    },
+                )
+                clause["time_nanos"] += node.get("time_in_nanos", 0)
+                clause["self_nanos"] += self_nanos
+                clause["shards"] += 1
+
+        shards.append(
+            {
+                "id": shard.get("id"),
+                "query_ms": ms(query_nanos),
+                "rewrite_ms": ms(rewrite_nanos),
+                "collector_ms": ms(collector_nanos),
+                "fetch_ms": ms((shard.get("fetch") or {}).get("time_in_nanos")),
+            }
+        )
+
+    ranked = sorted(clauses.values(), key=lambda c: -c["self_nanos"])[0:top]
+    return {
+        "took_ms": response.get("took"),
+        "shards": sorted(shards, key=lambda s: -s["query_ms"]),
+        "clauses": [
+            {
+                "type": clause["type"],
+                "description": clause["description"],
+                "depth": clause["depth"],
+                "time_ms": ms(clause["time_nanos"]),
+                "self_ms": ms(clause["self_nanos"]),
+                "shards": clause["shards"],
+            }
+            for clause in ranked
+        ],
+    }
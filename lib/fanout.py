@@ -0,0 +1,311 @@
+import boto3
+import json
+import os
+
+from collections import deque
+from datetime import datetime, timedelta
+
+from lib.filestore import JsonStore, upload_dir
+from lib.history import upload_history
+from lib.models.app_config import AppConfig
+from lib.models.report import Report
+from lib.models.run import Run
+from lib.sharding import merge_manifests, shard_file_key
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("fanout")
+
+WORKER_COMMANDS = ["test-shard", "merge-shards"]
+
+# A worker with fewer than this many seconds left after finishing a target
+# hands its remaining targets to a fresh invocation rather than risk timing
+# out (async invocations are only retried twice):
+TIME_BUDGET = 120
+
+# Seconds after which a merge's claim is presumed abandoned (Lambda's maximum
+# timeout), so that another merge may take it over:
+MERGE_LEASE_SECONDS = 900
+
+
+class OutOfTimeException(Exception):
+    pass
+
+
+class LocalQueue:
+    """
+    In-process stand-in for async Lambda invocation: events are handled in
+    the order sent and, like Lambda, failed events are retried (up to
+    max_attempts in total)
+    """
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+        self.events = deque()
+
+    def send(self, event):
+        self.events.append((event, 1))
+
+    def drain(self, handler):
+        while len(self.events) > 0:
+            event, attempt = self.events.popleft()
+            try:
+                handler(event)
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    raise
+                logger.warning(
+                    f"Retrying {event['command']} (attempt {attempt + 1}) after: {e}"
+                )
+                self.events.append((event, attempt + 1))
+
+
+class LambdaQueue:
+    """Sends events as async invocations of a Lambda (by default, this one)"""
+
+    def __init__(self, function_name=None):
+        self.function_name = function_name or os.environ.get(
+            "SRT_WORKER_FUNCTION", os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+        )
+        self.client = boto3.client("lambda")
+
+    def send(self, event):
+        logger.info(f"Invoking {self.function_name} with {event}")
+        self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType="Event",
+            Payload=json.dumps(event).encode("utf-8"),
+        )
+
+
+class FanoutStore(JsonStore):
+    """
+    State of one fan-out, shared by all worker invocations:
+
+        srt/APP/fanout/FANOUT_ID/plan.json
+        srt/APP/fanout/FANOUT_ID/checkpoints/FILE_KEY.json
+        srt/APP/fanout/FANOUT_ID/shards/FILE_KEY.json
+        srt/APP/fanout/FANOUT_ID/merging.json
+        srt/APP/fanout/FANOUT_ID/merged.json
+
+    ... where FILE_KEY identifies a commit and shard of targets.
+    """
+
+    def __init__(self, app_config, fanout_id):
+        super().__init__(
+            app_config.local_temp_path(os.path.join("fanout", fanout_id)),
+            f"srt/{app_config.app_name}/fanout/{fanout_id}",
+        )
+
+
+def work_items(plan):
+    """The (commit, shard index) pairs a plan fans out to"""
+    return [
+        (commit, index)
+        for commit in plan["commits"]
+        for index in range(1, plan["shards"] + 1)
+    ]
+
+
+def shard_event(plan, commit, index):
+    return {
+        "command": "test-shard",
+        "app": plan["app"],
+        "fanout_id": plan["fanout_id"],
+        "commit_id": commit["commit"],
+        "description": commit["description"],
+        "shard": index,
+        "shards": plan["shards"],
+    }
+
+
+def start_fanout(app, queue, **kwargs):
+    """
+    Plan a test-all run as one worker event per commit and shard of targets,
+    and send them to queue. Given the fanout_id of an existing fan-out,
+    re-sends only the work that hasn't completed.
+
+    Returns the fanout_id.
+    """
+    app_config = AppConfig.for_name(app)
+    fanout_id = kwargs.get("fanout_id") or datetime.now().strftime("%Y%m%dT%H%M%S")
+    store = FanoutStore(app_config, fanout_id)
+
+    plan = store.read("plan.json")
+    if plan is None:
+        plan = {
+            "app": app,
+            "fanout_id": fanout_id,
+            "commits": app_config.official_commits(),
+            "shards": kwargs.get("shards")
+            or app_config.config().get("fanout_shards", 1),
+            "rows": kwargs.get("rows"),
+            "rebuild": kwargs.get("rebuild", False),
+            "use_es_cache": kwargs.get("use_es_cache", True),
+            "created": datetime.now().isoformat(),
+        }
+        store.write("plan.json", json.dumps(plan, indent=2))
+
+    done = store.list("shards")
+    pending = [
+        (commit, index)
+        for commit, index in work_items(plan)
+        if shard_file_key(commit["commit"], index, plan["shards"]) not in done
+    ]
+    logger.info(
+        f"Fan-out {fanout_id}: {len(pending)} of {len(work_items(plan))} shards to run"
+    )
+
+    for commit, index in pending:
+        queue.send(shard_event(plan, commit, index))
+    if len(pending) == 0:
+        queue.send({"command": "merge-shards", "app": app, "fanout_id": fanout_id})
+
+    return fanout_id
+
+
+def handle_event(event, queue, remaining_seconds=None):
+    """
+    Handle a worker event. remaining_seconds, if given, is a callable
+    returning the seconds left before the invocation times out.
+    """
+    if event["command"] == "test-shard":
+        return run_shard(event, queue, remaining_seconds)
+    if event["command"] == "merge-shards":
+        return merge_shards(event)
+    raise ValueError(f"Unknown fan-out command: {event['command']}")
+
+
+def run_shard(event, queue, remaining_seconds=None):
+    """
+    Run one shard of targets for one commit, checkpointing the partial run
+    after every target. When retried (or continued), resumes from the last
+    checkpoint.
+    """
+    app_config = AppConfig.for_name(event["app"])
+    store = FanoutStore(app_config, event["fanout_id"])
+    plan = store.read("plan.json")
+
+    file_key = shard_file_key(event["commit_id"], event["shard"], event["shards"])
+    if store.read(f"shards/{file_key}.json") is not None:
+        logger.info(f"Shard {file_key} already complete")
+        return
+
+    app_config.load_targets(
+        rows=plan.get("rows"), shard=(event["shard"], event["shards"])
+    )
+
+    checkpoint = store.read(f"checkpoints/{file_key}.json")
+    previous_run = None
+    if checkpoint is not None:
+        previous_run = Run.from_json(app_config, checkpoint)
+        logger.info(
+            f"Resuming {file_key} from checkpoint with {len(previous_run.responses)}"
+            f" of {len(app_config.targets)} targets"
+        )
+
+    def save_checkpoint(run):
+        store.write(f"checkpoints/{file_key}.json", run.serialize())
+        if remaining_seconds is not None and remaining_seconds() < TIME_BUDGET:
+            raise OutOfTimeException(f"{remaining_seconds()}s remaining")
+
+    run = Run(
+        app_config=app_config,
+        commit_id=event["commit_id"],
+        commit_description=event["description"],
+        file_key=file_key,
+    )
+    try:
+        run.collect_data(
+            rebuild=plan["rebuild"] and previous_run is None,
+            use_es_cache=plan["use_es_cache"],
+            previous_run=previous_run,
+            checkpoint=save_checkpoint,
+        )
+    except OutOfTimeException as e:
+        logger.info(f"Continuing {file_key} in a new invocation ({e})")
+        queue.send(event)
+        return
+
+    store.write(f"shards/{file_key}.json", run.serialize())
+
+    done = store.list("shards")
+    expected = [
+        shard_file_key(commit["commit"], index, plan["shards"])
+        for commit, index in work_items(plan)
+    ]
+    if all(key in done for key in expected):
+        queue.send(
+            {
+                "command": "merge-shards",
+                "app": plan["app"],
+                "fanout_id": plan["fanout_id"],
+            }
+        )
+
+
+def merge_shards(event):
+    """
+    Assemble each commit's shard manifests into its manifest, then upload
+    manifests and rebuild the report
+    """
+    app_config = AppConfig.for_name(event["app"])
+    store = FanoutStore(app_config, event["fanout_id"])
+    plan = store.read("plan.json")
+
+    if store.read("merged.json") is not None:
+        logger.info(f"Fan-out {event['fanout_id']} already merged")
+        return
+
+    done = store.list("shards")
+    missing = [
+        shard_file_key(commit["commit"], index, plan["shards"])
+        for commit, index in work_items(plan)
+        if shard_file_key(commit["commit"], index, plan["shards"]) not in done
+    ]
+    if len(missing) > 0:
+        logger.info(f"Not merging; Waiting on shards: {', '.join(missing)}")
+        return
+
+    # Shards finishing together may each trigger a merge; Only one proceeds:
+    claim = json.dumps({"merging": datetime.now().isoformat()})
+    if not store.claim("merging.json", claim, expired=merge_lease_expired):
+        logger.info(f"Fan-out {event['fanout_id']} is already being merged")
+        return
+    try:
+        publish_merged_shards(app_config, plan, store)
+    except BaseException:
+        # Let a retry of this event claim it again:
+        store.release("merging.json")
+        raise
+
+    store.write("merged.json", json.dumps({"merged": datetime.now().isoformat()}))
+    logger.info(f"Merged fan-out {event['fanout_id']}")
+
+
+def merge_lease_expired(claim):
+    started = datetime.fromisoformat(claim["merging"])
+    return datetime.now() - started > timedelta(seconds=MERGE_LEASE_SECONDS)
+
+
+def publish_merged_shards(app_config, plan, store):
+    targets = app_config.load_targets(rows=plan.get("rows"))
+    for commit in plan["commits"]:
+        manifests = [
+            store.read(
+                f"shards/{shard_file_key(commit['commit'], index, plan['shards'])}.json"
+            )
+            for index in range(1, plan["shards"] + 1)
+        ]
+        run = Run.from_json(app_config, merge_manifests(manifests, targets))
+        run.save_manifest()
+
+    upload_dir(
+        app_config.local_temp_path("manifests"),
+        f"srt/{app_config.app_name}/manifests",
+        exclude=["local.json", "latest.json"],
+    )
+    upload_history(app_config)
+
+    report = Report(app=app_config.app_name)
+    report.load_runs_from_manifests()
+    report.build(rebuild_graphs=True)
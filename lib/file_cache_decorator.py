@@ -1,4 +1,6 @@
+import os
 import pickle
+import threading
 from functools import wraps
 
 
@@ -15,12 +17,15 @@ def init_cache(func):
 
 
 def persist_cache(func):
-    with open(cache_path(func), "wb") as f:
+    tmp_path = f"{cache_path(func)}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
         pickle.dump(func.cache, f)
+    os.replace(tmp_path, cache_path(func))
 
 
 def file_cached(func):
     init_cache(func)
+    lock = threading.Lock()
 
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -34,8 +39,10 @@ def file_cached(func):
             val = func.cache[key]
             return val
         except KeyError:
-            func.cache[key] = result = func(*args)
-            persist_cache(func)
+            result = func(*args)
+            with lock:
+                func.cache[key] = result
+                persist_cache(func)
             return result
 
     return wrapper
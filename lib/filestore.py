@@ -1,34 +1,161 @@
 import botocore
 import boto3
+import gzip
 import io
+import json
 import os
 import mimetypes
 
+from lib.tracing import traced
+from lib.utils import offline_mode
 from nypl_py_utils.functions.log_helper import create_log
 
-
 logger = create_log("S3")
 
-
+# Content types gzipped before upload (and served with Content-Encoding: gzip):
+COMPRESSIBLE_TYPES = [
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+    "text/css",
+    "text/csv",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+]
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Assets are named by a hash of their content, so never change:
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def content_type(path):
+    file_mime_type, _ = mimetypes.guess_type(path)
+    return file_mime_type
+
+
+def cache_control(relative_path):
+    """The Cache-Control to serve an uploaded file with, if any"""
+    if relative_path.startswith("assets/"):
+        return IMMUTABLE_CACHE_CONTROL
+    if relative_path.endswith(".html"):
+        # Reports are rebuilt in place, so must always be revalidated:
+        return "no-cache"
+    return None
+
+
+def upload_args(path, data, acl, cache_control=None):
+    """
+    put_object args for data (bytes) stored at path, gzipping text content
+    """
+    file_mime_type = content_type(path) or "application/octet-stream"
+    args = {"Body": data, "ACL": acl, "ContentType": file_mime_type}
+    if file_mime_type in COMPRESSIBLE_TYPES:
+        args["Body"] = gzip.compress(data, mtime=0)
+        args["ContentEncoding"] = "gzip"
+        if file_mime_type.startswith("text/") or file_mime_type in [
+            "application/javascript",
+            "application/json",
+        ]:
+            args["ContentType"] = f"{file_mime_type}; charset=utf-8"
+    if cache_control is not None:
+        args["CacheControl"] = cache_control
+    return args
+
+
+def gunzip_in_place(path):
+    """Decompress path if it's gzipped (i.e. downloaded as stored)"""
+    with open(path, "rb") as f:
+        if f.read(2) != GZIP_MAGIC:
+            return
+        f.seek(0)
+        data = gzip.decompress(f.read())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+@traced("s3_upload")
 def write_to_s3(key, data, public=False):
+    if offline_mode():
+        logger.info(f"Offline: Not writing {key}")
+        return
     bucket = S3BucketWrapper("research-catalog-stats")
     acl = "public-read" if public else "private"
     bucket.put(key, data, acl=acl)
 
 
+@traced("s3_upload")
+def create_in_s3(key, data):
+    """
+    Write data (bytes) to key only if no object exists there yet. Returns
+    whether this call created it.
+    """
+    bucket = S3BucketWrapper("research-catalog-stats")
+    return bucket.put_if_absent(key, data, acl="private")
+
+
+@traced("s3_upload")
+def replace_in_s3(key, data, etag):
+    """
+    Write data (bytes) to key only if the object there is still the version
+    with etag. Returns whether this call replaced it.
+    """
+    bucket = S3BucketWrapper("research-catalog-stats")
+    return bucket.put_if_match(key, data, etag, acl="private")
+
+
+@traced("s3_download")
+def get_versioned_from_s3(key):
+    """The object at key's data (bytes) and ETag, or (None, None) if none"""
+    bucket = S3BucketWrapper("research-catalog-stats")
+    return bucket.get_with_etag(key)
+
+
+@traced("s3_download")
+def list_s3_keys(prefix):
+    """Keys of the objects under prefix, without fetching them"""
+    bucket = S3BucketWrapper("research-catalog-stats")
+    return bucket.list_keys(prefix)
+
+
+def delete_from_s3(key):
+    if offline_mode():
+        logger.info(f"Offline: Not deleting {key}")
+        return
+    S3BucketWrapper("research-catalog-stats").client.delete_object(
+        Bucket="research-catalog-stats", Key=key
+    )
+
+
+@traced("s3_download")
 def get_from_s3(remote_path, local_path):
+    if offline_mode():
+        logger.info(f"Offline: Not fetching {remote_path}")
+        return
     bucket = S3BucketWrapper("research-catalog-stats")
     bucket.get(remote_path, local_path)
 
 
+@traced("s3_upload")
 def upload_dir(source_path, prefix, public=False, exclude=[]):
+    if offline_mode():
+        logger.info(f"Offline: Not uploading {source_path} to {prefix}")
+        return
     logger.info(f"Uploading {source_path} to {prefix}")
     bucket = S3BucketWrapper("research-catalog-stats")
     acl = "public-read" if public else "private"
     bucket.upload_dir_s3(source_path, prefix, acl=acl, exclude=exclude)
 
 
+@traced("s3_download")
 def download_dir(prefix, local_path):
+    if offline_mode():
+        logger.info(f"Offline: Not downloading {prefix}; Using {local_path}")
+        os.makedirs(local_path, exist_ok=True)
+        return
     logger.info(f"Downloading {prefix} to {local_path}")
     bucket = S3BucketWrapper("research-catalog-stats")
     bucket.download_dir(prefix, local_path)
@@ -52,12 +179,16 @@ class S3BucketWrapper:
         data = io.BytesIO()
         s3_object.download_fileobj(data)
 
+        body = data.getvalue()
+        if body[0:2] == GZIP_MAGIC:
+            body = gzip.decompress(body)
         with open(local_path, "wb") as f:
-            f.write(data.getbuffer())
+            f.write(body)
 
     def put(self, key, data, acl="public-read"):
         """
-        Upload data to the object.
+        Upload data to the object, with a content type based on key's
+        extension, gzipping text content.
 
         :param data: The data to upload. This can either be bytes or a string. When this
                      argument is a string, it is interpreted as a file name, which is
@@ -69,22 +200,86 @@ class S3BucketWrapper:
         put_data = data
         if isinstance(data, str):
             try:
-                put_data = open(data, "rb")
+                with open(data, "rb") as f:
+                    put_data = f.read()
             except IOError:
                 logger.error(f"Expected file name or binary data, got '{data}'.")
                 raise
 
         try:
-            s3_object.put(Body=put_data, ACL=acl, ContentType="text/html")
+            s3_object.put(**upload_args(key, put_data, acl))
             s3_object.wait_until_exists()
         except botocore.exceptions.ClientError:
             logger.error(
                 f"Couldn't put object '{s3_object.key} to bucket {s3_object.bucket_name}"
             )
             raise
-        finally:
-            if getattr(put_data, "close", None):
-                put_data.close()
+
+    def put_if_absent(self, key, data, acl="public-read"):
+        """
+        Upload data to the object with a conditional write (If-None-Match),
+        so that of concurrent callers exactly one succeeds. Returns whether
+        this call created the object.
+        """
+        try:
+            self.client.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                IfNoneMatch="*",
+                **upload_args(key, data, acl),
+            )
+        except botocore.exceptions.ClientError as e:
+            # 412 if the object exists; 409 if a concurrent write won:
+            if e.response.get("Error", {}).get("Code") in [
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ]:
+                return False
+            raise
+        return True
+
+    def put_if_match(self, key, data, etag, acl="public-read"):
+        """
+        Upload data to the object with a conditional write (If-Match), so
+        that it only replaces the version with etag. Returns whether it did.
+        """
+        try:
+            self.client.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                IfMatch=etag,
+                **upload_args(key, data, acl),
+            )
+        except botocore.exceptions.ClientError as e:
+            # 412 if the object changed; 409 if a concurrent write won; 404
+            # if it was deleted:
+            if e.response.get("Error", {}).get("Code") in [
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+                "NoSuchKey",
+            ]:
+                return False
+            raise
+        return True
+
+    def get_with_etag(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "NoSuchKey":
+                return None, None
+            raise
+        body = response["Body"].read()
+        if body[0:2] == GZIP_MAGIC:
+            body = gzip.decompress(body)
+        return body, response["ETag"]
+
+    def list_keys(self, prefix):
+        paginator = self.client.get_paginator("list_objects")
+        keys = []
+        for result in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            keys += [file.get("Key") for file in result.get("Contents") or []]
+        return keys
 
     def download_dir(self, prefix, local_path, start_prefix=None):
         if start_prefix is None:
@@ -109,6 +304,7 @@ class S3BucketWrapper:
                     self.resource.meta.client.download_file(
                         self.bucket_name, s3_path, full_local_path
                     )
+                    gunzip_in_place(full_local_path)
 
     def upload_dir_s3(self, source_dir, dst_prefix="", acl="private", exclude=[]):
         # enumerate local files recursively
@@ -122,15 +318,26 @@ class S3BucketWrapper:
                 relative_path = os.path.relpath(local_path, source_dir)
                 s3_path = os.path.join(dst_prefix, relative_path)
 
-                file_mime_type, _ = mimetypes.guess_type(local_path)
+                file_mime_type = content_type(local_path)
                 try:
                     extra = {"ACL": acl, "ContentType": file_mime_type}
+                    caching = cache_control(relative_path)
+                    if caching is not None:
+                        extra["CacheControl"] = caching
                     if file_mime_type is None:
                         logger.warn(
                             f"Skipping uploading {local_path} because unrecognized content-type"
                         )
                     elif filename in exclude:
                         logger.debug(f"  Skipping uploading {filename}")
+                    elif file_mime_type in COMPRESSIBLE_TYPES:
+                        with open(local_path, "rb") as f:
+                            data = f.read()
+                        self.client.put_object(
+                            Bucket=self.bucket_name,
+                            Key=s3_path,
+                            **upload_args(local_path, data, acl, caching),
+                        )
                     else:
                         self.client.upload_file(
                             local_path, self.bucket_name, s3_path, ExtraArgs=extra
@@ -168,3 +375,93 @@ class S3BucketWrapper:
                     exists = os.path.isfile(full_local_path)
                     if not exists:
                         self.client.delete_object(Bucket=self.bucket_name, Key=s3_path)
+
+
+class JsonStore:
+    """
+    JSON documents kept locally (in local_path) and, unless offline, in S3
+    (under prefix), so that separate invocations share them
+    """
+
+    def __init__(self, local_path, prefix):
+        self.local_path = local_path
+        self.prefix = prefix
+
+    def write(self, path, data):
+        local_path = os.path.join(self.local_path, path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        tmp_path = f"{local_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, local_path)
+        write_to_s3(f"{self.prefix}/{path}", local_path)
+
+    def claim(self, path, data, expired=None):
+        """
+        Write path only if it doesn't exist yet (in S3, or locally when
+        offline), so that of concurrent callers exactly one claims it. If
+        expired is given, a claim (parsed) for which it returns True is taken
+        over instead, by exactly one caller. Returns whether this call
+        claimed it.
+        """
+        local_path = os.path.join(self.local_path, path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        if offline_mode():
+            try:
+                fd = os.open(local_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            except FileExistsError:
+                if expired is None or not expired(self.read(path)):
+                    return False
+                self.write(path, data)
+                return True
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            return True
+
+        key = f"{self.prefix}/{path}"
+        if not create_in_s3(key, data.encode("utf-8")):
+            if expired is None:
+                return False
+            current, etag = get_versioned_from_s3(key)
+            if current is None:
+                # Released since; Claim it afresh:
+                return self.claim(path, data, expired)
+            if not expired(json.loads(current)):
+                return False
+            if not replace_in_s3(key, data.encode("utf-8"), etag):
+                return False
+        with open(local_path, "w") as f:
+            f.write(data)
+        return True
+
+    def release(self, path):
+        local_path = os.path.join(self.local_path, path)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+        delete_from_s3(f"{self.prefix}/{path}")
+
+    def read(self, path):
+        local_path = os.path.join(self.local_path, path)
+        if not offline_mode():
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            try:
+                get_from_s3(f"{self.prefix}/{path}", local_path)
+            except botocore.exceptions.ClientError:
+                pass
+        if not os.path.exists(local_path):
+            return None
+        with open(local_path) as f:
+            return json.load(f)
+
+    def list(self, folder):
+        """File keys of the JSON documents in folder"""
+        if offline_mode():
+            local_path = os.path.join(self.local_path, folder)
+            os.makedirs(local_path, exist_ok=True)
+            names = os.listdir(local_path)
+        else:
+            prefix = f"{self.prefix}/{folder}/"
+            names = [key[len(prefix) :] for key in list_s3_keys(prefix)]
+        return sorted(
+            [name[0:-5] for name in names if name.endswith(".json") and "/" not in name]
+        )
@@ -1,11 +1,20 @@
+import hashlib
+import io
 import os
+import threading
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
+from PIL import Image
+from lib.tracing import traced
 from nypl_py_utils.functions.log_helper import create_log
 
 logger = create_log("S3")
 
+# pyplot isn't thread-safe:
+_pyplot_lock = threading.Lock()
 
+
+@traced()
 def create_graph(labels, scores, elapsed, key, **kwargs):
     """
     Create a graph for given labels, scores, and elapsed values
@@ -19,6 +28,11 @@ def create_graph(labels, scores, elapsed, key, **kwargs):
     elapsed: number[]
         Array of elapsed scores from 0 to 1 (assumed converted to floats from 0-1)
     """
+    with _pyplot_lock:
+        draw_graphs(labels, scores, elapsed, key, **kwargs)
+
+
+def draw_graphs(labels, scores, elapsed, key, **kwargs):
     global red, blue
 
     # Primary graph:
@@ -71,3 +85,43 @@ def create_graph(labels, scores, elapsed, key, **kwargs):
 
         fig.savefig(path)
         plt.close(fig)
+
+
+def graph_view(basedir, key):
+    """
+    The src (versioned by a hash of the graph's content, so that browsers
+    keep unchanged graphs cached) and dimensions of a graph
+    """
+    path = f"{basedir}/graphs/{key}.png"
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[0:12]
+    with Image.open(path) as image:
+        width, height = image.size
+    return {"src": f"./graphs/{key}.png?v={digest}", "width": width, "height": height}
+
+
+@traced()
+def create_thumbnail_sprite(basedir, keys):
+    """
+    Stack the thumbnails of the given graph keys into one PNG, so that the
+    left nav loads a single image. Returns the PNG's bytes and each key's
+    offset and size within it.
+    """
+    thumbs = []
+    for key in keys:
+        with Image.open(f"{basedir}/graphs/{key}-thumb.png") as image:
+            thumbs.append((key, image.convert("RGBA")))
+
+    width = max([image.width for _, image in thumbs], default=1)
+    height = max(sum([image.height for _, image in thumbs]), 1)
+    sprite = Image.new("RGBA", (width, height), (255, 255, 255, 0))
+    offsets = {}
+    y = 0
+    for key, image in thumbs:
+        sprite.paste(image, (0, y))
+        offsets[key] = {"y": y, "width": image.width, "height": image.height}
+        y += image.height
+
+    out = io.BytesIO()
+    sprite.save(out, format="PNG", optimize=True)
+    return out.getvalue(), offsets
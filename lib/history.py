@@ -0,0 +1,232 @@
+import botocore
+import json
+import os
+import sqlite3
+
+from statistics import median
+
+from lib.filestore import get_from_s3, write_to_s3
+from lib.utils import offline_mode
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("history")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    file_key TEXT PRIMARY KEY,
+    commit_id TEXT NOT NULL,
+    commit_description TEXT,
+    commit_date TEXT,
+    run_date TEXT,
+    load_test TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    file_key TEXT NOT NULL REFERENCES runs (file_key),
+    target_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    metric_score REAL,
+    found INTEGER,
+    relevant INTEGER,
+    total_hits INTEGER,
+    elapsed INTEGER,
+    latency_median REAL,
+    latency_min REAL,
+    latency_max REAL,
+    latency_samples INTEGER,
+    PRIMARY KEY (file_key, target_key)
+);
+CREATE INDEX IF NOT EXISTS results_by_target ON results (target_key, file_key);
+CREATE INDEX IF NOT EXISTS runs_by_commit_date ON runs (commit_date);
+"""
+
+RESULT_COLUMNS = [
+    "file_key",
+    "target_key",
+    "position",
+    "metric_score",
+    "found",
+    "relevant",
+    "total_hits",
+    "elapsed",
+    "latency_median",
+    "latency_min",
+    "latency_max",
+    "latency_samples",
+]
+
+
+class History:
+    """
+    One row per run and per (run, target) with the scores, hit counts, and
+    latency stats of each, kept in a SQLite file alongside the manifests:
+
+        /tmp/srt/APP/history.sqlite (local)
+        srt/APP/history.sqlite (S3)
+
+    Manifests remain the source of truth; the history can be rebuilt from
+    them with upsert_run.
+    """
+
+    def __init__(self, app_config, path=None):
+        self.app_config = app_config
+        self.path = path or app_config.local_temp_path("history.sqlite")
+        self.s3_key = f"srt/{app_config.app_name}/history.sqlite"
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def upsert_run(self, run):
+        """Replace the run's rows (by file_key) with its current responses"""
+        rows = []
+        for position, response in enumerate(run.responses):
+            samples = response.latency_samples()
+            rows.append(
+                (
+                    run.file_key,
+                    response.target.key,
+                    position,
+                    response.metric_score,
+                    response.found,
+                    response.target.relevant_length(),
+                    response.count,
+                    response.elapsed,
+                    median(samples),
+                    min(samples),
+                    max(samples),
+                    len(samples),
+                )
+            )
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    run.file_key,
+                    run.commit_id,
+                    run.commit_description,
+                    run.commit_date.isoformat() if run.commit_date else None,
+                    run.run_date,
+                    json.dumps(run.load_test) if run.load_test else None,
+                ),
+            )
+            self.connection.execute(
+                "DELETE FROM results WHERE file_key = ?", (run.file_key,)
+            )
+            self.connection.executemany(
+                f"INSERT INTO results VALUES ({', '.join(['?'] * len(RESULT_COLUMNS))})",
+                rows,
+            )
+
+    def file_keys(self):
+        return [
+            row["file_key"]
+            for row in self.connection.execute("SELECT file_key FROM runs")
+        ]
+
+    def runs(self, file_keys):
+        """Rows of the given runs, in commit date order"""
+        placeholders = ", ".join(["?"] * len(file_keys))
+        return [
+            dict(row)
+            for row in self.connection.execute(
+                f"SELECT * FROM runs WHERE file_key IN ({placeholders})"
+                " ORDER BY commit_date, file_key",
+                list(file_keys),
+            )
+        ]
+
+    def results(self, file_keys):
+        """Result rows of the given runs, by file_key, in target order"""
+        placeholders = ", ".join(["?"] * len(file_keys))
+        results = {file_key: [] for file_key in file_keys}
+        for row in self.connection.execute(
+            f"SELECT * FROM results WHERE file_key IN ({placeholders})"
+            " ORDER BY file_key, position",
+            list(file_keys),
+        ):
+            results[row["file_key"]].append(dict(row))
+        return results
+
+    def target_history(self, target_key):
+        """A target's results across all runs, in commit date order"""
+        return [
+            dict(row)
+            for row in self.connection.execute(
+                "SELECT runs.commit_id, runs.commit_date, runs.commit_description,"
+                " results.* FROM results JOIN runs USING (file_key)"
+                " WHERE target_key = ? ORDER BY runs.commit_date",
+                (target_key,),
+            )
+        ]
+
+    def download(self):
+        """
+        Merge the S3 copy into the local store (keeping the more recently
+        run version of each run)
+        """
+        if offline_mode():
+            return
+        remote_path = f"{self.path}.remote"
+        try:
+            get_from_s3(self.s3_key, remote_path)
+        except botocore.exceptions.ClientError:
+            logger.info(f"No history found at {self.s3_key}")
+            return
+        self.merge_from(remote_path)
+        os.remove(remote_path)
+
+    def merge_from(self, other_path):
+        """Copy runs from the store at other_path that are newer than ours"""
+        with self.connection:
+            self.connection.execute("ATTACH DATABASE ? AS other", (other_path,))
+        try:
+            with self.connection:
+                newer = (
+                    "SELECT o.file_key FROM other.runs o LEFT JOIN main.runs m"
+                    " USING (file_key) WHERE m.file_key IS NULL"
+                    " OR IFNULL(o.run_date, '') > IFNULL(m.run_date, '')"
+                )
+                file_keys = [row[0] for row in self.connection.execute(newer)]
+                for file_key in file_keys:
+                    self.connection.execute(
+                        "DELETE FROM main.results WHERE file_key = ?", (file_key,)
+                    )
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO main.runs"
+                        " SELECT * FROM other.runs WHERE file_key = ?",
+                        (file_key,),
+                    )
+                    self.connection.execute(
+                        "INSERT INTO main.results"
+                        " SELECT * FROM other.results WHERE file_key = ?",
+                        (file_key,),
+                    )
+        finally:
+            self.connection.execute("DETACH DATABASE other")
+        return file_keys
+
+    def upload(self):
+        """Merge in the S3 copy (e.g. runs saved elsewhere), then replace it"""
+        self.download()
+        write_to_s3(self.s3_key, self.path)
+
+
+def save_run(run):
+    """Upsert run into its app's local history"""
+    history = History(run.app_config)
+    try:
+        history.upsert_run(run)
+    finally:
+        history.close()
+
+
+def upload_history(app_config):
+    history = History(app_config)
+    try:
+        history.upload()
+    finally:
+        history.close()
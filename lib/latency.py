@@ -0,0 +1,189 @@
+import math
+
+from statistics import median
+
+# Exact null distributions are enumerated up to this many observations; larger
+# (or tied) samples use the normal approximation:
+EXACT_MAX = 40
+
+
+def ranks(values):
+    """1-based ranks of values, averaging the ranks of ties"""
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranked = [0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranked[order[k]] = (i + j) / 2 + 1
+        i = j + 1
+    return ranked
+
+
+def tie_sizes(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return [t for t in counts.values() if t > 1]
+
+
+def normal_sf(z):
+    """P(Z >= z) for a standard normal Z"""
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def subset_sum_counts(n, k=None):
+    """
+    counts[s] = the number of subsets of ranks 1..n (of size k, if given)
+    summing to s
+    """
+    max_sum = n * (n + 1) // 2
+    if k is None:
+        counts = [1] + [0] * max_sum
+        for rank in range(1, n + 1):
+            for s in range(max_sum, rank - 1, -1):
+                counts[s] += counts[s - rank]
+        return counts
+
+    # by_size[j][s]: subsets of size j summing to s
+    by_size = [[0] * (max_sum + 1) for _ in range(k + 1)]
+    by_size[0][0] = 1
+    for rank in range(1, n + 1):
+        for j in range(min(rank, k), 0, -1):
+            for s in range(max_sum, rank - 1, -1):
+                by_size[j][s] += by_size[j - 1][s - rank]
+    return by_size[k]
+
+
+def mann_whitney_u(baseline, current):
+    """
+    One-sided Mann-Whitney U test of whether current samples tend to be
+    larger than baseline samples. Returns (U, p).
+    """
+    n1, n2 = len(baseline), len(current)
+    if n1 == 0 or n2 == 0:
+        return None, 1.0
+
+    values = list(baseline) + list(current)
+    rank_sum = sum(ranks(values)[n1:])
+    u = rank_sum - n2 * (n2 + 1) / 2
+    n = n1 + n2
+    ties = tie_sizes(values)
+
+    if len(ties) == 0 and n <= EXACT_MAX:
+        counts = subset_sum_counts(n, n2)
+        at_least = sum(counts[math.ceil(rank_sum) :])
+        return u, at_least / sum(counts)
+
+    tie_correction = sum([t**3 - t for t in ties]) / (n * (n - 1))
+    variance = n1 * n2 / 12 * ((n + 1) - tie_correction)
+    if variance <= 0:
+        return u, 1.0
+    # With continuity correction:
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return u, normal_sf(z)
+
+
+def wilcoxon_signed_rank(pairs):
+    """
+    One-sided Wilcoxon signed-rank test of whether the second of each
+    (before, after) pair tends to be larger. Returns (W+, p).
+    """
+    diffs = [after - before for before, after in pairs if after != before]
+    n = len(diffs)
+    if n == 0:
+        return 0, 1.0
+
+    magnitudes = [abs(d) for d in diffs]
+    ranked = ranks(magnitudes)
+    w = sum([r for r, d in zip(ranked, diffs) if d > 0])
+    ties = tie_sizes(magnitudes)
+
+    if len(ties) == 0 and n <= EXACT_MAX:
+        counts = subset_sum_counts(n)
+        return w, sum(counts[math.ceil(w) :]) / 2**n
+
+    variance = n * (n + 1) * (2 * n + 1) / 24 - sum([t**3 - t for t in ties]) / 48
+    if variance <= 0:
+        return w, 1.0
+    z = (w - n * (n + 1) / 4 - 0.5) / math.sqrt(variance)
+    return w, normal_sf(z)
+
+
+def compare_latency(
+    baseline_responses, responses, alpha=0.05, min_ratio=1.2, min_ms=20
+):
+    """
+    Compare latency samples of responses against baseline_responses (matched
+    by target key).
+
+    A target regressed if its samples are significantly slower (one-sided
+    Mann-Whitney U, p < alpha) and its median latency grew by at least
+    min_ratio times and min_ms ms. The run regressed overall if per-target
+    medians are significantly slower (one-sided Wilcoxon signed-rank, paired
+    by target) and their total grew by at least min_ratio times.
+    """
+    baseline_by_key = {r.target.key: r for r in baseline_responses}
+
+    targets = []
+    for response in responses:
+        baseline = baseline_by_key.get(response.target.key)
+        if baseline is None:
+            continue
+        baseline_samples = baseline.latency_samples()
+        samples = response.latency_samples()
+        baseline_ms = median(baseline_samples)
+        current_ms = median(samples)
+        _, p = mann_whitney_u(baseline_samples, samples)
+        ratio = current_ms / baseline_ms if baseline_ms > 0 else None
+        targets.append(
+            {
+                "key": response.target.key,
+                "baseline_ms": baseline_ms,
+                "current_ms": current_ms,
+                "ratio": None if ratio is None else round(ratio, 2),
+                "p": round(p, 4),
+                "regressed": p < alpha
+                and (ratio is None or ratio >= min_ratio)
+                and current_ms - baseline_ms >= min_ms,
+            }
+        )
+
+    baseline_total = sum([t["baseline_ms"] for t in targets])
+    current_total = sum([t["current_ms"] for t in targets])
+    _, p = wilcoxon_signed_rank([(t["baseline_ms"], t["current_ms"]) for t in targets])
+    ratio = current_total / baseline_total if baseline_total > 0 else None
+    overall = {
+        "baseline_ms": baseline_total,
+        "current_ms": current_total,
+        "ratio": None if ratio is None else round(ratio, 2),
+        "p": round(p, 4),
+        "regressed": p < alpha and ratio is not None and ratio >= min_ratio,
+    }
+
+    regressions = [t for t in targets if t["regressed"]]
+    return {
+        "targets": targets,
+        "overall": overall,
+        "regressions": regressions,
+        "regressed": overall["regressed"] or len(regressions) > 0,
+    }
+
+
+def describe_comparison(comparison):
+    def describe(name, entry):
+        return (
+            f"{name}: {format_ms(entry['baseline_ms'])}ms => {format_ms(entry['current_ms'])}ms"
+            f" (x{entry['ratio']}, p={entry['p']})"
+        )
+
+    descriptions = [describe(t["key"], t) for t in comparison["regressions"]]
+    if comparison["overall"]["regressed"]:
+        descriptions.append(describe("Overall", comparison["overall"]))
+    return ", ".join(descriptions)
+
+
+def format_ms(value):
+    return round(value) if value == round(value) else round(value, 1)
@@ -0,0 +1,55 @@
+import threading
+
+from contextlib import contextmanager
+
+from lib.tracing import span
+
+# Process-wide limits shared by concurrently evaluated apps (see
+# lib.scheduler). None means unlimited, which is the default for single-app
+# commands.
+_lock = threading.Lock()
+_initialization_slots = None
+_es_requests_per_cluster = None
+_cluster_slots = {}
+
+
+def configure(initializations=None, es_requests_per_cluster=None):
+    """
+    Limit the number of concurrent app initializations (e.g. initialize.sh,
+    which installs dependencies) and of in-flight ES requests per cluster
+    """
+    global _initialization_slots, _es_requests_per_cluster
+
+    with _lock:
+        _initialization_slots = (
+            threading.BoundedSemaphore(initializations) if initializations else None
+        )
+        _es_requests_per_cluster = es_requests_per_cluster
+        _cluster_slots.clear()
+
+
+@contextmanager
+def initialization_slot():
+    """Wait for (and hold) one of the configured initialization slots"""
+    slots = _initialization_slots
+    if slots is None:
+        yield
+        return
+    with span("wait_for_initialization_slot"):
+        slots.acquire()
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def es_request_slots(cluster):
+    """The semaphore limiting in-flight requests to cluster, or None"""
+    if not _es_requests_per_cluster:
+        return None
+    with _lock:
+        if cluster not in _cluster_slots:
+            _cluster_slots[cluster] = threading.BoundedSemaphore(
+                _es_requests_per_cluster
+            )
+        return _cluster_slots[cluster]
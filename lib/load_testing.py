@@ -0,0 +1,143 @@
+import math
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("load_testing")
+
+
+def percentile(values, p):
+    """The nearest-rank pth percentile of values"""
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def schedule(qps_start, qps_end, duration):
+    """
+    Offsets (in seconds) at which to send requests so that the request rate
+    ramps linearly from qps_start to qps_end over duration seconds
+    """
+    if qps_start < 0 or qps_end < 0 or duration <= 0:
+        raise ValueError("QPS must be >= 0 and duration > 0")
+
+    # Requests sent by time t is N(t) = a*t + k*t^2/2, so the nth request is
+    # sent at the t solving N(t) = n:
+    a = qps_start
+    k = (qps_end - qps_start) / duration
+    offsets = []
+    n = 1
+    while True:
+        if k == 0:
+            if a == 0:
+                break
+            t = n / a
+        else:
+            discriminant = a * a + 2 * k * n
+            if discriminant < 0:
+                break
+            t = (-a + math.sqrt(discriminant)) / k
+        if t > duration:
+            break
+        offsets.append(t)
+        n += 1
+    return offsets
+
+
+def summarize(samples, seconds):
+    """Throughput, error rate, and latency percentiles of (latency ms, ok) samples"""
+    latencies = [latency for latency, ok in samples if ok]
+    errors = len(samples) - len(latencies)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if len(samples) > 0 else 0,
+        "throughput": round(len(latencies) / seconds, 2),
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies) if len(latencies) > 0 else None,
+    }
+
+
+class LoadTest:
+    """
+    Replays (target key, query) pairs, cycling through them in order, with
+    search(query). Requests are sent on a fixed schedule (ramping from
+    qps_start to qps_end over duration seconds) regardless of how quickly
+    earlier requests complete, with at most `concurrency` in flight.
+
+    Latency is measured from each request's scheduled send time, so time
+    spent queued behind a saturated client or cluster counts against it.
+    """
+
+    def __init__(self, search, queries, **kwargs):
+        self.search = search
+        self.queries = queries
+        self.concurrency = kwargs.get("concurrency", 8)
+        self.qps_start = kwargs.get("qps_start", 1)
+        self.qps_end = kwargs.get("qps_end", self.qps_start)
+        self.duration = kwargs.get("duration", 60)
+
+    def params(self):
+        return {
+            "concurrency": self.concurrency,
+            "qps_start": self.qps_start,
+            "qps_end": self.qps_end,
+            "duration": self.duration,
+        }
+
+    def run(self):
+        offsets = schedule(self.qps_start, self.qps_end, self.duration)
+        logger.info(
+            f"Sending {len(offsets)} requests over {self.duration}s"
+            f" ({self.qps_start} => {self.qps_end} QPS, concurrency {self.concurrency})"
+        )
+
+        samples = {key: [] for key, _ in self.queries}
+        error_messages = {}
+        lock = threading.Lock()
+
+        def send(key, query, scheduled):
+            ok = True
+            try:
+                self.search(query)
+            except Exception as e:
+                ok = False
+                with lock:
+                    message = str(e)[0:200]
+                    error_messages[message] = error_messages.get(message, 0) + 1
+            latency = round((time.perf_counter() - scheduled) * 1000, 1)
+            with lock:
+                samples[key].append((latency, ok))
+
+        started = datetime.now().isoformat()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for ind, offset in enumerate(offsets):
+                scheduled = start + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                key, query = self.queries[ind % len(self.queries)]
+                executor.submit(send, key, query, scheduled)
+        seconds = time.perf_counter() - start
+
+        return {
+            "params": self.params(),
+            "started": started,
+            "seconds": round(seconds, 2),
+            "overall": summarize(
+                [sample for key in samples for sample in samples[key]], seconds
+            ),
+            "targets": {
+                key: summarize(key_samples, seconds)
+                for key, key_samples in samples.items()
+            },
+            "error_messages": error_messages,
+        }
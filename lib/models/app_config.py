@@ -1,11 +1,14 @@
 import csv
 import json
 import os
+import tempfile
 import yaml
 
-from lib.utils import local_application_file
+from lib.utils import local_application_file, github_changed_files, matching_paths
+from lib.build_store import BuildStore
+from lib import es_config_cache, shell
 from lib.models.search_target import SearchTarget
-from lib.utils import shell_exec
+from lib.sharding import shard_targets
 from nypl_py_utils.functions.log_helper import create_log
 
 
@@ -18,6 +21,7 @@ class AppConfig:
         self.app_name = app_name
 
         self._official_commits = None
+        self._official_commit_index = None
         self._config = None
 
         self.logger = create_log(__name__)
@@ -27,12 +31,43 @@ class AppConfig:
             try:
                 path = local_application_file(self.app_name, "config.yaml")
             except Exception:
-                raise AppConfigException(f"Error fetching {self.app_name}/targets.yaml")
+                raise AppConfigException(f"Error fetching {self.app_name}/config.yaml")
 
             with open(path) as f:
-                self._config = yaml.safe_load_all(f)
+                documents = [d for d in yaml.safe_load_all(f) if d is not None]
+            self._config = documents[0] if len(documents) > 0 else {}
         return self._config
 
+    def repository(self):
+        return self.config().get("repository", f"NYPL/{self.app_name}")
+
+    def branch(self):
+        return self.config().get("branch", "main")
+
+    def relevant_changes(self, base_commit, head=None):
+        """
+        Determine which of the app's configured `relevant_paths` (i.e. paths
+        containing query-building code) changed between base_commit and head
+        (default: the configured branch).
+
+        Returns a tuple (head_sha, changed_paths). changed_paths is None if
+        relevant_paths is not configured or changes could not be determined.
+        """
+        patterns = self.config().get("relevant_paths")
+        if not patterns:
+            return None, None
+
+        head = self.branch() if head is None else head
+        try:
+            head_sha, paths = github_changed_files(self.repository(), base_commit, head)
+        except Exception as e:
+            self.logger.warning(f"Could not determine changed files: {e}")
+            return None, None
+
+        if paths is None:
+            return head_sha, None
+        return head_sha, matching_paths(paths, patterns)
+
     def load_targets(self, **kwargs):
         try:
             path = local_application_file(self.app_name, "targets.yaml")
@@ -43,6 +78,8 @@ class AppConfig:
 
         if kwargs.get("rows", None) is not None:
             self.targets = [self.targets[r] for r in kwargs["rows"]]
+        if kwargs.get("shard", None) is not None:
+            self.targets = shard_targets(self.targets, *kwargs["shard"])
         return self.targets
 
     def official_commits(self):
@@ -52,6 +89,14 @@ class AppConfig:
                 self._official_commits = [row for row in csv.DictReader(f)]
         return self._official_commits
 
+    def official_commit_index(self, commit_id):
+        """The 0-based index of commit_id in commits.csv, or None"""
+        if self._official_commit_index is None:
+            self._official_commit_index = {
+                c["commit"]: ind for ind, c in enumerate(self.official_commits())
+            }
+        return self._official_commit_index.get(commit_id)
+
     def local_temp_path(self, folder=None):
         basedir = os.path.join(os.sep, "tmp", "srt", self.app_name)
         if folder is not None:
@@ -59,29 +104,83 @@ class AppConfig:
         os.makedirs(basedir, exist_ok=True)
         return basedir
 
-    def load_es_config(self, path: str, **kwargs):
-        self.logger.info(f"Load config from {path}")
-
-        outfile = "/tmp/es-config"
-        shell_exec(
-            "bash",
-            os.path.join(self.local_config_path(), "get-config.sh"),
-            path,
-            outfile,
+    def cached_es_config(self, path: str, commit_id=None):
+        """
+        The previously resolved es config of the checkout at path (or of
+        commit_id of its repo), if its es_config_files are unchanged
+        """
+        return es_config_cache.get(
+            self, es_config_cache.fingerprint(self, path, commit_id)
         )
 
-        with open(outfile) as f:
-            es_config = json.loads(f.read())
-        os.remove(outfile)
+    def load_es_config(self, path: str, **kwargs):
+        """
+        The es config of the checkout at path, resolved by the app's
+        get-config.sh (which may decrypt credentials with KMS) unless cached
+        for its es_config_files
+        """
+        key = es_config_cache.fingerprint(self, path)
+        es_config = es_config_cache.get(self, key)
+        if es_config is not None:
+            self.logger.info(f"Using cached es config for {path}")
+            return es_config
 
+        self.logger.info(f"Load config from {path}")
+
+        with tempfile.TemporaryDirectory(dir=self.local_temp_path()) as tmp:
+            outfile = os.path.join(tmp, "es-config")
+            # Not logging its output, which may include credentials:
+            shell.run(
+                "bash",
+                os.path.join(self.local_config_path(), "get-config.sh"),
+                path,
+                outfile,
+                timeout=self.command_timeout("get-config"),
+                log_level=None,
+            )
+
+            with open(outfile) as f:
+                es_config = json.loads(f.read())
+
+        es_config_cache.put(self, key, es_config)
         return es_config
 
+    def command_timeout(self, name):
+        """
+        Seconds before the named command (e.g. "initialize") is killed, per
+        config.yaml command_timeouts, or None for lib.shell's default
+        """
+        return self.config().get("command_timeouts", {}).get(name)
+
     def local_config_path(self):
         return f"./applications/{self.app_name}"
 
+    def build_store(self):
+        return BuildStore(os.path.join(self.local_config_path(), "builds"))
+
     def jsonable(self):
         return {"app_name": self.app_name}
 
     @staticmethod
     def for_name(app_name: str):
         return AppConfig(app_name)
+
+    @staticmethod
+    def for_repository(repository: str, applications):
+        """
+        Configs of the named applications that evaluate repository (e.g.
+        "NYPL/discovery-api", or just "discovery-api")
+        """
+        app_configs = []
+        for app_name in applications:
+            app_config = AppConfig.for_name(app_name)
+            try:
+                app_repository = app_config.repository()
+            except AppConfigException as e:
+                app_config.logger.warning(f"Skipping {app_name}: {e}")
+                continue
+            if "/" not in repository:
+                app_repository = app_repository.split("/")[-1]
+            if app_repository.lower() == repository.lower():
+                app_configs.append(app_config)
+        return app_configs
@@ -1,14 +1,22 @@
 from datetime import datetime
 import os
-import pystache
 from nypl_py_utils.functions.log_helper import create_log
 
-from lib.models.run import Run
+from lib.models.run import Run, RunException
 from lib.models.app_config import AppConfig
-from lib.graphs import create_graph
-from lib.utils import format_float
+from lib.graphs import create_graph, create_thumbnail_sprite, graph_view
+from lib.history import upload_history
+from lib.report_rendering import (
+    TemplateRenderer,
+    run_summary_view,
+    run_view,
+    target_nav_view,
+    target_view,
+    write_asset,
+)
 from lib.report_utils import normalize_run_data, normalize_overall_run_data
 from lib.filestore import upload_dir
+from lib.tracing import span
 
 
 class Report:
@@ -70,6 +78,7 @@ class Report:
             f"srt/{self.app_config.app_name}/manifests",
             exclude=["local.json", "latest.json"],
         )
+        upload_history(self.app_config)
 
     def add_registered_runs(self):
         official_commit_runs = [
@@ -84,6 +93,12 @@ class Report:
         )
         return self.runs
 
+    def load_runs_from_history(self, include_local=False, include_latest=False):
+        self.runs = Run.all_from_history(
+            self.app_config, include_local=include_local, include_latest=include_latest
+        )
+        return self.runs
+
     def build(self, folder_name="report", **kwargs):
         palette = {"red": "#920711", "blue": "#00838a", "orange": "#EC7B1F"}
 
@@ -93,33 +108,25 @@ class Report:
         os.makedirs(f"{basedir}/graphs", exist_ok=True)
 
         targets = self.app_config.load_targets()
+        results_by_key = self.results_by_target_key()
 
         targets_with_runs = [
-            {
-                "target": target,
-                "number": i + 1,
-                "results": self.results_by_target(target),
-            }
+            (target, i + 1, results_by_key.get(target.key, []))
             for i, target in enumerate(targets)
         ]
-        targets_with_runs = [r for r in targets_with_runs if len(r["results"]) > 0]
-
-        runs = [result.run for result in targets_with_runs[0]["results"]]
-        app_versions = [run.app_version() for run in runs]
+        targets_with_runs = [t for t in targets_with_runs if len(t[2]) > 0]
 
-        for target_runs in targets_with_runs:
-            results = target_runs["results"]
-            target = target_runs["target"]
-            if len(results) == 0:
-                continue
+        runs = [result.run for result in targets_with_runs[0][2]]
+        run_views = {id(run): run_view(run) for run in self.runs}
+        app_versions = [run_views[id(run)]["app_version"] for run in runs]
 
+        for target, _, results in targets_with_runs:
             scores, elapsed, elapsed_relative, counts = normalize_run_data(results)
             if len(scores) != len(self.runs):
-                self.logger.error(
-                    f"\nFound error in manifests: Expected {len(self.runs)} scores for target {target};"
-                    f"Found {len(scores)}. Exiting"
+                raise RunException(
+                    f"Found error in manifests: Expected {len(self.runs)} scores for target {target};"
+                    f" Found {len(scores)}"
                 )
-                exit(1)
 
             create_graph(
                 app_versions,
@@ -133,7 +140,7 @@ class Report:
             )
 
         overall_scores, overall_elapsed, overall_elapsed_relative = (
-            normalize_overall_run_data(t["results"] for t in targets_with_runs)
+            normalize_overall_run_data(results for _, _, results in targets_with_runs)
         )
 
         create_graph(
@@ -147,14 +154,9 @@ class Report:
         )
 
         run_summary = [
-            {
-                "run": run,
-                "average_score": format_float(overall_scores[ind]),
-                "average_elapsed": int(overall_elapsed[ind]),
-            }
+            run_summary_view(run, run_views, overall_scores[ind], overall_elapsed[ind])
             for ind, run in enumerate(runs)
         ]
-        renderer = pystache.Renderer(search_dirs="./templates")
 
         official_report_url = "https://research-catalog-stats.s3.amazonaws.com/srt/discovery-api/report/index.html"
         alert = None
@@ -174,39 +176,64 @@ class Report:
                         f'<a href="{run.change_url()}">last official commit and `main`</a>.'
                     )
 
+        # The left nav's thumbnails, as one image (named, like the assets
+        # below, by its content):
+        sprite, thumb_offsets = create_thumbnail_sprite(
+            basedir, [target.key for target, _, _ in targets_with_runs]
+        )
+        sprite_path = write_asset(basedir, "thumbs", "png", sprite)
+
         template_vars = {
-            "report_id": datetime.now(),
             "build_time": datetime.now().strftime("%c"),
             "colors": palette,
-            "run_summary": as_json(run_summary),
-            "targets": as_json(targets_with_runs),
+            "run_summary": run_summary,
+            "overall_graph": graph_view(basedir, "overall"),
+            "thumbs_sprite": os.path.basename(sprite_path),
+            "targets": [
+                target_nav_view(target, number, thumb_offsets[target.key])
+                for target, number, _ in targets_with_runs
+            ],
             "alert": alert,
         }
-        html = renderer.render("{{>report}}", template_vars)
+        renderer = TemplateRenderer()
+        # Shared CSS and JS are served as content-addressed assets so readers
+        # can cache them across reports:
+        template_vars["assets"] = {
+            "styles": write_asset(
+                basedir, "styles", "css", renderer.render("styles", template_vars)
+            ),
+            "scripts": write_asset(
+                basedir, "scripts", "js", renderer.render("scripts", template_vars)
+            ),
+        }
 
-        with open(f"{basedir}/index.html", "w") as f:
-            f.write(html)
+        # Render target by target, so that only one target's view (with its
+        # runs' matching documents) is held at a time:
+        path = f"{basedir}/index.html"
+        with span("render_templates"):
+            with open(f"{path}.tmp", "w") as f:
+                f.write(renderer.render("report_head", template_vars))
+                for target, number, results in targets_with_runs:
+                    view = target_view(
+                        target,
+                        number,
+                        results,
+                        run_views,
+                        graph=graph_view(basedir, target.key),
+                    )
+                    f.write(renderer.render("target", template_vars, view))
+                f.write(renderer.render("report_foot", template_vars))
+            os.replace(f"{path}.tmp", path)
 
         if kwargs.get("persist_to_s3", True):
             upload_dir(
                 basedir, f"srt/{self.app_config.app_name}/{folder_name}/", public=True
             )
 
-    def results_by_target(self, target):
-        results = []
+    def results_by_target_key(self):
+        """All runs' results, grouped by target key (in run order)"""
+        results = {}
         for run in self.runs:
             for result in run.responses:
-                if result.target.key == target.key:
-                    results.append(result)
+                results.setdefault(result.target.key, []).append(result)
         return results
-
-
-def as_json(obj):
-    if isinstance(obj, list):
-        return [as_json(o) for o in obj]
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    if hasattr(obj, "jsonable"):
-        return obj.jsonable()
-    else:
-        return obj
@@ -1,31 +1,65 @@
+import botocore
 import json
+import logging
 import os
+import sqlite3
+import tempfile
 import time
 
 from lib.models.app_config import AppConfig
 from lib.models.search_target_response import SearchTargetResponse
 from lib.complex_encoder import ComplexEncoder
 from datetime import datetime
-from lib.filestore import download_dir
-from lib.utils import shell_exec
-from lib.elasticsearch import es_client, set_es_config
+from lib.filestore import download_dir, get_from_s3
+from lib.utils import offline_mode, shell_exec
+from lib.elasticsearch import (
+    create_es_client,
+    es_client,
+    set_es_config,
+    response_body,
+)
+from lib.es_cache import ResponseCache
+from lib.es_profile import condense_profile
+from lib.latency import compare_latency, describe_comparison
+from lib.load_testing import LoadTest
+from lib import cassettes, history, limits, shell
+from lib.tracing import span, traced, tracer
 from nypl_py_utils.functions.log_helper import create_log
 
 
+class RunException(Exception):
+    pass
+
+
+# Source fields shown for matching documents, unless config.yaml sets
+# document_metadata_fields:
+DEFAULT_DOCUMENT_METADATA_FIELDS = ["title", "creatorLiteral"]
+
+# Highlighting of matching documents, unless config.yaml sets
+# enrichment.highlight (false to disable):
+DEFAULT_HIGHLIGHT = {"order": "score", "fields": {"*": {}}}
+
+
 class Run:
     def __init__(self, **kwargs):
         self.app_config = kwargs["app_config"]
         self.base_dir = kwargs.get("base_dir", self.app_config.local_temp_path("app"))
-        self.commit_id = kwargs.get("commit_id", self.get_commit_id())
+        self.commit_id = (
+            kwargs["commit_id"] if "commit_id" in kwargs else self.get_commit_id()
+        )
         self.previous_commit_id = kwargs.get("previous_commit_id", None)
         self.commit_description = kwargs.get("commit_description", None)
         self.explicit_base_dir = kwargs.get("base_dir", None) is not None
         self.file_key = kwargs.get("file_key", self.commit_id)
         self.commit_date = kwargs.get("commit_date", None)
         self.run_date = kwargs.get("run_date", None)
+        self.trace_summary = kwargs.get("trace_summary", None)
+        self.load_test = kwargs.get("load_test", None)
 
         self.created_date = datetime.now()
         self.responses = []
+        self.use_es_cache = kwargs.get("use_es_cache", True)
+        self.response_cache = None
 
         self.logger = create_log(__name__)
 
@@ -46,14 +80,17 @@ class Run:
     def app_version(self):
         if self.file_key in ["latest", "local"]:
             return self.file_key.upper()
-        official_commit_ids = [c["commit"] for c in self.app_config.official_commits()]
-        if self.commit_id not in official_commit_ids:
+        ind = self.app_config.official_commit_index(self.commit_id)
+        if ind is None:
             return None
-        ind = official_commit_ids.index(self.commit_id)
         return f"V{ind + 1}"
 
     def get_commit_id(self):
-        s = shell_exec("git", "-C", self.base_dir, "show", "-s", "--format=%H")
+        s = cassettes.cassette(
+            "git.commit_id",
+            {"base_dir": self.base_dir},
+            lambda: shell_exec("git", "-C", self.base_dir, "show", "-s", "--format=%H"),
+        )
         self.commit_id = s
         return self.commit_id
 
@@ -66,54 +103,135 @@ class Run:
                 self.commit_date = datetime.fromisoformat(meta["commit_date"])
         else:
             self.logger.debug(f"Fetching fresh commit date because DNE {cache_path}")
-            s = shell_exec(
-                "git", "-C", self.base_dir, "show", self.commit_id, "-s", "--format=%ci"
+            s = cassettes.cassette(
+                "git.commit_date",
+                {"commit_id": self.commit_id},
+                lambda: shell_exec(
+                    "git",
+                    "-C",
+                    self.base_dir,
+                    "show",
+                    self.commit_id,
+                    "-s",
+                    "--format=%ci",
+                ),
             )
             self.commit_date = datetime.strptime(s, "%Y-%m-%d %H:%M:%S %z")
 
         return self.commit_date
 
+    @traced()
     def get_query(self, params):
-        infile = "/tmp/query-infile"
-        outfile = "/tmp/query-outfile"
-
-        with open(infile, "w") as f:
-            f.write(json.dumps(params))
-
-        path = self.base_dir
-        shell_exec(
-            "bash",
-            f"./applications/{self.app_config.app_name}/get-query.sh",
-            path,
-            infile,
-            outfile,
+        request = {
+            "app": self.app_config.app_name,
+            "commit_id": self.commit_id,
+            "file_key": self.file_key,
+            "params": params,
+        }
+        return cassettes.cassette(
+            "get_query", request, lambda: self.build_query(params)
         )
 
-        query = None
-        with open(outfile, "r") as f:
-            query = json.loads(f.read())
+    def build_query(self, params):
+        """Generate the ES query for params using the app's get-query.sh"""
+        with tempfile.TemporaryDirectory(dir=self.app_config.local_temp_path()) as tmp:
+            infile = os.path.join(tmp, "query-infile")
+            outfile = os.path.join(tmp, "query-outfile")
+
+            with open(infile, "w") as f:
+                f.write(json.dumps(params))
+
+            path = self.base_dir
+            shell.run(
+                "bash",
+                f"./applications/{self.app_config.app_name}/get-query.sh",
+                path,
+                infile,
+                outfile,
+                timeout=self.app_config.command_timeout("get-query"),
+            )
+
+            query = None
+            with open(outfile, "r") as f:
+                query = json.loads(f.read())
 
         return query
 
-    def matching_documents(self, query, **kwargs):
-        client = es_client()
+    def search_request(self, query):
+        """
+        The search call (kwargs) for query as the app sends it (with
+        config.yaml's search_options, e.g. its size), which is what's timed
+        """
+        return {
+            "index": self.es_config["index"],
+            "query": query,
+            **self.app_config.config().get("search_options", {}),
+        }
 
-        count = kwargs.get("count", 25)
-        fields = ["title", "creatorLiteral"]
-        highlight = {"order": "score", "fields": {"*": {}}}
-        resp = client.search(
-            index=self.es_config["index"],
-            query=query,
-            source_includes=fields,
-            size=count,
-            track_total_hits=True,
-            highlight=highlight,
+    def enrichment_request(self, query, count=25):
+        """
+        The search (an msearch body) fetching the documents, highlights, and
+        exact total shown in the report for query
+        """
+        config = self.app_config.config()
+        request = {
+            "query": query,
+            "_source": {
+                "includes": config.get(
+                    "document_metadata_fields", DEFAULT_DOCUMENT_METADATA_FIELDS
+                )
+            },
+            "size": count,
+            "track_total_hits": True,
+        }
+        highlight = config.get("enrichment", {}).get("highlight", DEFAULT_HIGHLIGHT)
+        if highlight:
+            request["highlight"] = highlight
+        return request
+
+    @traced()
+    def timed_search(self, query):
+        """
+        Returns the elapsed ms of query's search (as the app sends it) and
+        latency samples (ms) of config.yaml's latency_samples searches
+        """
+        search = self.es_search(
+            samples=self.app_config.config().get("latency_samples", 5),
+            **self.search_request(query),
+        )
+        return search["elapsed"], search["samples"]
+
+    @traced()
+    def enrich_responses(self, responses):
+        """
+        Fetch the matching documents and total hits of each response's query
+        (with one msearch for all of them), marking relevant documents
+        """
+        requests = [
+            self.enrichment_request(
+                response.query, max(response.target.metric_at + 10, 25)
+            )
+            for response in responses
+        ]
+        for response, resp in zip(responses, self.es_msearch(requests)):
+            if "error" in resp:
+                raise RunException(
+                    f"Enrichment search failed for {response.target.key}: {resp['error']}"
+                )
+            response.matching_documents, response.count = self.documents_from(
+                response.target, resp
+            )
+
+    def documents_from(self, target, resp):
+        """The hits (flattened for display) and total of an enrichment search"""
+        fields = self.app_config.config().get(
+            "document_metadata_fields", DEFAULT_DOCUMENT_METADATA_FIELDS
         )
         hits = []
         total = 0
         if resp.get("hits") and resp["hits"].get("hits"):
             total = int(resp["hits"]["total"]["value"])
-            for hit in resp["hits"]["hits"]:
+            for ind, hit in enumerate(resp["hits"]["hits"]):
                 for field in fields:
                     if (
                         hit["_source"].get(field)
@@ -128,6 +246,10 @@ class Run:
                         if field
                         not in ["nyplSource", "buildingLocationIds", "issuance.id"]
                     ]
+                if hit["_id"] in target.relevant:
+                    hit["relevant"] = True
+                if ind < target.metric_at:
+                    hit["within_metric"] = True
                 hits.append(hit)
         return hits, total
 
@@ -160,42 +282,97 @@ class Run:
 
         return call
 
+    @traced()
     def initialize_es_client(self):
+        request = {
+            "app": self.app_config.app_name,
+            "commit_id": self.commit_id,
+            "file_key": self.file_key,
+        }
+        # Never record credentials:
+        self.es_config = cassettes.cassette(
+            "es_config",
+            request,
+            self.load_es_config,
+            redact=lambda config: {k: v for k, v in config.items() if k != "apiKey"},
+        )
+
+        set_es_config(self.es_config)
+
+        self.response_cache = ResponseCache(
+            self.app_config.local_temp_path("es-cache"),
+            self.es_config["index"],
+            # Recordings must capture every call, and replays need no cache:
+            enabled=self.use_es_cache and cassettes.mode is None,
+        )
+
+    def load_es_config(self):
         # TODO: Hack to override the es config for the first commit to use
         #  - the host and creds of the second registered commit and
         #  - a custom index (a v8 snapshot of the old ES5.3 index)
         if self.commit_id == "379a05103adb2e79fb5469a2b2ef3adba5385744":
             self.logger.info("  Overriding es-config for first commit")
 
-            # Load ES config from 2nd commit, since it uses our v8 cluster:
-            self.initialize_app(commit_id="ef2d69fcf119d3ec8f5261d77fb2732d9f7ce44f")
-            self.es_config = self.app_config.load_es_config(self.base_dir)
+            # Load ES config from 2nd commit, since it uses our v8 cluster
+            # (read from the repo, so it's only initialized if not cached):
+            second_commit_id = "ef2d69fcf119d3ec8f5261d77fb2732d9f7ce44f"
+            es_config = self.app_config.cached_es_config(
+                self.base_dir, commit_id=second_commit_id
+            )
+            if es_config is None:
+                self.initialize_app(commit_id=second_commit_id)
+                es_config = self.app_config.load_es_config(self.base_dir)
 
             # Override the 2nd commit's configured index to use legacy snapshot:
-            self.es_config["index"] = "resources-2018-04-09"
+            es_config["index"] = "resources-2018-04-09"
 
             # Now, reinitialize:
             self.initialize_app()
         else:
-            self.es_config = self.app_config.load_es_config(self.base_dir)
+            es_config = self.app_config.load_es_config(self.base_dir)
 
-        set_es_config(self.es_config)
+        return es_config
 
+    @traced()
     def initialize_app(self, use_cache=True, commit_id=None):
         if commit_id is None:
             commit_id = self.commit_id
 
+        if cassettes.is_replaying():
+            self.logger.info(f"Replaying recorded data; Not initializing {commit_id}")
+            return
+
+        with limits.initialization_slot():
+            self.initialize_app_files(use_cache, commit_id)
+
+    def initialize_app_files(self, use_cache, commit_id):
+        build_store = self.app_config.build_store()
         package_path = os.path.join(
             self.app_config.local_config_path(), "builds", f"{commit_id}.zip"
         )
-        if use_cache and os.path.isfile(package_path):
+        if use_cache and build_store.has_build(commit_id):
+            print("--------------------------------------------------")
+            print(f"| Using built package: {build_store.manifest_path(commit_id)}")
+            print("--------------------------------------------------")
+
+            build_store.restore(commit_id, self.base_dir)
+            print("--------------------------------------------------")
+
+        elif use_cache and os.path.isfile(package_path):
+            # Legacy zip package:
             print("--------------------------------------------------")
             print(f"| Using built package: {package_path}")
             print("--------------------------------------------------")
 
-            cmd = ["bash", "./unpackage.sh", package_path, self.base_dir]
-            self.logger.debug(f"CMD: {' '.join(cmd)}")
-            shell_exec(*cmd)
+            shell.run(
+                "bash",
+                "./unpackage.sh",
+                package_path,
+                self.base_dir,
+                timeout=self.app_config.command_timeout("unpackage"),
+                capture=False,
+                log_level=logging.INFO,
+            )
             print("--------------------------------------------------")
             """
             print(
@@ -207,11 +384,14 @@ class Run:
             print("--------------------------------------------------")
             print(f"| Initializing commit {commit_id} in {self.base_dir}")
             print("--------------------------------------------------")
-            shell_exec(
+            shell.run(
                 "bash",
                 os.path.join(self.app_config.local_config_path(), "initialize.sh"),
                 self.base_dir,
                 commit_id,
+                timeout=self.app_config.command_timeout("initialize"),
+                capture=False,
+                log_level=logging.INFO,
             )
             print("--------------------------------------------------")
             """
@@ -221,20 +401,8 @@ class Run:
             """
 
     def package_app(self):
-        cmd = [
-            "bash",
-            "./package.sh",
-            self.base_dir,
-            self.app_config.app_name,
-            self.commit_id,
-        ]
-        self.logger.debug(f"CMD: {' '.join(cmd)}")
-        shell_exec(*cmd)
-        """
-        print(
-            f"  Package app resp: \n=====================================\n{resp}\n====================================="
-        )
-        """
+        with limits.initialization_slot():
+            self.app_config.build_store().pack(self.base_dir, self.commit_id)
 
         cache_path = os.path.join(
             self.app_config.local_config_path(), "builds", f"{self.commit_id}.meta.json"
@@ -245,9 +413,23 @@ class Run:
             self.logger.debug(f"writing {json.dumps(meta)} to {cache_path}")
             f.write(json.dumps(meta))
 
-    def collect_data(self, rebuild=False):
+    def collect_data(self, rebuild=False, use_es_cache=True, **kwargs):
+        """
+        Run all targets, reusing responses from previous_run (by default, the
+        saved manifest for this commit) for targets it already covers.
+
+        If given, checkpoint is called with this run after each target.
+        """
+        with span(f"run {self.file_key or self.base_dir}", category="run") as span_id:
+            self.collect_run_data(rebuild, use_es_cache, **kwargs)
+        self.trace_summary = tracer.summary(within=span_id)
+
+    def collect_run_data(self, rebuild, use_es_cache, **kwargs):
         self.logger.info(f"Collecting run data for {self.commit_id}")
-        previous_run = Run.by_manifest_file(self.app_config, self.commit_id)
+        self.use_es_cache = use_es_cache
+        previous_run = kwargs.get("previous_run")
+        if previous_run is None:
+            previous_run = Run.by_manifest_file(self.app_config, self.commit_id)
 
         if rebuild:
             previous_run = None
@@ -271,9 +453,9 @@ class Run:
         new_targets = [t for t in current_targets if t.key not in previous_target_keys]
         if len(new_targets) == 0:
             self.responses = [
-                SearchTargetResponse.from_json(r.raw, run=self)
-                for r in previous_run.responses
-                if r.target.key not in deprecated_target_keys
+                previous_response.for_run(self)
+                for previous_response in previous_run.responses
+                if previous_response.target.key not in deprecated_target_keys
             ]
             self.run_date = previous_run.run_date
             self.commit_id = previous_run.commit_id
@@ -294,7 +476,13 @@ class Run:
 
         self.run_date = datetime.now().isoformat()
 
-        self.run_targets(previous_run)
+        self.run_targets(previous_run, checkpoint=kwargs.get("checkpoint"))
+
+        if self.response_cache.enabled:
+            self.logger.info(
+                f"  ES response cache: {self.response_cache.hits} hits, "
+                f"{self.response_cache.misses} misses"
+            )
 
         if self.commit_id is None:
             self.get_commit_id()
@@ -302,95 +490,259 @@ class Run:
         if not self.explicit_base_dir:
             self.get_commit_date()
 
-    def run_targets(self, previous_run):
+    def run_targets(self, previous_run, checkpoint=None):
         for_what = self.base_dir if self.commit_id is None else self.commit_id
         self.logger.info(
             f"Running {len(self.app_config.targets)} targets for {for_what}"
         )
 
-        for ind, target in enumerate(self.app_config.targets):
-            self.logger.info(f"  Running target {ind}: {target.key}")
-            previous_response = None
-            if previous_run is not None:
-                _previous_response = [
-                    r for r in previous_run.responses if r.target.key == target.key
-                ]
-                previous_response = (
-                    _previous_response[0] if len(_previous_response) > 0 else None
-                )
-            if previous_response is not None:
-                self.logger.info(
-                    f"    Skipping re-running {self.commit_id}: {target.key} because nothing changed"
-                )
-                self.responses.append(
-                    SearchTargetResponse.from_json(previous_response.raw, self)
-                )
-                continue
-
-            params = {"search_scope": target.search_scope, "q": target.q}
-            query = self.get_query(params)
-            call = self.rank_eval_call(target, query)
-
-            self.logger.debug(f"    Running rank_eval call for {params}")
-            response = None
-            response = self.es_rank_eval(
-                requests=call["requests"],
-                metric=call["metric"],
-                index=self.es_config["index"],
+        # Report enrichment is fetched in batches, so checkpoints (which must
+        # include it) follow each batch:
+        batch_size = (
+            self.app_config.config().get("enrichment", {}).get("batch_size", 10)
+        )
+        targets = self.app_config.targets
+        pending = []
+        for ind, target in enumerate(targets):
+            with span(f"target {target.key}", category="target", index=ind):
+                response = self.run_target(ind, target, previous_run)
+            if response is not None:
+                pending.append(response)
+            if len(pending) >= batch_size or (
+                len(pending) > 0 and ind == len(targets) - 1
+            ):
+                self.enrich_responses(pending)
+                pending = []
+                if checkpoint is not None:
+                    checkpoint(self)
+
+    def run_target(self, ind, target, previous_run):
+        self.logger.info(f"  Running target {ind}: {target.key}")
+        previous_response = None
+        if previous_run is not None:
+            _previous_response = [
+                r for r in previous_run.responses if r.target.key == target.key
+            ]
+            previous_response = (
+                _previous_response[0] if len(_previous_response) > 0 else None
+            )
+        if previous_response is not None:
+            self.logger.info(
+                f"    Skipping re-running {self.commit_id}: {target.key} because nothing changed"
             )
+            self.responses.append(previous_response.for_run(self))
+            return None
 
-            start_time = time.time()
-            matching_documents, count = self.matching_documents(
-                query, count=max(target.metric_at + 10, 25)
+        params = {"search_scope": target.search_scope, "q": target.q}
+        query = self.get_query(params)
+        call = self.rank_eval_call(target, query)
+
+        self.logger.debug(f"    Running rank_eval call for {params}")
+        response = None
+        response = self.es_rank_eval(
+            requests=call["requests"],
+            metric=call["metric"],
+            index=self.es_config["index"],
+        )
+
+        elapsed, samples = self.timed_search(query)
+
+        if response["failures"].get("report") is not None:
+            self.logger.error(f'Got Error: {response["failures"]}')
+            raise RunException(
+                f"rank_eval failed for {target.key}: {response['failures']['report']}"
             )
-            elapsed = round((time.time() - start_time) * 1000)
 
-            for ind, doc in enumerate(matching_documents):
-                if doc["_id"] in target.relevant:
-                    doc["relevant"] = True
-                if ind < target.metric_at:
-                    doc["within_metric"] = True
-
-            if response["failures"].get("report") is not None:
-                self.logger.error(f'Got Error: {response["failures"]}')
-                exit()
-
-            self.responses.append(
-                SearchTargetResponse.from_json(
-                    {
-                        "target": target,
-                        "response": response,
-                        "matching_documents": matching_documents,
-                        "query": query,
-                        "elapsed": elapsed,
-                        "count": count,
-                    }
-                )
+        # matching_documents and count are filled in by enrich_responses:
+        target_response = SearchTargetResponse.from_json(
+            {
+                "target": target,
+                "response": response,
+                "query": query,
+                "elapsed": elapsed,
+                "elapsed_samples": samples,
+                "count": None,
+            }
+        )
+        self.responses.append(target_response)
+        return target_response
+
+    def prepare_es_client(self):
+        """
+        Initialize the es client if collect_data hasn't (e.g. for runs loaded
+        from manifests), initializing the app to resolve its es config
+        """
+        if getattr(self, "es_config", None) is not None:
+            return
+        if (
+            not self.explicit_base_dir
+            and self.commit_id != "379a05103adb2e79fb5469a2b2ef3adba5385744"
+        ):
+            self.initialize_app()
+        self.initialize_es_client()
+
+    def query_for(self, response):
+        """The query generated for response, regenerating it if not stored"""
+        if response.query is not None:
+            return response.query
+        # Manifests predating stored queries:
+        target = response.target
+        return self.get_query({"search_scope": target.search_scope, "q": target.q})
+
+    def profile_slow_targets(self, baseline=None):
+        """
+        Re-run searches for targets that are slow (elapsed at or above
+        config.yaml's es_profile_threshold_ms) or slower than in baseline
+        (by es_profile_regression times) with profile: true, storing a
+        condensed per-shard, per-clause breakdown in each response's profile.
+
+        Returns the profiled responses.
+        """
+        config = self.app_config.config()
+        threshold_ms = config.get("es_profile_threshold_ms", 1000)
+        regression = config.get("es_profile_regression", 1.5)
+        baseline_elapsed = {}
+        if baseline is not None:
+            baseline_elapsed = {r.target.key: r.elapsed for r in baseline.responses}
+
+        def is_slow(response):
+            previous = baseline_elapsed.get(response.target.key)
+            return response.elapsed >= threshold_ms or (
+                previous is not None and response.elapsed >= previous * regression
             )
 
+        slow = [r for r in self.responses if r.profile is None and is_slow(r)]
+        if len(slow) == 0:
+            return slow
+
+        self.logger.info(f"  Profiling {len(slow)} slow targets")
+        self.prepare_es_client()
+        for response in slow:
+            target = response.target
+            request = self.search_request(self.query_for(response))
+            with span("es_profile"):
+                resp = response_body(es_client().search(**request, profile=True))
+            response.profile = condense_profile(resp)
+            self.logger.debug(
+                f"    Profiled {target.key}: took {response.profile['took_ms']}ms"
+            )
+        return slow
+
+    def run_load_test(self, **kwargs):
+        """
+        Replay the queries generated for this run's responses (limited to the
+        app's current targets) against the cluster, storing throughput, error
+        rate, and latency percentiles per target and overall in load_test.
+
+        See LoadTest for kwargs.
+        """
+        target_keys = [target.key for target in self.app_config.targets]
+        responses = [r for r in self.responses if r.target.key in target_keys]
+        if len(responses) == 0:
+            raise RunException(f"No responses to load test in {self.file_key}")
+
+        self.prepare_es_client()
+        queries = [(r.target.key, self.query_for(r)) for r in responses]
+
+        client = create_es_client(
+            self.es_config, connections_per_node=kwargs.get("concurrency", 8)
+        )
+        queries = [(key, self.search_request(query)) for key, query in queries]
+
+        with span("load_test"):
+            self.load_test = LoadTest(
+                lambda request: client.search(**request), queries, **kwargs
+            ).run()
+        return self.load_test
+
     def es_count(self, query):
         client = es_client()
         resp = client.count(query=query)
         return resp["count"]
 
+    @traced()
     def es_rank_eval(self, **kwargs):
-        client = es_client()
-        return client.rank_eval(**kwargs)
+        def fetch():
+            return response_body(es_client().rank_eval(**kwargs))
+
+        return self.cached_es_call("rank_eval", kwargs, fetch)
+
+    def es_search(self, samples=1, **kwargs):
+        """
+        Run a search for its latency, returning a dict containing the "took"
+        ms reported by ES, the "elapsed" ms measured around the call, and the
+        elapsed ms of it and samples - 1 repetitions as "samples". (Responses
+        aren't kept, since the app's own searches may return whole documents.)
+        """
+
+        def timed_search():
+            start_time = time.time()
+            resp = response_body(es_client().search(**kwargs))
+            elapsed = round((time.time() - start_time) * 1000)
+            # Replayed responses report the elapsed time originally recorded:
+            return resp, getattr(resp, "recorded_elapsed", elapsed)
+
+        def fetch():
+            resp, elapsed = timed_search()
+            repetitions = [timed_search()[1] for _ in range(samples - 1)]
+            return {
+                "took": resp.get("took"),
+                "elapsed": elapsed,
+                "samples": [elapsed] + repetitions,
+            }
+
+        return self.cached_es_call("search", kwargs, fetch)
+
+    @traced()
+    def es_msearch(self, searches):
+        """
+        Run searches (msearch bodies against the run's index) as one msearch,
+        returning their responses. Cached responses are reused, and only the
+        rest are searched.
+        """
+        index = self.es_config["index"]
+        cache = self.response_cache
+        if cache is not None and not cache.enabled:
+            cache = None
+
+        results = [None] * len(searches)
+        if cache is not None:
+            for ind, search in enumerate(searches):
+                results[ind] = cache.lookup("enrichment", {"index": index, **search})
+
+        missing = [ind for ind, result in enumerate(results) if result is None]
+        if len(missing) > 0:
+            body = []
+            for ind in missing:
+                body += [{"index": index}, searches[ind]]
+            resp = response_body(es_client().msearch(searches=body))
+            for ind, result in zip(missing, resp["responses"]):
+                results[ind] = result
+                if cache is not None and "error" not in result:
+                    cache.store("enrichment", {"index": index, **searches[ind]}, result)
+        return results
+
+    def cached_es_call(self, kind, request, fetch):
+        if self.response_cache is None:
+            return fetch()
+        return self.response_cache.fetch(kind, request, fetch)
 
     def jsonable(self):
         copy = dict(self.__dict__)
-        for p in ["es_config", "logger"]:
+        for p in ["es_config", "logger", "response_cache", "use_es_cache"]:
             if p in copy:
                 del copy[p]
         return copy
 
-    def save_manifest(self):
-        serialization = json.dumps(
-            self.jsonable(), indent=2, sort_keys=True, cls=ComplexEncoder
-        )
+    def serialize(self):
+        return json.dumps(self.jsonable(), indent=2, sort_keys=True, cls=ComplexEncoder)
+
+    @traced()
+    def save_manifest(self, folder="manifests"):
+        serialization = self.serialize()
         self.logger.debug(f"  Saving manifest for {self.commit_id}")
 
-        basedir = self.app_config.local_temp_path("manifests")
+        basedir = self.app_config.local_temp_path(folder)
         os.makedirs(basedir, exist_ok=True)
 
         path = self.manifest_file_path(basedir)
@@ -398,11 +750,25 @@ class Run:
             f.write(serialization)
         self.logger.debug(f"  Wrote to {path}")
 
+        if folder == "manifests" and self.file_key not in ["local", "latest"]:
+            try:
+                history.save_run(self)
+            except sqlite3.Error as e:
+                self.logger.warning(f"Could not save {self.file_key} to history: {e}")
+        return path
+
     def manifest_file_path(self, basedir):
         filename = f"{self.file_key}.json"
         return os.path.join(basedir, filename)
 
-    def has_equivalent_scores(self, other):
+    def has_equivalent_scores(self, other, target_keys=None):
+        """
+        Compare scores target by target (or, given target_keys, just those
+        targets, matched by key). Returns (equivalent, explanation).
+        """
+        if target_keys is not None:
+            return self.has_equivalent_target_scores(other, target_keys)
+
         scores1 = [resp.metric_score for resp in self.responses]
         scores2 = [resp.metric_score for resp in other.responses]
 
@@ -419,11 +785,45 @@ class Run:
 
         return True, None
 
+    def has_equivalent_target_scores(self, other, target_keys):
+        scores1 = {resp.target.key: resp.metric_score for resp in self.responses}
+        scores2 = {resp.target.key: resp.metric_score for resp in other.responses}
+
+        missing = [
+            key for key in target_keys if key not in scores1 or key not in scores2
+        ]
+        if len(missing):
+            return False, f"Missing scores for: {', '.join(missing)}"
+        summaries = [
+            f"{key}: {scores1[key]} => {scores2[key]}"
+            for key in target_keys
+            if scores1[key] != scores2[key]
+        ]
+        if len(summaries):
+            return False, f"Mismatched scores: {', '.join(summaries)}"
+
+        return True, None
+
+    def has_equivalent_latency(self, other):
+        """
+        Compare other's latency samples to this run's (per target and
+        overall), using config.yaml's latency_regression thresholds.
+        Returns (equivalent, explanation).
+        """
+        thresholds = self.app_config.config().get("latency_regression") or {}
+        comparison = compare_latency(self.responses, other.responses, **thresholds)
+        if comparison["regressed"]:
+            return False, f"Latency regressed: {describe_comparison(comparison)}"
+        return True, None
+
     @staticmethod
-    def for_commit(app_config, commit, description=""):
+    def for_commit(app_config, commit, description="", file_key=None):
         create_log(__name__).info(f"Building Run for {commit}")
         return Run(
-            app_config=app_config, commit_id=commit, commit_description=description
+            app_config=app_config,
+            commit_id=commit,
+            commit_description=description,
+            file_key=file_key or commit,
         )
 
     @staticmethod
@@ -443,10 +843,17 @@ class Run:
             app_config=app_config,
             commit_id=json["commit_id"],
             commit_description=json["commit_description"],
-            commit_date=datetime.fromisoformat(json["commit_date"]),
+            # Checkpoints of incomplete runs may not have a commit_date yet:
+            commit_date=(
+                datetime.fromisoformat(json["commit_date"])
+                if json.get("commit_date")
+                else None
+            ),
             previous_commit_id=kwargs.get("previous_commit_id"),
             run_date=json["run_date"],
             file_key=json.get("file_key"),
+            trace_summary=json.get("trace_summary"),
+            load_test=json.get("load_test"),
         )
 
         run.responses = [
@@ -456,16 +863,21 @@ class Run:
         return run
 
     @staticmethod
+    @traced("load_manifests")
     def by_manifest_file(app_config, commit_id):
         path = os.path.join(
             app_config.local_temp_path("manifests"), f"{commit_id}.json"
         )
         if os.path.exists(path):
             with open(path) as f:
-                return Run.from_json(app_config, json.loads(f.read()))
+                run = Run.from_json(app_config, json.loads(f.read()))
+            # Older manifests don't record their file_key:
+            run.file_key = run.file_key or commit_id
+            return run
         return None
 
     @staticmethod
+    @traced("load_manifests")
     def all_from_manifests(app_config, include_local=False, include_latest=False):
         directory = app_config.local_temp_path("manifests")
         download_dir(f"srt/{app_config.app_name}/manifests", directory)
@@ -492,23 +904,132 @@ class Run:
             elif filename.endswith(".json"):
                 manifest_paths.append(os.path.join(str(directory), filename))
 
-        manifests = []
+        # Build each run as its manifest is parsed, so that only one parsed
+        # manifest is held in memory at a time:
+        loaded = []
         for path in manifest_paths:
             with open(path) as f:
-                manifests.append(json.loads(f.read()))
+                manifest = json.loads(f.read())
+            loaded.append(
+                (manifest["commit_date"], path, Run.from_json(app_config, manifest))
+            )
+            del manifest
 
-        manifests.sort(key=lambda manifest: manifest["commit_date"])
+        loaded.sort(key=lambda entry: entry[0])
 
         runs = []
-        for ind, manifest in enumerate(manifests):
-            previous_commit_id = manifests[ind - 1]["commit_id"] if ind > 0 else None
-            run = Run.from_json(
-                app_config, manifest, previous_commit_id=previous_commit_id
+        for ind, (_, path, run) in enumerate(loaded):
+            run.previous_commit_id = runs[ind - 1].commit_id if ind > 0 else None
+            runs.append(run)
+            create_log(__name__).info(
+                f"Loaded run: {path} - {run.commit_date} - {len(run.responses)} responses"
+            )
+        return runs
+
+    @staticmethod
+    def from_history_rows(app_config, run_row, result_rows, targets_by_key):
+        """
+        A run summarized from history: responses carry scores, counts, and
+        latency, but not matching documents or rank-eval details
+        """
+        run = Run(
+            app_config=app_config,
+            commit_id=run_row["commit_id"],
+            commit_description=run_row["commit_description"],
+            commit_date=(
+                datetime.fromisoformat(run_row["commit_date"])
+                if run_row["commit_date"]
+                else None
+            ),
+            run_date=run_row["run_date"],
+            file_key=run_row["file_key"],
+            load_test=(
+                json.loads(run_row["load_test"]) if run_row["load_test"] else None
+            ),
+        )
+        run.responses = [
+            SearchTargetResponse(
+                target=targets_by_key[row["target_key"]],
+                elapsed=row["elapsed"],
+                count=row["total_hits"],
+                response={"metric_score": row["metric_score"], "found": row["found"]},
+                run=run,
             )
+            for row in result_rows
+            # Targets since removed from targets.yaml:
+            if row["target_key"] in targets_by_key
+        ]
+        return run
+
+    @staticmethod
+    def fetch_manifest(app_config, file_key):
+        """The run for file_key, downloading just its manifest if needed"""
+        path = os.path.join(app_config.local_temp_path("manifests"), f"{file_key}.json")
+        if not os.path.exists(path) and not offline_mode():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                get_from_s3(
+                    f"srt/{app_config.app_name}/manifests/{file_key}.json", path
+                )
+            except botocore.exceptions.ClientError:
+                return None
+        return Run.by_manifest_file(app_config, file_key)
+
+    @staticmethod
+    @traced("load_history")
+    def all_from_history(
+        app_config, include_local=False, include_latest=False, detailed=None
+    ):
+        """
+        Runs of official commits summarized from the run history, without
+        downloading or parsing every manifest. The latest `detailed` official
+        runs (default: config.yaml's history_detail_runs, or 1), and local and
+        latest runs if included, are loaded from their manifests in full.
+
+        Official runs missing from the history are added to it from their
+        manifests.
+        """
+        if detailed is None:
+            detailed = app_config.config().get("history_detail_runs", 1)
+        file_keys = [c["commit"] for c in app_config.official_commits()]
+        targets_by_key = {t.key: t for t in app_config.load_targets()}
+
+        store = history.History(app_config)
+        try:
+            store.download()
+            stored = set(store.file_keys())
+            missing = [key for key in file_keys if key not in stored]
+            for file_key in missing:
+                run = Run.fetch_manifest(app_config, file_key)
+                if run is not None:
+                    create_log(__name__).info(f"Adding {file_key} to history")
+                    store.upsert_run(run)
+
+            run_rows = store.runs(file_keys)
+            results = store.results([row["file_key"] for row in run_rows])
+        finally:
+            store.close()
+
+        runs = []
+        for ind, run_row in enumerate(run_rows):
+            run = None
+            if ind >= len(run_rows) - detailed:
+                run = Run.fetch_manifest(app_config, run_row["file_key"])
+            if run is None:
+                run = Run.from_history_rows(
+                    app_config, run_row, results[run_row["file_key"]], targets_by_key
+                )
             runs.append(run)
 
+        for file_key, included in [
+            ("local", include_local),
+            ("latest", include_latest),
+        ]:
+            if included:
+                run = Run.fetch_manifest(app_config, file_key)
+                if run is not None:
+                    runs.append(run)
+
         for ind, run in enumerate(runs):
-            create_log(__name__).info(
-                f"Loaded run: {manifest_paths[ind]} - {run.commit_date} - {len(run.responses)} responses"
-            )
+            run.previous_commit_id = runs[ind - 1].commit_id if ind > 0 else None
         return runs
@@ -1,9 +1,27 @@
+import weakref
 import yaml
 
-from lib.report_utils import basic_bib_metadata
+from lib.report_utils import bib_metadata
+
+# Targets loaded from config and from each run's manifest, by key:
+_interned = weakref.WeakValueDictionary()
 
 
 class SearchTarget:
+    __slots__ = [
+        "q",
+        "search_scope",
+        "rc_search_scope",
+        "metric",
+        "metric_at",
+        "relevant",
+        "notes",
+        "key",
+        "qa_url",
+        "production_url",
+        "__weakref__",
+    ]
+
     def __init__(self, **kwargs):
         self.q = kwargs["q"]
         self.search_scope = kwargs["search_scope"]
@@ -40,13 +58,17 @@ class SearchTarget:
         )
 
     def relevant_records(self):
-        return [basic_bib_metadata(bnum) for bnum in self.relevant]
+        return [bib_metadata(bnum) for bnum in self.relevant]
 
     def relevant_length(self):
         return len(self.relevant)
 
     def jsonable(self):
-        return self.__dict__
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name != "__weakref__"
+        }
 
     def __eq__(self, other):
         return self.q == other.q
@@ -56,7 +78,12 @@ class SearchTarget:
 
     @staticmethod
     def from_json(json):
-        return SearchTarget(
+        """
+        Build a SearchTarget, reusing the existing instance with the same key
+        (and notes) if there is one, so that every run's response for a target
+        shares one instance.
+        """
+        target = SearchTarget(
             q=json["q"],
             search_scope=json["search_scope"],
             metric=json["metric"],
@@ -64,6 +91,11 @@ class SearchTarget:
             relevant=json["relevant"],
             notes=json.get("notes", None),
         )
+        interned = _interned.get(target.key)
+        if interned is not None and interned.notes == target.notes:
+            return interned
+        _interned[target.key] = target
+        return target
 
     @staticmethod
     def load_all_from(path):
@@ -1,66 +1,166 @@
 import json
 
 from lib.models.search_target import SearchTarget
-from lib.report_utils import basic_bib_metadata
+from lib.report_utils import bib_metadata
 from lib.utils import format_float
 
 
+def pack(obj):
+    return None if obj is None else json.dumps(obj, separators=(",", ":"))
+
+
+def unpack(packed):
+    return None if packed is None else json.loads(packed)
+
+
 class SearchTargetResponse:
+    # Reports hold one of these per target per run, so keep them compact:
+    # matching_documents and query (the bulk of each response) are held as
+    # compact JSON and decoded on access, and derived values (hits, found, etc.) are
+    # computed from `response` on demand.
+    __slots__ = [
+        "target",
+        "elapsed",
+        "elapsed_samples",
+        "_matching_documents",
+        "_query",
+        "count",
+        "response",
+        "run",
+        "profile",
+        "_hits",
+    ]
+
     def __init__(self, **kwargs):
         self.target = kwargs["target"]
         self.elapsed = kwargs["elapsed"]
+        # Elapsed ms of repeated searches, for comparing latency:
+        self.elapsed_samples = kwargs.get("elapsed_samples")
         self.matching_documents = kwargs.get("matching_documents")
+        self.query = kwargs.get("query")
         self.count = kwargs["count"]
-        self.raw = kwargs.get("raw")
         self.response = kwargs.get("response")
+        self.run = kwargs.get("run")
+        # Condensed ES profile, if the target was profiled:
+        self.profile = kwargs.get("profile")
+        self._hits = None
 
-        report = None
-        if kwargs.get("response"):
-            self.metric_score = kwargs["response"]["metric_score"]
-            if kwargs["response"].get("details"):
-                report = kwargs["response"]["details"]["report"]
-
-                self.hits = [
-                    {"bnum": hit["hit"]["_id"], "found": hit.get("rating") is not None}
-                    for hit in report["hits"]
-                ]
-                self.hits = [
-                    {**hit, **basic_bib_metadata(hit["bnum"])} for hit in self.hits
-                ]
-                self.found = len([h for h in self.hits if h["found"]])
-
-        self.hits_length = 0
-        if report is not None and report.get("metric_details") is not None:
-            self.hits_length = list(report["metric_details"].values())[0].get(
-                "relevant_docs_retrieved"
-            )
+    @property
+    def matching_documents(self):
+        return unpack(self._matching_documents)
 
-        self.run = kwargs.get("run")
+    @matching_documents.setter
+    def matching_documents(self, documents):
+        self._matching_documents = pack(documents)
+
+    @property
+    def query(self):
+        """The ES query the app generated for the target"""
+        return unpack(self._query)
+
+    @query.setter
+    def query(self, query):
+        self._query = pack(query)
+
+    @property
+    def metric_score(self):
+        return self.response["metric_score"]
+
+    def report(self):
+        if self.response is None or not self.response.get("details"):
+            return None
+        return self.response["details"]["report"]
+
+    @property
+    def hits(self):
+        """Rated hits, enriched with bib metadata (fetched on first access)"""
+        report = self.report()
+        if report is None:
+            return None
+        if self._hits is None:
+            self._hits = [
+                {
+                    "bnum": hit["hit"]["_id"],
+                    "found": hit.get("rating") is not None,
+                    **bib_metadata(hit["hit"]["_id"]),
+                }
+                for hit in report["hits"]
+            ]
+        return self._hits
+
+    @property
+    def found(self):
+        report = self.report()
+        if report is None:
+            # Responses summarized from history carry only the count:
+            return None if self.response is None else self.response.get("found")
+        return len([hit for hit in report["hits"] if hit.get("rating") is not None])
+
+    @property
+    def hits_length(self):
+        report = self.report()
+        if report is None or report.get("metric_details") is None:
+            return 0
+        return list(report["metric_details"].values())[0].get("relevant_docs_retrieved")
 
     def metric_score_formatted(self):
         return format_float(self.metric_score)
 
+    def load_test_stats(self):
+        """This target's results from the run's load test, if any"""
+        load_test = getattr(self.run, "load_test", None)
+        if not load_test:
+            return None
+        return load_test["targets"].get(self.target.key)
+
+    def latency_samples(self):
+        """Latency samples (ms), falling back on elapsed for older manifests"""
+        return self.elapsed_samples or [self.elapsed]
+
     def elapsed_formatted(self):
-        return format_float(self.ellpased)
+        return format_float(self.elapsed)
+
+    def for_run(self, run):
+        """A copy of this response attributed to run, sharing its payloads"""
+        response = SearchTargetResponse(
+            target=self.target,
+            elapsed=self.elapsed,
+            elapsed_samples=self.elapsed_samples,
+            count=self.count,
+            response=self.response,
+            run=run,
+            profile=self.profile,
+        )
+        response._matching_documents = self._matching_documents
+        response._query = self._query
+        return response
 
     def jsonable(self):
         return {
             "response": dict(self.response),
             "target": self.target.jsonable(),
             "elapsed": self.elapsed,
+            "elapsed_samples": self.elapsed_samples,
             "matching_documents": self.matching_documents,
+            "query": self.query,
             "count": self.count,
+            "profile": self.profile,
         }
 
     @staticmethod
     def from_json(obj, run=None):
-        props = {**obj}
-        props["target"] = (
-            obj["target"]
-            if type(obj["target"]) == SearchTarget
-            else SearchTarget.from_json(obj.get("target"))
+        return SearchTargetResponse(
+            target=(
+                obj["target"]
+                if type(obj["target"]) == SearchTarget
+                else SearchTarget.from_json(obj.get("target"))
+            ),
+            elapsed=obj["elapsed"],
+            elapsed_samples=obj.get("elapsed_samples"),
+            matching_documents=obj.get("matching_documents"),
+            query=obj.get("query"),
+            profile=obj.get("profile"),
+            count=obj["count"],
+            response=obj.get("response"),
+            run=run,
         )
-        props["run"] = run
-        props["raw"] = obj
-        search_target_response = SearchTargetResponse(**props)
-        return search_target_response
@@ -0,0 +1,81 @@
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("progressive")
+
+# When sentinels are evaluated (see select_sentinels), overridden by
+# config.yaml's progressive settings:
+DEFAULT_RULE = {"coverage": 0.9, "min_sentinels": 5, "min_history": 5}
+
+
+def change_counts(runs):
+    """
+    The number of times each target's score changed between consecutive runs
+    (in commit order), and the number of consecutive pairs compared
+    """
+    counts = {}
+    for previous, current in zip(runs, runs[1:]):
+        previous_scores = {r.target.key: r.metric_score for r in previous.responses}
+        for response in current.responses:
+            key = response.target.key
+            counts.setdefault(key, 0)
+            if key in previous_scores and previous_scores[key] != response.metric_score:
+                counts[key] += 1
+    return counts, max(len(runs) - 1, 0)
+
+
+def select_sentinels(
+    targets, runs, coverage=None, min_sentinels=None, min_history=None
+):
+    """
+    The targets to evaluate first: those whose scores changed most often in
+    runs, enough of them to account for `coverage` of all past score changes
+    (and at least min_sentinels), plus any targets the runs don't include.
+    Returns (sentinels, explanation); sentinels is None if there are fewer
+    than min_history pairs of runs to learn from, or if every target would be
+    a sentinel.
+    """
+    coverage = DEFAULT_RULE["coverage"] if coverage is None else coverage
+    min_sentinels = (
+        DEFAULT_RULE["min_sentinels"] if min_sentinels is None else min_sentinels
+    )
+    min_history = DEFAULT_RULE["min_history"] if min_history is None else min_history
+
+    counts, pairs = change_counts(runs)
+    if pairs < min_history:
+        return None, f"Only {pairs} pairs of runs to learn from (need {min_history})"
+
+    # Targets with no history can't be judged by it:
+    unknown = [t for t in targets if t.key not in counts]
+    known = sorted(
+        [t for t in targets if t.key in counts], key=lambda t: -counts[t.key]
+    )
+    total_changes = sum(counts[t.key] for t in known)
+
+    sentinels = []
+    covered = 0
+    for target in known:
+        if len(sentinels) >= min_sentinels and covered >= coverage * total_changes:
+            break
+        sentinels.append(target)
+        covered += counts[target.key]
+    sentinels += unknown
+
+    if len(sentinels) >= len(targets):
+        return None, "Every target is a sentinel"
+    covered_pct = 100 * covered / total_changes if total_changes > 0 else 100
+    return sentinels, (
+        f"{len(sentinels)} of {len(targets)} targets, accounting for "
+        f"{covered_pct:.0f}% of {total_changes} score changes in {pairs + 1} runs"
+    )
+
+
+def collect_sentinels(run, sentinels, **kwargs):
+    """Collect run's data for just the sentinel targets"""
+    app_config = run.app_config
+    targets = app_config.targets
+    app_config.targets = sentinels
+    try:
+        run.collect_data(**kwargs)
+    finally:
+        app_config.targets = targets
+    return run
@@ -0,0 +1,118 @@
+import json
+import time
+
+from datetime import datetime
+
+from lib.filestore import JsonStore
+from lib.models.app_config import AppConfig
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("pushes")
+
+# Seconds between checks (which read from S3) of whether a running push has
+# been superseded:
+CANCEL_CHECK_INTERVAL = 15
+
+
+class PushCancelledException(Exception):
+    pass
+
+
+class PushStore(JsonStore):
+    """
+    The most recent push received for an app, shared by the webhook and
+    worker invocations:
+
+        srt/APP/pushes/latest.json
+    """
+
+    def __init__(self, app_config):
+        super().__init__(
+            app_config.local_temp_path("pushes"), f"srt/{app_config.app_name}/pushes"
+        )
+
+    def record(self, sha, ref=None):
+        received = datetime.now()
+        push = {
+            "push_id": f"{received:%Y%m%dT%H%M%S%f}-{sha[0:12]}",
+            "sha": sha,
+            "ref": ref,
+            "received": received.isoformat(),
+        }
+        self.write("latest.json", json.dumps(push, indent=2))
+        return push
+
+    def latest(self):
+        return self.read("latest.json")
+
+
+def push_event(app, push):
+    return {
+        "command": "test-push",
+        "app": app,
+        "push_id": push["push_id"],
+        "sha": push["sha"],
+    }
+
+
+def receive_push(app, sha, queue, ref=None):
+    """
+    Record a push as the app's newest and queue a test-push event for it.
+    Events for older pushes still in the queue become no-ops, so a burst of
+    pushes is evaluated once, at its newest HEAD.
+    """
+    push = PushStore(AppConfig.for_name(app)).record(sha, ref)
+    logger.info(f"Queueing test-latest of {app}@{sha} ({push['push_id']})")
+    queue.send(push_event(app, push))
+    return push
+
+
+class CancelToken:
+    """
+    Checks (at most once per interval seconds) whether a newer push than
+    push_id has been received for the app
+    """
+
+    def __init__(self, app_config, push_id, interval=None):
+        self.store = PushStore(app_config)
+        self.push_id = push_id
+        self.interval = CANCEL_CHECK_INTERVAL if interval is None else interval
+        self.last_checked = None
+
+    def superseding_push(self):
+        """The newer push, if one was received"""
+        latest = self.store.latest()
+        if latest is not None and latest["push_id"] != self.push_id:
+            return latest
+        return None
+
+    def check(self, *args):
+        """Raise PushCancelledException if superseded (accepts a checkpointed run)"""
+        now = time.monotonic()
+        if self.last_checked is not None and now - self.last_checked < self.interval:
+            return
+        self.last_checked = now
+        newer = self.superseding_push()
+        if newer is not None:
+            raise PushCancelledException(
+                f"Superseded by push of {newer['sha']} ({newer['push_id']})"
+            )
+
+
+def handle_push_event(event, run_test_latest):
+    """
+    Run test-latest for a queued push unless a newer push was received since,
+    cancelling it (between targets) if one is received while it runs.
+    run_test_latest is called with app, head (the pushed sha), and cancel.
+    """
+    app_config = AppConfig.for_name(event["app"])
+    token = CancelToken(app_config, event["push_id"])
+    newer = token.superseding_push()
+    if newer is not None:
+        logger.info(
+            f"Skipping push {event['push_id']}; Superseded by {newer['push_id']}"
+        )
+        return False
+
+    run_test_latest(app=event["app"], head=event["sha"], cancel=token.check)
+    return True
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import pystache
+import re
+
+from lib.utils import format_float
+
+PARTIAL_TAG = re.compile(r"\{\{>\s*([\w-]+)\s*\}\}")
+
+# Parsed templates, by (search_dir, name):
+_compiled = {}
+
+
+def expand_partials(name, search_dir="./templates", including=()):
+    """The named template's source, with partial tags replaced by their source"""
+    if name in including:
+        raise ValueError(f"Recursive partial {name} in {' > '.join(including)}")
+    with open(os.path.join(search_dir, f"{name}.mustache")) as f:
+        source = f.read()
+    return PARTIAL_TAG.sub(
+        lambda match: expand_partials(
+            match.group(1), search_dir, including=including + (name,)
+        ),
+        source,
+    )
+
+
+def compile_template(name, search_dir="./templates"):
+    """
+    Parse the named template (with its partials inlined) once per process, so
+    that rendering doesn't re-read and re-parse partials for every item of a
+    section
+    """
+    key = (search_dir, name)
+    if key not in _compiled:
+        _compiled[key] = pystache.parse(expand_partials(name, search_dir))
+    return _compiled[key]
+
+
+class TemplateRenderer:
+    def __init__(self, search_dir="./templates"):
+        self.search_dir = search_dir
+        self.renderer = pystache.Renderer()
+
+    def render(self, name, *context):
+        return self.renderer.render(compile_template(name, self.search_dir), *context)
+
+
+def write_asset(basedir, name, extension, content):
+    """
+    Write content (text or bytes) to BASEDIR/assets/NAME.HASH.EXTENSION (so
+    that it can be cached indefinitely), removing previous versions. Returns
+    the path relative to basedir.
+    """
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    digest = hashlib.sha256(data).hexdigest()[0:12]
+    filename = f"{name}.{digest}.{extension}"
+    directory = os.path.join(basedir, "assets")
+    os.makedirs(directory, exist_ok=True)
+    for existing in os.listdir(directory):
+        if existing.startswith(f"{name}.") and existing != filename:
+            os.remove(os.path.join(directory, existing))
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return f"assets/{filename}"
+
+
+def run_view(run):
+    """The values templates need for a run, computed once per report"""
+    return {
+        "commit_description": run.commit_description,
+        "change_url": run.change_url(),
+        "app_version": run.app_version(),
+        "commit_date_formatted": (
+            run.commit_date_formatted() if run.commit_date is not None else None
+        ),
+        "load_test": run.load_test,
+    }
+
+
+def result_view(result, run_views):
+    return {
+        "run": run_views[id(result.run)],
+        "metric_score_formatted": result.metric_score_formatted(),
+        "elapsed": result.elapsed,
+        "load_test_stats": result.load_test_stats(),
+        "found": result.found,
+        "count": result.count,
+        "profile": result.profile,
+        "matching_documents": result.matching_documents,
+    }
+
+
+def target_nav_view(target, number, thumb=None):
+    """
+    The values the left nav needs for a target (thumb being its offset in
+    the thumbnail sprite)
+    """
+    return {
+        "target": {
+            "key": target.key,
+            "search_scope": target.search_scope,
+            "q": target.q,
+            "metric": target.metric,
+            "metric_at": target.metric_at,
+        },
+        "number": number,
+        "thumb": thumb,
+    }
+
+
+def target_view(target, number, results, run_views, graph=None):
+    view = target_nav_view(target, number)
+    view["graph"] = graph
+    view["target"].update(
+        {
+            "notes": target.notes,
+            "qa_url": target.qa_url,
+            "production_url": target.production_url,
+            "relevant_records": target.relevant_records(),
+            "relevant_length": target.relevant_length(),
+        }
+    )
+    view["results"] = [result_view(result, run_views) for result in results]
+    return view
+
+
+def run_summary_view(run, run_views, average_score, average_elapsed):
+    return {
+        "run": run_views[id(run)],
+        "average_score": format_float(average_score),
+        "average_elapsed": int(average_elapsed),
+    }
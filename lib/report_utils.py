@@ -4,23 +4,25 @@ import pystache
 import requests
 
 from lib.file_cache_decorator import file_cached
-from lib.utils import average_by_index
+from lib.utils import average_by_index, offline_mode
 from lib.filestore import upload_dir
+from lib.tracing import span
 from nypl_py_utils.functions.log_helper import create_log
 
 logger = create_log("S3")
 
 
 def upload_pending_report(path, log, done=False):
-    basedir = "/tmp/srt/pending-report"
+    basedir = f"/tmp/srt/pending-report/{path}"
     os.makedirs(basedir, exist_ok=True)
     template_vars = {
         "log": log,
         "build_time": datetime.now().strftime("%c"),
         "working": not done,
     }
-    renderer = pystache.Renderer(search_dirs="./templates")
-    html = renderer.render("{{>pending_report}}", template_vars)
+    with span("render_templates"):
+        renderer = pystache.Renderer(search_dirs="./templates")
+        html = renderer.render("{{>pending_report}}", template_vars)
     with open(f"{basedir}/index.html", "w") as f:
         f.write(html)
     upload_dir(basedir, f"srt/{path}/", public=True)
@@ -62,6 +64,16 @@ def normalize_overall_run_data(results):
     return overall_scores, overall_elapsed, overall_elapsed_relative
 
 
+def bib_metadata(bnum):
+    """
+    Get basic metadata for the bnum, which is served only from the cache when
+    offline (so as to not cache a missing result)
+    """
+    if offline_mode():
+        return basic_bib_metadata.cache.get((bnum,), {"bnum": bnum, "missing": True})
+    return basic_bib_metadata(bnum)
+
+
 @file_cached
 def basic_bib_metadata(bnum):
     doc = None
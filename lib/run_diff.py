@@ -0,0 +1,240 @@
+import json
+import numpy as np
+import os
+
+from statistics import median
+
+# Persistence of rank-biased overlap: the weight of rank d is proportional to
+# RBO_PERSISTENCE ** (d - 1), so ~86% of the weight falls on the top 10:
+RBO_PERSISTENCE = 0.9
+
+
+# Target keys (which include relevant ids) are truncated to this in tables:
+KEY_WIDTH = 60
+
+
+class RunDiffException(Exception):
+    pass
+
+
+def manifest_path(app_config, file_key):
+    """
+    Path of the manifest for file_key (a commit, a unique prefix of one,
+    "local", or "latest")
+    """
+    directory = app_config.local_temp_path("manifests")
+    path = os.path.join(directory, f"{file_key}.json")
+    if os.path.exists(path):
+        return path
+
+    matches = (
+        [name for name in os.listdir(directory) if name.startswith(file_key)]
+        if os.path.isdir(directory)
+        else []
+    )
+    if len(matches) == 1:
+        return os.path.join(directory, matches[0])
+    if len(matches) > 1:
+        raise RunDiffException(f"{file_key} is ambiguous: {', '.join(sorted(matches))}")
+    raise RunDiffException(f"No manifest found for {file_key}")
+
+
+def load_manifest(app_config, file_key):
+    with open(manifest_path(app_config, file_key)) as f:
+        return json.load(f)
+
+
+def rank_matrix(id_lists, vocabulary, depth):
+    """
+    Encode lists of document ids as a len(id_lists) x depth matrix of ids'
+    indices in vocabulary, padded with -1
+    """
+    matrix = np.full((len(id_lists), depth), -1, dtype=np.int64)
+    lengths = np.array([min(len(ids), depth) for ids in id_lists], dtype=np.int64)
+    if lengths.sum() == 0:
+        return matrix
+    rows = np.repeat(np.arange(len(id_lists)), lengths)
+    columns = np.concatenate([np.arange(length) for length in lengths])
+    flat = [doc_id for ids in id_lists for doc_id in ids[0:depth]]
+    matrix[rows, columns] = np.searchsorted(vocabulary, flat)
+    return matrix
+
+
+def rank_biased_overlap(a, b, p=RBO_PERSISTENCE):
+    """
+    Extrapolated rank-biased overlap (Webber et al. 2010) of each row of
+    rank matrices a and b (ids of distinct documents, padded with -1), which
+    is 1 for identical rankings and 0 for disjoint ones. Each row is evaluated
+    to the depth of its longer ranking; two empty rankings are identical.
+    """
+    n, depth = a.shape
+    # matches[t, i, j]: a[t, i] is b[t, j]
+    matches = (a[:, :, None] == b[:, None, :]) & (a[:, :, None] >= 0)
+    target, i, j = np.nonzero(matches)
+    # A shared document counts towards the overlap at every depth including
+    # both of its ranks:
+    first_depth = np.zeros((n, depth), dtype=np.int64)
+    np.add.at(first_depth, (target, np.maximum(i, j)), 1)
+    overlap = np.cumsum(first_depth, axis=1)
+
+    depths = np.arange(1, depth + 1)
+    row_depths = np.maximum((a >= 0).sum(axis=1), (b >= 0).sum(axis=1))
+    agreement = overlap / depths
+    within = depths[None, :] <= row_depths[:, None]
+    summed = (agreement * p**depths * within).sum(axis=1)
+    last = agreement[np.arange(n), np.maximum(row_depths - 1, 0)]
+    rbo = last * p ** row_depths.astype(float) + (1 - p) / p * summed
+    return np.where(row_depths == 0, 1.0, rbo)
+
+
+def document_ids(response):
+    return [doc["_id"] for doc in response.get("matching_documents") or []]
+
+
+def latency(response):
+    return median(response.get("elapsed_samples") or [response["elapsed"]])
+
+
+def diff_manifests(manifest_a, manifest_b, depth=None):
+    """
+    Compare two manifests' responses for the targets they share: metric score
+    deltas, rank-biased overlap and set differences of matching document ids
+    (to depth, by default the longest list), total hits and latency deltas.
+    """
+    responses_a = {r["target"]["key"]: r for r in manifest_a["responses"]}
+    responses_b = {r["target"]["key"]: r for r in manifest_b["responses"]}
+    keys = [key for key in responses_b if key in responses_a]
+    a = [responses_a[key] for key in keys]
+    b = [responses_b[key] for key in keys]
+
+    scores_a = np.array([r["response"]["metric_score"] for r in a], dtype=float)
+    scores_b = np.array([r["response"]["metric_score"] for r in b], dtype=float)
+    counts_a = np.array([r["count"] for r in a], dtype=np.int64)
+    counts_b = np.array([r["count"] for r in b], dtype=np.int64)
+    latency_a = np.array([latency(r) for r in a], dtype=float)
+    latency_b = np.array([latency(r) for r in b], dtype=float)
+
+    ids_a = [document_ids(r) for r in a]
+    ids_b = [document_ids(r) for r in b]
+    if depth is None:
+        depth = max([len(ids) for ids in ids_a + ids_b] + [1])
+    vocabulary = np.unique(
+        np.array([doc_id for ids in ids_a + ids_b for doc_id in ids] + [""])
+    )
+    ranks_a = rank_matrix(ids_a, vocabulary, depth)
+    ranks_b = rank_matrix(ids_b, vocabulary, depth)
+
+    in_b = (
+        (ranks_a[:, :, None] == ranks_b[:, None, :]) & (ranks_a[:, :, None] >= 0)
+    ).any(axis=2)
+    in_a = (
+        (ranks_b[:, :, None] == ranks_a[:, None, :]) & (ranks_b[:, :, None] >= 0)
+    ).any(axis=2)
+    removed = ((ranks_a >= 0) & ~in_b).sum(axis=1)
+    added = ((ranks_b >= 0) & ~in_a).sum(axis=1)
+    rbo = rank_biased_overlap(ranks_a, ranks_b)
+
+    score_delta = scores_b - scores_a
+    targets = [
+        {
+            "key": key,
+            "score_a": scores_a[ind].item(),
+            "score_b": scores_b[ind].item(),
+            "score_delta": round(score_delta[ind].item(), 4),
+            "rbo": round(rbo[ind].item(), 4),
+            "added": added[ind].item(),
+            "removed": removed[ind].item(),
+            "count_delta": (counts_b[ind] - counts_a[ind]).item(),
+            "latency_delta_ms": (latency_b[ind] - latency_a[ind]).item(),
+        }
+        for ind, key in enumerate(keys)
+    ]
+
+    return {
+        "a": manifest_a.get("file_key") or manifest_a["commit_id"],
+        "b": manifest_b.get("file_key") or manifest_b["commit_id"],
+        "depth": depth,
+        "targets": targets,
+        "only_in_a": [key for key in responses_a if key not in responses_b],
+        "only_in_b": [key for key in responses_b if key not in responses_a],
+        "summary": {
+            "targets": len(keys),
+            "scores_changed": int((score_delta != 0).sum()),
+            "mean_score_a": round(scores_a.mean().item(), 4) if len(keys) else None,
+            "mean_score_b": round(scores_b.mean().item(), 4) if len(keys) else None,
+            "mean_rbo": round(rbo.mean().item(), 4) if len(keys) else None,
+            "latency_delta_ms": (latency_b.sum() - latency_a.sum()).item(),
+        },
+    }
+
+
+def fmt(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+def format_table(diff, changed_only=False):
+    """Render a diff as a plain-text table, most changed targets first"""
+    targets = diff["targets"]
+    if changed_only:
+        targets = [
+            t
+            for t in targets
+            if t["score_delta"] != 0 or t["added"] > 0 or t["removed"] > 0
+        ]
+    targets = sorted(targets, key=lambda t: (-abs(t["score_delta"]), t["rbo"]))
+
+    def signed(value):
+        formatted = str(value) if isinstance(value, int) else fmt(value)
+        return f"+{formatted}" if value > 0 else formatted
+
+    columns = [
+        "Target",
+        "Score A",
+        "Score B",
+        "Delta",
+        "RBO",
+        "+Docs",
+        "-Docs",
+        "Hits Δ",
+        "Latency Δ",
+    ]
+    rows = [
+        [
+            t["key"][0:KEY_WIDTH],
+            fmt(t["score_a"]),
+            fmt(t["score_b"]),
+            signed(t["score_delta"]),
+            fmt(t["rbo"]),
+            str(t["added"]),
+            str(t["removed"]),
+            signed(t["count_delta"]),
+            f"{signed(round(t['latency_delta_ms']))}ms",
+        ]
+        for t in targets
+    ]
+    widths = [
+        max([len(row[i]) for row in rows + [columns]]) for i in range(len(columns))
+    ]
+
+    def line(row):
+        return "  ".join(
+            value.ljust(widths[i]) if i == 0 else value.rjust(widths[i])
+            for i, value in enumerate(row)
+        )
+
+    summary = diff["summary"]
+    lines = [
+        f"{diff['a']} => {diff['b']}: {summary['scores_changed']} of {summary['targets']}"
+        f" scores changed, mean score {fmt(summary['mean_score_a'])}"
+        f" => {fmt(summary['mean_score_b'])}, mean RBO"
+        f" {fmt(summary['mean_rbo'])} (depth {diff['depth']}), latency"
+        f" {signed(round(summary['latency_delta_ms']))}ms",
+        "",
+        line(columns),
+        line(["-" * width for width in widths]),
+    ] + [line(row) for row in rows]
+    if len(diff["only_in_a"]) > 0:
+        lines.append(f"Only in {diff['a']}: {', '.join(diff['only_in_a'])}")
+    if len(diff["only_in_b"]) > 0:
+        lines.append(f"Only in {diff['b']}: {', '.join(diff['only_in_b'])}")
+    return "\n".join(lines)
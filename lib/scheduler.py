@@ -0,0 +1,148 @@
+import os
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+from lib import limits
+from lib.tracing import span
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("scheduler")
+
+# Commands that can be scheduled (i.e. that need no interactive input or
+# per-invocation paths):
+SCHEDULABLE_COMMANDS = [
+    "test-all",
+    "test-latest",
+    "rebuild-report",
+    "build",
+    "merge-manifests",
+    "load-test",
+]
+
+
+class SchedulerException(Exception):
+    pass
+
+
+def parse_jobs(specs, app, applications):
+    """
+    Parse job specs into (app, command) tuples. A spec is APP:COMMAND, or a
+    bare COMMAND, which applies to app (or to every application when app is
+    "all").
+    """
+    jobs = []
+    for spec in specs:
+        if ":" in spec:
+            spec_app, command = spec.split(":", 1)
+            apps = [spec_app]
+        else:
+            command = spec
+            apps = applications if app == "all" else [app]
+
+        for job_app in apps:
+            if job_app not in applications:
+                raise SchedulerException(f"Unknown application: {job_app}")
+            if command not in SCHEDULABLE_COMMANDS:
+                raise SchedulerException(
+                    f"Can't schedule {command}; Choose from {', '.join(SCHEDULABLE_COMMANDS)}"
+                )
+            jobs.append((job_app, command))
+    if len(jobs) == 0:
+        raise SchedulerException("No jobs given, e.g. discovery-api:test-latest")
+    return jobs
+
+
+def default_max_initializations():
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class Scheduler:
+    """
+    Runs jobs for several apps concurrently: one thread per app, running that
+    app's jobs in order (since later jobs, e.g. rebuild-report, may depend on
+    earlier ones, and an app's jobs share its workspace in /tmp/srt/APP).
+
+    `commands` maps command names to functions taking the job's kwargs (e.g.
+    main.run_test_latest). Across all apps, at most max_initializations
+    apps are initialized at once, and at most max_es_requests requests are in
+    flight per ES cluster (see lib.limits).
+
+    Since apps' jobs share a process, nothing they do may assume it's the only
+    app being evaluated: files go in the app's own temp dir (or a path of
+    their own, e.g. per report), per-run state such as the es config is kept
+    per thread, and process-wide state (e.g. pyplot, file caches) is locked.
+    """
+
+    def __init__(self, commands, max_initializations=None, max_es_requests=None):
+        self.commands = commands
+        self.max_initializations = max_initializations or default_max_initializations()
+        self.max_es_requests = max_es_requests
+
+    def run(self, jobs, **kwargs):
+        """
+        Run jobs (a list of (app, command) tuples), passing kwargs to each
+        command. Returns a summary per app (in order of first appearance) of
+        each job's status and seconds, and the app's wall time.
+        """
+        jobs_by_app = {}
+        for app, command in jobs:
+            jobs_by_app.setdefault(app, []).append(command)
+
+        limits.configure(
+            initializations=self.max_initializations,
+            es_requests_per_cluster=self.max_es_requests,
+        )
+        logger.info(
+            f"Scheduling {len(jobs)} jobs for {len(jobs_by_app)} apps"
+            f" (max {self.max_initializations} initializations,"
+            f" {self.max_es_requests or 'unlimited'} ES requests per cluster)"
+        )
+        try:
+            with ThreadPoolExecutor(
+                max_workers=len(jobs_by_app), thread_name_prefix="app"
+            ) as executor:
+                futures = [
+                    executor.submit(self.run_app, app, commands, **kwargs)
+                    for app, commands in jobs_by_app.items()
+                ]
+                return [future.result() for future in futures]
+        finally:
+            limits.configure()
+
+    def run_app(self, app, commands, **kwargs):
+        summary = {"app": app, "jobs": [], "wall_seconds": 0, "ok": True}
+        start = time.perf_counter()
+        with span(f"app {app}", category="app"):
+            for command in commands:
+                job = {"command": command, "status": "skipped", "seconds": 0}
+                summary["jobs"].append(job)
+                if not summary["ok"]:
+                    continue
+
+                logger.info(f"[{app}] Starting {command}")
+                job_start = time.perf_counter()
+                try:
+                    self.commands[command](app=app, **kwargs)
+                    job["status"] = "ok"
+                except (Exception, SystemExit) as e:
+                    # Later jobs may depend on this one, so skip them (and a
+                    # command that exits only fails its app's schedule):
+                    logger.error(f"[{app}] {command} failed: {e}")
+                    traceback.print_exc()
+                    job["status"] = "failed"
+                    summary["ok"] = False
+                job["seconds"] = round(time.perf_counter() - job_start, 1)
+                logger.info(f"[{app}] {command} {job['status']} in {job['seconds']}s")
+        summary["wall_seconds"] = round(time.perf_counter() - start, 1)
+        return summary
+
+
+def format_summary(summaries):
+    lines = []
+    for summary in summaries:
+        lines.append(f"{summary['app']}: {summary['wall_seconds']}s wall time")
+        for job in summary["jobs"]:
+            lines.append(f"  {job['command']}: {job['status']} ({job['seconds']}s)")
+    return "\n".join(lines)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import re
+
+from lib.filestore import download_dir, write_to_s3
+from lib.history import upload_history
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("sharding")
+
+SHARD_FILE_KEY_PATTERN = re.compile(
+    r"^(?P<file_key>.+)\.shard-(?P<index>\d+)-of-(?P<count>\d+)$"
+)
+
+
+class ManifestMergeException(Exception):
+    pass
+
+
+def parse_shard(value):
+    """Parse a shard spec like "2/4" into (index, count)"""
+    match = re.match(r"^(\d+)/(\d+)$", value.strip())
+    if match is None:
+        raise ValueError(f"Invalid shard {value}; Expected INDEX/COUNT, e.g. 1/4")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or index < 1 or index > count:
+        raise ValueError(f"Invalid shard {value}; INDEX must be in 1..COUNT")
+    return index, count
+
+
+def parse_shard_file_key(file_key):
+    """Returns (file_key, index, count) for a shard file key, else None"""
+    match = SHARD_FILE_KEY_PATTERN.match(file_key)
+    if match is None:
+        return None
+    return match.group("file_key"), int(match.group("index")), int(match.group("count"))
+
+
+def shard_file_key(commit_id, index, count):
+    return f"{commit_id}.shard-{index}-of-{count}"
+
+
+def target_shard(target, count):
+    """The (1-based) shard a target belongs to, stable across processes"""
+    digest = hashlib.sha1(target.key.encode("utf-8")).hexdigest()
+    return int(digest, 16) % count + 1
+
+
+def shard_targets(targets, index, count):
+    """The targets in shard `index` of `count`, in their configured order"""
+    if count < 1 or index < 1 or index > count:
+        raise ValueError(f"Invalid shard {index}/{count}")
+    return [target for target in targets if target_shard(target, count) == index]
+
+
+def merge_problems(manifests, targets):
+    """
+    Describe targets that are missing from, or duplicated across, the given
+    manifests (for the same run)
+    """
+    target_keys = [target.key for target in targets]
+    keys = [
+        response["target"]["key"]
+        for manifest in manifests
+        for response in manifest["responses"]
+    ]
+
+    problems = []
+    duplicates = sorted(set([key for key in keys if keys.count(key) > 1]))
+    if len(duplicates) > 0:
+        problems.append(f"Duplicated targets: {', '.join(duplicates)}")
+    missing = [key for key in target_keys if key not in keys]
+    if len(missing) > 0:
+        problems.append(f"Missing targets: {', '.join(missing)}")
+    return problems
+
+
+def merge_manifests(manifests, targets, file_key=None, strict=True):
+    """
+    Combine manifests for the same commit (e.g. one per shard) into a single
+    manifest with responses in the order of the given targets. Responses for
+    targets not among targets are dropped.
+
+    If strict, raises ManifestMergeException if any targets are missing or
+    duplicated.
+    """
+    commit_ids = set([manifest["commit_id"] for manifest in manifests])
+    if len(commit_ids) != 1:
+        raise ManifestMergeException(
+            f"Can't merge manifests for commits {sorted(commit_ids)}"
+        )
+
+    if strict:
+        problems = merge_problems(manifests, targets)
+        if len(problems) > 0:
+            raise ManifestMergeException("; ".join(problems))
+
+    responses_by_key = {}
+    for manifest in manifests:
+        for response in manifest["responses"]:
+            target = response["target"]
+            responses_by_key.setdefault(target["key"], response)
+
+    merged = {
+        **manifests[0],
+        "file_key": file_key or manifests[0]["commit_id"],
+        "run_date": min(manifest["run_date"] for manifest in manifests),
+        "responses": [
+            responses_by_key[target.key]
+            for target in targets
+            if target.key in responses_by_key
+        ],
+    }
+
+    trace_summaries = [m["trace_summary"] for m in manifests if m.get("trace_summary")]
+    if len(trace_summaries) > 0:
+        merged["trace_summary"] = {}
+        for trace_summary in trace_summaries:
+            for phase, stats in trace_summary.items():
+                entry = merged["trace_summary"].setdefault(
+                    phase, {"count": 0, "total_ms": 0}
+                )
+                entry["count"] += stats["count"]
+                entry["total_ms"] = round(entry["total_ms"] + stats["total_ms"], 1)
+
+    return merged
+
+
+def merge_shard_manifests(app_config):
+    """
+    Combine the shard manifests in srt/APP/shards (named
+    FILE_KEY.shard-INDEX-of-COUNT.json) into one manifest per FILE_KEY, in the
+    order of app_config's loaded targets, after validating that no shards or
+    targets are missing and no targets are duplicated.
+
+    Returns the number of manifests that could not be merged.
+    """
+    # lib.models imports this module:
+    from lib.models.run import Run
+
+    targets = app_config.targets
+
+    directory = app_config.local_temp_path("shards")
+    download_dir(f"srt/{app_config.app_name}/shards", directory)
+
+    shards_by_file_key = {}
+    for filename in sorted(os.listdir(directory)):
+        parsed = (
+            parse_shard_file_key(filename[0:-5]) if filename.endswith(".json") else None
+        )
+        if parsed is None:
+            continue
+        file_key, index, count = parsed
+        shards_by_file_key.setdefault(file_key, {}).setdefault(count, {})[index] = (
+            os.path.join(directory, filename)
+        )
+
+    failures = 0
+    for file_key, shards_by_count in shards_by_file_key.items():
+        if len(shards_by_count) > 1:
+            logger.error(
+                f"Not merging {file_key}: Found shards of different counts:"
+                f" {', '.join(str(count) for count in sorted(shards_by_count))}"
+            )
+            failures += 1
+            continue
+
+        count, paths = next(iter(shards_by_count.items()))
+        missing_shards = [str(i) for i in range(1, count + 1) if i not in paths]
+        if len(missing_shards) > 0:
+            logger.error(
+                f"Not merging {file_key}: Missing shards {', '.join(missing_shards)} of {count}"
+            )
+            failures += 1
+            continue
+
+        manifests = []
+        for index in range(1, count + 1):
+            with open(paths[index]) as f:
+                manifests.append(json.load(f))
+        try:
+            merged = merge_manifests(manifests, targets, file_key=file_key)
+        except ManifestMergeException as e:
+            logger.error(f"Not merging {file_key}: {e}")
+            failures += 1
+            continue
+
+        path = Run.from_json(app_config, merged).save_manifest()
+        logger.info(f"Merged {count} shards of {file_key} into {path}")
+        if file_key not in ["local", "latest"]:
+            write_to_s3(f"srt/{app_config.app_name}/manifests/{file_key}.json", path)
+    upload_history(app_config)
+
+    return failures
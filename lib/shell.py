@@ -0,0 +1,210 @@
+import collections
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from lib.tracing import tracer
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("shell")
+
+# Seconds before a command is killed, by command name (overridden by an
+# app's config.yaml command_timeouts):
+DEFAULT_TIMEOUTS = {
+    "initialize": 1800,
+    "unpackage": 600,
+    "get-query": 120,
+    "get-config": 300,
+    "git": 60,
+}
+DEFAULT_TIMEOUT = 600
+
+# Seconds between SIGTERM and SIGKILL of a timed-out command:
+KILL_GRACE_PERIOD = 5
+
+# Lines of output included in the message of a failed command:
+OUTPUT_TAIL_LINES = 20
+
+
+class ShellException(Exception):
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+class ShellTimeoutException(ShellException):
+    pass
+
+
+class ShellResult:
+    def __init__(
+        self, name, args, returncode, stdout, output_tail, duration, timed_out
+    ):
+        self.name = name
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.output_tail = output_tail
+        self.duration = duration
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    def describe(self):
+        status = (
+            f"timed out after {self.duration:.1f}s"
+            if self.timed_out
+            else f"exited {self.returncode} after {self.duration:.1f}s"
+        )
+        tail = "\n".join(self.output_tail)
+        return f"{self.name} ({' '.join(self.args)}) {status}" + (
+            f":\n{tail}" if tail else ""
+        )
+
+
+def command_name(args):
+    """Name of the command (e.g. "get-query" for bash .../get-query.sh)"""
+    for arg in args:
+        base = os.path.basename(str(arg))
+        if base in ["bash", "sh", "env"] or base.startswith("-"):
+            continue
+        return base[:-3] if base.endswith(".sh") else base
+    return "shell"
+
+
+class ShellProcess:
+    """
+    A running command, with its stdout and stderr streamed to the log line by
+    line at log_level (None to not log them) and stdout optionally captured.
+    Start several to run them concurrently, then wait() on each.
+    """
+
+    def __init__(
+        self,
+        *args,
+        name=None,
+        timeout=None,
+        cwd=None,
+        env=None,
+        capture=True,
+        log_level=logging.DEBUG,
+    ):
+        self.args = [str(arg) for arg in args]
+        self.name = name or command_name(self.args)
+        self.timeout = (
+            timeout
+            if timeout is not None
+            else DEFAULT_TIMEOUTS.get(self.name, DEFAULT_TIMEOUT)
+        )
+        self.capture = capture
+        self.log_level = log_level
+
+        self._stdout = []
+        self._tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+        self._tail_lock = threading.Lock()
+
+        logger.debug(f"CMD: {' '.join(self.args)} (timeout {self.timeout}s)")
+        self.start = time.perf_counter()
+        self.process = subprocess.Popen(
+            self.args,
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            # A session of its own, so that a timeout kills its children too:
+            start_new_session=True,
+        )
+        self._readers = [
+            threading.Thread(
+                target=self._read, args=(self.process.stdout, capture), daemon=True
+            ),
+            threading.Thread(
+                target=self._read, args=(self.process.stderr, False), daemon=True
+            ),
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    def _read(self, stream, capture):
+        for raw in iter(stream.readline, b""):
+            line = raw.decode("utf-8", errors="replace").rstrip("\n")
+            if capture:
+                self._stdout.append(line)
+            with self._tail_lock:
+                self._tail.append(line)
+            if self.log_level is not None:
+                logger.log(self.log_level, f"  [{self.name}] {line}")
+        stream.close()
+
+    def _kill(self):
+        for sig, grace in [(signal.SIGTERM, KILL_GRACE_PERIOD), (signal.SIGKILL, None)]:
+            try:
+                os.killpg(self.process.pid, sig)
+            except ProcessLookupError:
+                return
+            try:
+                self.process.wait(timeout=grace)
+                return
+            except subprocess.TimeoutExpired:
+                continue
+
+    def wait(self, check=True):
+        """
+        Wait for the command to finish (killing it once it exceeds its
+        timeout), recording it as a span. Raises ShellException if check and
+        it failed (always, if it timed out).
+        """
+        remaining = self.timeout - (time.perf_counter() - self.start)
+        timed_out = False
+        try:
+            returncode = self.process.wait(timeout=max(remaining, 0))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            self._kill()
+            returncode = self.process.wait()
+        for reader in self._readers:
+            reader.join(timeout=KILL_GRACE_PERIOD)
+        duration = time.perf_counter() - self.start
+
+        with self._tail_lock:
+            tail = list(self._tail)
+        result = ShellResult(
+            self.name,
+            self.args,
+            returncode,
+            "\n".join(self._stdout).rstrip() if self.capture else None,
+            tail,
+            duration,
+            timed_out,
+        )
+        tracer.record(
+            f"shell {self.name}",
+            self.start,
+            duration,
+            returncode=returncode,
+            timed_out=timed_out,
+        )
+
+        if timed_out:
+            raise ShellTimeoutException(result.describe(), result)
+        if not result.ok:
+            if check:
+                raise ShellException(result.describe(), result)
+            logger.warning(result.describe())
+        return result
+
+
+def start(*args, **kwargs):
+    """Start a command without waiting for it (see ShellProcess)"""
+    return ShellProcess(*args, **kwargs)
+
+
+def run(*args, check=True, **kwargs):
+    """Run a command to completion (see ShellProcess), returning its ShellResult"""
+    return ShellProcess(*args, **kwargs).wait(check=check)
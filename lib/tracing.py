@@ -0,0 +1,179 @@
+import contextvars
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+from nypl_py_utils.functions.log_helper import create_log
+
+logger = create_log("tracing")
+
+
+class Tracer:
+    """
+    Records nested, timed spans (e.g. a run > a target > a get_query call),
+    which can be exported as Chrome trace JSON (viewable in chrome://tracing
+    or https://ui.perfetto.dev) and summarized by span name.
+
+    When profiling is enabled, each "phase" span is also profiled with
+    cProfile (outermost phase spans only, since profilers can't nest) so that
+    the slowest phase's profile can be written out.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.profiling = False
+        self.profiles = {}
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._stack = contextvars.ContextVar("trace_stack", default=())
+        self._local = threading.local()
+        self._epoch = time.perf_counter()
+
+    def reset(self):
+        """
+        Discard recorded spans and profiles (e.g. between invocations of a
+        warm Lambda, so that each trace covers only its own invocation)
+        """
+        with self._lock:
+            self.events = []
+            self.profiles = {}
+            self._ids = itertools.count(1)
+
+    @contextmanager
+    def span(self, name, category="phase", **args):
+        span_id = next(self._ids)
+        parents = self._stack.get()
+        token = self._stack.set(parents + (span_id,))
+
+        profiler = None
+        if (
+            self.profiling
+            and category == "phase"
+            and not getattr(self._local, "profiling", False)
+        ):
+            with self._lock:
+                profiler = self.profiles.setdefault(name, cProfile.Profile())
+            self._local.profiling = True
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield span_id
+        finally:
+            duration = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self._local.profiling = False
+            self._stack.reset(token)
+            self.add_event(name, category, start, duration, span_id, parents, args)
+
+    def record(self, name, start, duration, category="phase", **args):
+        """
+        Record a span timed by the caller (start being a time.perf_counter()
+        value), nested within the current span
+        """
+        span_id = next(self._ids)
+        self.add_event(
+            name, category, start, duration, span_id, self._stack.get(), args
+        )
+        return span_id
+
+    def add_event(self, name, category, start, duration, span_id, parents, args):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self._epoch) * 1e6),
+            "dur": round(duration * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {**args, "id": span_id, "parents": list(parents)},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self, within=None, category="phase"):
+        """
+        Aggregate count and total ms of spans by name, optionally limited to
+        spans nested within the span identified by `within`
+        """
+        summary = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            if event["cat"] != category:
+                continue
+            if within is not None and within not in event["args"]["parents"]:
+                continue
+            entry = summary.setdefault(event["name"], {"count": 0, "total_ms": 0})
+            entry["count"] += 1
+            entry["total_ms"] += event["dur"] / 1000
+        for entry in summary.values():
+            entry["total_ms"] = round(entry["total_ms"], 1)
+        return dict(sorted(summary.items(), key=lambda i: -i[1]["total_ms"]))
+
+    def write_chrome_trace(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            f.write(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+        logger.info(f"Wrote trace of {len(events)} spans to {path}")
+
+    def write_slowest_profile(self, basepath):
+        """
+        Write the cProfile stats of the phase with the most total time to
+        BASEPATH.prof (binary) and BASEPATH.txt (top functions by cumulative
+        time). Returns the name of the phase.
+        """
+        profiled = {
+            name: stats
+            for name, stats in self.summary().items()
+            if name in self.profiles
+        }
+        if len(profiled) == 0:
+            return None
+
+        slowest = next(iter(profiled))
+        profile = self.profiles[slowest]
+        os.makedirs(os.path.dirname(basepath), exist_ok=True)
+        profile.dump_stats(f"{basepath}.prof")
+
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(40)
+        with open(f"{basepath}.txt", "w") as f:
+            f.write(out.getvalue())
+
+        logger.info(f"Wrote profile of slowest phase ({slowest}) to {basepath}.prof")
+        return slowest
+
+
+tracer = Tracer()
+
+
+def span(name, category="phase", **args):
+    return tracer.span(name, category, **args)
+
+
+def traced(name=None):
+    """Decorator recording every call to the wrapped function as a span"""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
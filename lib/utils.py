@@ -1,9 +1,15 @@
-import subprocess
+import hashlib
+import json
+import os
 import readline
+import requests
+import time
 
+from fnmatch import fnmatch
+from lib import shell
+from lib.complex_encoder import ComplexEncoder
 from nypl_py_utils.functions.log_helper import create_log
 from pathlib import Path
-import urllib.request
 
 logger = create_log("utils")
 
@@ -24,15 +30,17 @@ def git_active_branch(base_dir):
 
 
 def shell_exec(*_args, **kwargs):
-    result = subprocess.run(_args, stdout=subprocess.PIPE)
+    """
+    Run a command, returning its stdout. Failures are logged rather than
+    raised, but commands are killed (raising ShellTimeoutException) after
+    their timeout; See lib.shell.
+    """
+    result = shell.run(*_args, check=False, timeout=kwargs.get("timeout"))
 
     if kwargs.get("verbose", False):
         print(f"Shell output: {result.stdout}")
 
-    if result.returncode != 0:
-        print(f"Error? f{result}")
-
-    return result.stdout.decode().rstrip()
+    return result.stdout
 
 
 def average_by_index(two_d_array):
@@ -49,8 +57,64 @@ def format_float(f):
     return "{:10.2f}".format(f)
 
 
+def offline_mode():
+    """
+    Offline mode (e.g. when replaying recorded cassettes) avoids all network
+    access besides what's explicitly recorded.
+    """
+    return os.environ.get("SRT_OFFLINE", "false").lower() == "true"
+
+
+def canonical_json(obj):
+    """
+    Serialize obj such that equivalent payloads always produce identical
+    strings (sorted keys, no insignificant whitespace)
+    """
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), cls=ComplexEncoder)
+
+
+def content_hash(obj):
+    return hashlib.sha256(canonical_json(obj).encode("utf-8")).hexdigest()
+
+
+# Application files fetched (or validated) by this process, by (app, path):
+_application_files = {}
+
+# Seconds before a long-running process (e.g. a warm Lambda) revalidates an
+# application file it already fetched:
+APPLICATION_FILE_TTL = 300
+
+# Where application files are downloaded to (as APP/PATH):
+APPLICATION_FILES_DIR = "/tmp/srt"
+
+
+def local_application_files():
+    """
+    Whether to use the checked-out ./applications files rather than those on
+    the main branch (always, when offline)
+    """
+    return (
+        offline_mode()
+        or os.environ.get("SRT_APPLICATION_FILES", "remote").lower() == "local"
+    )
+
+
 def local_application_file(app, path):
-    local_path = f"/tmp/srt/{app}/{path}"
+    """
+    Local path of the given application file (e.g. targets.yaml) as on the
+    main branch, downloaded to /tmp/srt/APP. Downloads are revalidated with
+    conditional GETs, so unchanged files aren't re-downloaded, and at most
+    once per APPLICATION_FILE_TTL in the same process.
+    """
+    if local_application_files():
+        return f"./applications/{app}/{path}"
+
+    key = (app, path)
+    memo = _application_files.get(key)
+    if memo is not None and time.time() - memo["validated"] < APPLICATION_FILE_TTL:
+        return memo["path"]
+
+    local_path = f"{APPLICATION_FILES_DIR}/{app}/{path}"
 
     url = (
         "https://raw.githubusercontent.com"
@@ -58,18 +122,122 @@ def local_application_file(app, path):
         f"/applications/{app}/{path}"
     )
     logger.debug(f"Loading {path} from {url}")
-    download_file(
-        url,
-        local_path,
-    )
+    download_file(url, local_path)
+    _application_files[key] = {"path": local_path, "validated": time.time()}
     return local_path
 
 
 def download_file(url, local_path):
+    """
+    Download url to local_path, sending the ETag and Last-Modified of the
+    previous download (kept in LOCAL_PATH.cache.json) so that the file is
+    only re-downloaded if it changed. If the request fails, falls back on the
+    previous download (if any).
+    """
     path = Path(local_path)
     path.parent.mkdir(parents=True, exist_ok=True)
-
-    source = urllib.request.urlopen(url)
-    with open(local_path, "wb") as f:
-        f.write(source.read())
-        logger.debug(f"  Wrote {url} to {local_path}")
+    cache_path = f"{local_path}.cache.json"
+
+    validators = {}
+    if path.exists() and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            validators = json.load(f)
+
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    try:
+        resp = requests.get(url, headers=headers, timeout=10)
+        if resp.status_code == 304:
+            logger.debug(f"  {local_path} is current")
+            return
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        if path.exists():
+            logger.warning(f"Using cached {local_path}; Error fetching {url}: {e}")
+            return
+        raise
+
+    tmp_path = f"{local_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(resp.content)
+    os.replace(tmp_path, local_path)
+    with open(cache_path, "w") as f:
+        json.dump(
+            {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+            },
+            f,
+        )
+    logger.debug(f"  Wrote {url} to {local_path}")
+
+
+def github_changed_files(repository, base, head):
+    """
+    Use the GitHub compare API to determine the files changed between two
+    refs of a repository without cloning it.
+
+    Returns a tuple (head_sha, paths). paths is None if the complete list of
+    changes could not be determined (e.g. the API truncated the file list).
+    """
+    url = f"https://api.github.com/repos/{repository}/compare/{base}...{head}"
+    headers = {"Accept": "application/vnd.github+json"}
+    if os.environ.get("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {os.environ['GITHUB_TOKEN']}"
+
+    logger.debug(f"Fetching changed files from {url}")
+    resp = requests.get(url, headers=headers, timeout=10)
+    resp.raise_for_status()
+    comparison = resp.json()
+
+    commits = comparison.get("commits", [])
+    if comparison.get("total_commits", len(commits)) > len(commits):
+        # The compare API lists at most 250 commits, so the last isn't head:
+        head_sha = github_commit_sha(repository, head, headers)
+    elif len(commits) > 0:
+        head_sha = commits[-1]["sha"]
+    else:
+        head_sha = comparison["base_commit"]["sha"]
+
+    # The compare API returns at most 300 files:
+    files = comparison.get("files", [])
+    if len(files) >= 300:
+        return head_sha, None
+
+    paths = []
+    for file in files:
+        paths.append(file["filename"])
+        if file.get("previous_filename"):
+            paths.append(file["previous_filename"])
+    return head_sha, paths
+
+
+def github_commit_sha(repository, ref, headers):
+    """The sha of the commit ref (e.g. a branch) points to"""
+    url = f"https://api.github.com/repos/{repository}/commits/{ref}"
+    resp = requests.get(
+        url, headers={**headers, "Accept": "application/vnd.github.sha"}, timeout=10
+    )
+    resp.raise_for_status()
+    return resp.text.strip()
+
+
+def matching_paths(paths, patterns):
+    """
+    Return the paths that match any of the given patterns. A pattern may be a
+    glob (e.g. "lib/elasticsearch/*") or a directory ending in "/", which
+    matches everything beneath it.
+    """
+    return [
+        path
+        for path in paths
+        if any(
+            fnmatch(path, pattern)
+            or (pattern.endswith("/") and path.startswith(pattern))
+            for pattern in patterns
+        )
+    ]
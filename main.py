@@ -4,15 +4,22 @@ import os
 import sys
 import traceback
 
+from datetime import datetime
+
 from lib.models.app_config import AppConfig, AppConfigException
 from lib.models.run import Run
 from lib.models.report import Report
 from lib.utils import shell_exec, git_active_branch, prompt_with_prefill
-from lib.filestore import upload_dir
+from lib.filestore import upload_dir, download_dir, write_to_s3
 from lib.report_utils import upload_pending_report
 from nypl_py_utils.functions.log_helper import create_log
 from nypl_py_utils.functions.config_helper import load_env_file
 from lib.lambda_utils import validate_webhook, WebhookException, lambda_error
+from lib import cassettes, fanout, progressive, pushes, run_diff, sharding
+from lib.tracing import tracer
+from lib.sharding import parse_shard, shard_file_key
+from lib.history import upload_history
+from lib.scheduler import Scheduler, SchedulerException, format_summary, parse_jobs
 
 
 load_env_file(os.environ.get("ENVIRONMENT", "qa"), "config/{}.yaml")
@@ -28,7 +35,9 @@ def parse_args():
 
     applications = os.listdir("./applications")
 
-    parser.add_argument("app", choices=applications)
+    parser.add_argument(
+        "app", choices=applications + ["all"], help="An application ('all' to schedule)"
+    )
     parser.add_argument(
         "command",
         choices=[
@@ -37,9 +46,21 @@ def parse_args():
             "test-latest",
             "rebuild-report",
             "build",
+            "merge-manifests",
+            "load-test",
+            "compare",
+            "schedule",
             "lambda-event",
         ],
     )
+    parser.add_argument(
+        "runs",
+        nargs="*",
+        help=(
+            "For compare: Two commits (or unique prefixes), 'local', or 'latest';"
+            " For schedule: Jobs, as APP:COMMAND or COMMAND (for app, or every app if 'all')"
+        ),
+    )
     parser.add_argument("-t", "--targets", default="targets.yaml")
     parser.add_argument(
         "--no-persist-to-s3", dest="persist_to_s3", action="store_false"
@@ -47,22 +68,164 @@ def parse_args():
     parser.add_argument(
         "--no-rebuild-graphs", dest="rebuild_graphs", action="store_false"
     )
+    parser.add_argument("--no-es-cache", dest="use_es_cache", action="store_false")
     parser.add_argument("--include-local", dest="include_local", action="store_true")
     parser.add_argument("--include-latest", dest="include_latest", action="store_true")
     parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument(
+        "--from-history",
+        dest="from_history",
+        action="store_true",
+        help="For rebuild-report: Summarize older runs from the run history",
+    )
+    parser.add_argument(
+        "--fanout",
+        action="store_true",
+        help="Run test-all as checkpointed per-commit (and per-shard) work items",
+    )
+    parser.add_argument(
+        "--fanout-shards",
+        dest="fanout_shards",
+        type=int,
+        help="Number of target shards per commit when fanning out",
+    )
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument(
+        "--progressive",
+        action="store_true",
+        help="For test-latest: Evaluate sentinel targets first, the rest only on change",
+    )
+    parser.add_argument(
+        "--complete-in-background",
+        dest="complete_in_background",
+        action="store_true",
+        help="For test-latest --progressive: Confirm a no-differences verdict in full",
+    )
     parser.add_argument("--publish", action="store_true")
     parser.add_argument("--rows")
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Run only shard INDEX/COUNT (e.g. 2/4) of targets, partitioned by key",
+    )
     parser.add_argument("--envfile")
+    parser.add_argument(
+        "--commit",
+        help="For load-test: The commit (or 'latest' or 'local') to load test",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--qps",
+        default="5",
+        help="For load-test: Target QPS, or a ramp START:END (e.g. 5:50)",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=60, help="For load-test: Seconds to run"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["table", "json"],
+        default="table",
+        help="For compare: Output format",
+    )
+    parser.add_argument(
+        "--changed-only",
+        dest="changed_only",
+        action="store_true",
+        help="For compare: Only list targets whose scores or documents changed",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        help="For compare: Compare matching documents to this depth",
+    )
+    parser.add_argument(
+        "--local-app-files",
+        dest="local_app_files",
+        action="store_true",
+        help="Use targets.yaml, config.yaml, etc. from ./applications rather than main",
+    )
+    parser.add_argument(
+        "--max-initializations",
+        dest="max_initializations",
+        type=int,
+        help="For schedule: Max apps initializing at once (default: half the CPUs)",
+    )
+    parser.add_argument(
+        "--max-es-requests",
+        dest="max_es_requests",
+        type=int,
+        default=8,
+        help="For schedule: Max in-flight requests per ES cluster",
+    )
     parser.add_argument("--appdir")
     parser.add_argument("--description")
     parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument(
+        "--es-profile",
+        dest="es_profile",
+        action="store_true",
+        help="Re-run slow or regressed targets with the ES profile API",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Also capture a cProfile profile of the slowest phase",
+    )
+    parser.add_argument(
+        "--cassettes",
+        choices=["record", "replay"],
+        help="Record ES calls and generated queries, or replay them offline",
+    )
+    parser.add_argument("--cassette-dir", dest="cassette_dir")
+    parser.add_argument(
+        "--replay-latency",
+        dest="replay_latency",
+        help="When replaying, 'recorded' or a fixed number of ms to delay each call",
+    )
 
     parser.add_argument("--event-file", dest="event_file")
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    # Only compare and schedule take positional arguments beyond the command:
+    if len(args.runs) > 0 and args.command not in ["compare", "schedule"]:
+        parser.error(
+            f"unrecognized arguments for {args.command}: {' '.join(args.runs)}"
+        )
+    return args
+
 
+def write_trace(name, profile=False):
+    """
+    Write spans recorded so far as Chrome trace JSON (and, if profiling, the
+    profile of the slowest phase) and log where the time went
+    """
+    basepath = os.path.join(
+        os.sep, "tmp", "srt", "traces", f"{name}-{datetime.now():%Y%m%dT%H%M%S}"
+    )
+    tracer.write_chrome_trace(f"{basepath}.json")
+    if profile:
+        tracer.write_slowest_profile(f"{basepath}-profile")
+
+    for phase, stats in tracer.summary().items():
+        logger.info(f"  {phase}: {stats['total_ms']}ms in {stats['count']} calls")
+
+
+def lambda_handler(event, context, queue=None):
+    # Warm containers (and drained local queues) reuse the process's tracer:
+    tracer.reset()
+    try:
+        return handle_lambda_event(event, context, queue)
+    finally:
+        write_trace(f"lambda-{event.get('command', 'webhook')}")
 
-def lambda_handler(event, context):
+
+def handle_lambda_event(event, context, queue=None):
+    """
+    Handle a GitHub webhook or a command event. Follow-up work (e.g. test-push
+    and fan-out worker events) is sent to queue (by default, async
+    invocations of this Lambda).
+    """
     if event.get("body") and event.get("headers"):
         try:
             validate_webhook(event)
@@ -72,23 +235,35 @@ def lambda_handler(event, context):
 
         try:
             body = json.loads(event["body"])
-            app = body["repository"]["name"]
+            repository = body["repository"].get("full_name", body["repository"]["name"])
             # FIXME: Temporary hack to test pushes to this repo:
-            if app == "search-relevance-tests":
-                app = "discovery-api"
-
-            logger.info(f"Webhook validated; Proceeding with test-latest for {app}")
+            if body["repository"]["name"] == "search-relevance-tests":
+                app_configs = [AppConfig.for_name("discovery-api")]
+            else:
+                app_configs = AppConfig.for_repository(
+                    repository, os.listdir("./applications")
+                )
+            if len(app_configs) == 0:
+                raise AppConfigException(f"No application evaluates {repository}")
 
             # Validate branch:
             ref = body.get("ref")
             if ref is None:
                 logger.info("No git ref found in webhook payload")
                 return
-            if ref != "refs/heads/main":
+            apps = [
+                c.app_name for c in app_configs if ref == f"refs/heads/{c.branch()}"
+            ]
+            if len(apps) == 0 or body.get("deleted"):
                 logger.info(f"Skipping push to {ref}")
                 return
 
-            return run_test_latest(app=app)
+            # Acknowledge now; Evaluating the push takes longer than GitHub waits:
+            logger.info(f"Webhook validated; Queueing test-latest for {apps}")
+            queue = queue or fanout.LambdaQueue()
+            for app in apps:
+                pushes.receive_push(app, body.get("after") or "HEAD", queue, ref=ref)
+            return {"statusCode": 202, "message": f"Queued test-latest for {apps}"}
         except AppConfigException as e:
             return lambda_error(400, e)
         except Exception as e:
@@ -106,11 +281,34 @@ def lambda_handler(event, context):
         return False
 
     elif command == "test-latest":
-        run_test_latest(app=app)
+        run_test_latest(app=app, force=event.get("force", False))
+
+    elif command == "test-push":
+        pushes.handle_push_event(event, run_test_latest)
 
     elif command == "test-all":
-        run_test_all(app=app)
-        rebuild_report(app=app)
+        # A single invocation can't run every commit and target before timing
+        # out, so by default fan out to worker invocations:
+        if event.get("fanout", True):
+            fanout.start_fanout(
+                app,
+                queue or fanout.LambdaQueue(),
+                shards=event.get("shards"),
+                fanout_id=event.get("fanout_id"),
+                rebuild=event.get("rebuild", False),
+            )
+        else:
+            run_test_all(app=app)
+            rebuild_report(app=app)
+
+    elif command in fanout.WORKER_COMMANDS:
+        remaining_seconds = None
+        if hasattr(context, "get_remaining_time_in_millis"):
+
+            def remaining_seconds():
+                return context.get_remaining_time_in_millis() / 1000
+
+        fanout.handle_event(event, queue or fanout.LambdaQueue(), remaining_seconds)
 
     elif command == "rebuild-report":
         rebuild_report(app=app)
@@ -122,10 +320,17 @@ def lambda_handler(event, context):
     return True
 
 
+def save_shard_manifest(run):
+    """Save a shard's manifest locally and to srt/APP/shards for merging"""
+    path = run.save_manifest(folder="shards")
+    write_to_s3(f"srt/{run.app_config.app_name}/shards/{run.file_key}.json", path)
+    logger.info(f"Saved shard manifest {path}; Combine shards with merge-manifests")
+
+
 def run_test_local(**kwargs):
     app_config = AppConfig.for_name(kwargs["app"])
 
-    app_config.load_targets(rows=kwargs.get("rows", None))
+    app_config.load_targets(rows=kwargs.get("rows", None), shard=kwargs.get("shard"))
 
     if kwargs["appdir"] is None:
         logger.error("--appdir PATH required")
@@ -135,76 +340,237 @@ def run_test_local(**kwargs):
         exit()
 
     logger.info(f"Running targets against code in {kwargs['appdir']}")
+    file_key = "local"
+    if kwargs.get("shard") is not None:
+        file_key = shard_file_key(file_key, *kwargs["shard"])
     run = Run.for_path(
-        app_config, kwargs["appdir"], kwargs["description"], file_key="local"
+        app_config, kwargs["appdir"], kwargs["description"], file_key=file_key
     )
-    run.collect_data()
-    run.save_manifest()
+    run.collect_data(use_es_cache=kwargs.get("use_es_cache", True))
+    if kwargs.get("es_profile"):
+        last_commit_id = app_config.official_commits()[-1]["commit"]
+        # Downloading its manifest if needed (e.g. on a fresh /tmp):
+        run.profile_slow_targets(Run.fetch_manifest(app_config, last_commit_id))
+    if kwargs.get("shard") is not None:
+        save_shard_manifest(run)
+    else:
+        run.save_manifest()
 
 
 def run_test_all(**kwargs):
     app_config = AppConfig.for_name(kwargs["app"])
-    app_config.load_targets(rows=kwargs.get("rows", None))
+    shard = kwargs.get("shard")
+    app_config.load_targets(rows=kwargs.get("rows", None), shard=shard)
 
     runs = [
-        Run.for_commit(app_config, c["commit"], c["description"])
+        Run.for_commit(
+            app_config,
+            c["commit"],
+            c["description"],
+            file_key=None if shard is None else shard_file_key(c["commit"], *shard),
+        )
         for c in app_config.official_commits()
     ]
-    for run in runs:
-        run.collect_data(rebuild=kwargs.get("rebuild"))
-        run.save_manifest()
+    for ind, run in enumerate(runs):
+        run.collect_data(
+            rebuild=kwargs.get("rebuild"),
+            use_es_cache=kwargs.get("use_es_cache", True),
+        )
+        if kwargs.get("es_profile"):
+            run.profile_slow_targets(runs[ind - 1] if ind > 0 else None)
+        if shard is not None:
+            save_shard_manifest(run)
+        else:
+            run.save_manifest()
+
+    if shard is not None:
+        logger.info("Done")
+        return
     upload_dir(
         app_config.local_temp_path("manifests"),
         f"srt/{app_config.app_name}/manifests",
         exclude=["local.json", "latest.json"],
     )
+    upload_history(app_config)
+    logger.info("Done")
+
+
+def run_test_all_fanout(**kwargs):
+    """Run test-all as fan-out work items on an in-process queue"""
+    queue = fanout.LocalQueue()
+    fanout.start_fanout(
+        kwargs["app"],
+        queue,
+        shards=kwargs.get("shards"),
+        rows=kwargs.get("rows"),
+        rebuild=kwargs.get("rebuild", False),
+        use_es_cache=kwargs.get("use_es_cache", True),
+    )
+    queue.drain(lambda event: fanout.handle_event(event, queue))
     logger.info("Done")
 
 
 def run_test_latest(**kwargs):
     app_config = AppConfig.for_name(kwargs["app"])
-    app_config.load_targets(rows=kwargs.get("rows", None))
+    shard = kwargs.get("shard")
+    app_config.load_targets(rows=kwargs.get("rows", None), shard=shard)
 
     log = []
+    # Once done, later messages (e.g. while confirming a progressive verdict)
+    # don't mark the pending report as working again:
+    state = {"done": False}
 
     try:
 
         def log_progress(message, done=False):
             logger.info(message)
             log.append(message)
-            upload_pending_report(f"{app_config.app_name}/report-latest", log, done)
+            state["done"] = state["done"] or done
+            upload_pending_report(
+                f"{app_config.app_name}/report-latest", log, state["done"]
+            )
 
-        checkout_base_dir = app_config.local_temp_path("app")
-        last_run = Run.all_from_manifests(app_config)[-1]
-        run = Run.for_path(
-            app_config, checkout_base_dir, "Latest main branch", file_key="latest"
+        current_report_url = (
+            "https://research-catalog-stats.s3.amazonaws.com"
+            f"/srt/{app_config.app_name}/report/index.html"
+        )
+        no_differences_message = (
+            f"Detected no scoring or latency differences with <a href='{current_report_url}'>"
+            "current report</a>."
         )
 
-        git_url = f"https://github.com/NYPL/discovery-api/compare/{last_run.commit_id}...{run.get_commit_id()}"
+        # Called between phases and targets; Raises PushCancelledException if
+        # a newer push should be evaluated instead:
+        cancel = kwargs.get("cancel") or (lambda *args: None)
+
+        # Scores can only change if query-building code changed, so check
+        # the diff before paying for app initialization:
+        last_commit_id = app_config.official_commits()[-1]["commit"]
+        if not kwargs.get("force", False):
+            head_sha, relevant_changes = app_config.relevant_changes(
+                last_commit_id, head=kwargs.get("head")
+            )
+            if relevant_changes is not None and len(relevant_changes) == 0:
+                git_url = f"https://github.com/{app_config.repository()}/compare/{last_commit_id}...{head_sha}"
+                log_progress(
+                    f"No changes to query-building code in <a href='{git_url}'>changes to main</a>"
+                )
+                log_progress(no_differences_message, True)
+                return
+            if relevant_changes:
+                logger.info(f"Relevant paths changed: {', '.join(relevant_changes)}")
+
+        checkout_base_dir = app_config.local_temp_path("app")
+        runs = Run.all_from_manifests(app_config)
+        last_run = runs[-1]
+
+        def latest_run():
+            return Run.for_path(
+                app_config,
+                checkout_base_dir,
+                "Latest main branch",
+                file_key=(
+                    "latest" if shard is None else shard_file_key("latest", *shard)
+                ),
+            )
+
+        run = latest_run()
+
+        git_url = f"https://github.com/{app_config.repository()}/compare/{last_run.commit_id}...{run.get_commit_id()}"
         log_progress(
             f"Building 'latest' report for <a href='{git_url}'>changes to main</a>"
         )
 
+        cancel()
         log_progress("Initializing app")
-        run.initialize_app(use_cache=False, commit_id="HEAD")
-
+        run.initialize_app(use_cache=False, commit_id=kwargs.get("head") or "HEAD")
+
+        # Progressively, evaluate the targets whose scores change most often
+        # first, and the rest only if those changed:
+        progressive_config = app_config.config().get("progressive") or {}
+        sentinels = None
+        if shard is None and (
+            kwargs.get("progressive") or progressive_config.get("enabled", False)
+        ):
+            sentinels, sentinel_explanation = progressive.select_sentinels(
+                app_config.targets,
+                runs,
+                coverage=progressive_config.get("coverage"),
+                min_sentinels=progressive_config.get("min_sentinels"),
+                min_history=progressive_config.get("min_history"),
+            )
+            if sentinels is None:
+                log_progress(f"Evaluating all targets; {sentinel_explanation}")
+
+        reported = False
+        sentinel_run = None
+        if sentinels is not None:
+            cancel()
+            log_progress(f"Collecting data for sentinels: {sentinel_explanation}")
+            sentinel_run = progressive.collect_sentinels(
+                run,
+                sentinels,
+                use_es_cache=kwargs.get("use_es_cache", True),
+                checkpoint=cancel,
+            )
+            equivalent, explanation = last_run.has_equivalent_scores(
+                sentinel_run, target_keys=[t.key for t in sentinels]
+            )
+            equivalent_latency, _ = last_run.has_equivalent_latency(sentinel_run)
+            if not equivalent:
+                log_progress(f"Sentinels changed: {explanation}")
+            elif not equivalent_latency:
+                log_progress("Sentinel latency regressed")
+            else:
+                log_progress("Detected no differences in sentinel targets")
+                log_progress(no_differences_message, True)
+                if not (
+                    kwargs.get("complete_in_background")
+                    or progressive_config.get("complete_in_background", False)
+                ):
+                    return
+                # The verdict is published; Confirm it with the full suite:
+                reported = True
+            run = latest_run()
+
+        cancel()
         log_progress("Collecting data")
-        run.collect_data()
+        run.collect_data(
+            use_es_cache=kwargs.get("use_es_cache", True),
+            checkpoint=cancel,
+            previous_run=sentinel_run,
+        )
+        if kwargs.get("es_profile"):
+            log_progress("Profiling slow targets")
+            run.profile_slow_targets(last_run)
+
+        if shard is not None:
+            # Scores can only be compared once all shards are merged:
+            save_shard_manifest(run)
+            log_progress(f"Collected shard {run.file_key}", True)
+            return
 
         log_progress("Comparing scores to last run")
         equivalent, explanation = last_run.has_equivalent_scores(run)
-
-        if equivalent:
-            log_progress(
-                "Detected no scoring differences with "
-                "<a href='https://research-catalog-stats.s3.amazonaws.com/srt/discovery-api/report/index.html'>"
-                "current report</a>.",
-                True,
-            )
+        if not equivalent:
+            log_progress(f"<span class='changed'>{explanation}</span>")
+
+        log_progress("Comparing latency to last run")
+        equivalent_latency, latency_explanation = last_run.has_equivalent_latency(run)
+        if not equivalent_latency:
+            log_progress(f"<span class='changed'>{latency_explanation}</span>")
+
+        if equivalent and equivalent_latency:
+            if reported:
+                logger.info("Full suite confirmed no differences")
+            else:
+                log_progress(no_differences_message, True)
         else:
+            if reported:
+                log_progress("The full suite found differences missed by sentinels")
+            cancel()
             log_progress("Building report")
 
-            logger.info(f"Scores changed: {explanation}")
             run.save_manifest()
             rebuild_report(
                 app=kwargs["app"],
@@ -213,18 +579,103 @@ def run_test_latest(**kwargs):
                 persist_to_s3=kwargs.get("persist_to_s3", True),
                 folder_name="report-latest",
             )
+    except pushes.PushCancelledException as e:
+        log_progress(f"Cancelled: {str(e)}", True)
     except Exception as e:
         log_progress(f"Error: {str(e)}", True)
         traceback.print_exc()
 
 
+def run_compare(**kwargs):
+    app_config = AppConfig.for_name(kwargs["app"])
+
+    manifests = []
+    for file_key in kwargs["runs"]:
+        try:
+            manifests.append(run_diff.load_manifest(app_config, file_key))
+        except run_diff.RunDiffException:
+            # Fetch manifests only when needed, since comparing is otherwise fast:
+            download_dir(
+                f"srt/{app_config.app_name}/manifests",
+                app_config.local_temp_path("manifests"),
+            )
+            manifests.append(run_diff.load_manifest(app_config, file_key))
+
+    diff = run_diff.diff_manifests(*manifests, depth=kwargs.get("depth"))
+    if kwargs.get("format") == "json":
+        print(json.dumps(diff, indent=2))
+    else:
+        print(run_diff.format_table(diff, changed_only=kwargs.get("changed_only")))
+
+
+def merge_shard_manifests(**kwargs):
+    app_config = AppConfig.for_name(kwargs["app"])
+    app_config.load_targets(rows=kwargs.get("rows", None))
+    failures = sharding.merge_shard_manifests(app_config)
+    if failures > 0:
+        raise sharding.ManifestMergeException(
+            f"{failures} manifests could not be merged"
+        )
+
+
+def run_load_test(**kwargs):
+    app_config = AppConfig.for_name(kwargs["app"])
+    app_config.load_targets(rows=kwargs.get("rows", None), shard=kwargs.get("shard"))
+
+    file_key = kwargs.get("commit") or app_config.official_commits()[-1]["commit"]
+    download_dir(
+        f"srt/{app_config.app_name}/manifests", app_config.local_temp_path("manifests")
+    )
+    run = Run.by_manifest_file(app_config, file_key)
+    if run is None:
+        logger.error(f"No manifest found for {file_key}. Collect data for it first.")
+        return
+
+    qps = [float(v) for v in kwargs.get("qps", "5").split(":")]
+    results = run.run_load_test(
+        concurrency=kwargs.get("concurrency", 8),
+        qps_start=qps[0],
+        qps_end=qps[-1],
+        duration=kwargs.get("duration", 60),
+    )
+
+    overall = results["overall"]
+    logger.info(
+        f"Load test of {file_key}: {overall['requests']} requests,"
+        f" {overall['throughput']} req/s, {overall['error_rate']:.1%} errors,"
+        f" p50 {overall['p50_ms']}ms, p90 {overall['p90_ms']}ms, p99 {overall['p99_ms']}ms"
+    )
+    for message, count in results["error_messages"].items():
+        logger.warning(f"  {count} errors: {message}")
+
+    path = run.save_manifest()
+    if file_key not in ["local", "latest"]:
+        write_to_s3(f"srt/{app_config.app_name}/manifests/{file_key}.json", path)
+        upload_history(app_config)
+
+
+def run_schedule(**kwargs):
+    summaries = Scheduler(
+        SCHEDULED_COMMANDS,
+        max_initializations=kwargs.get("max_initializations"),
+        max_es_requests=kwargs.get("max_es_requests"),
+    ).run(kwargs["jobs"], **kwargs["job_kwargs"])
+    logger.info(f"Schedule complete:\n{format_summary(summaries)}")
+    return summaries
+
+
 def report_folder_name(folder_name="report", include_local=False, include_latest=False):
     return folder_name
 
 
 def rebuild_report(**kwargs):
     report = Report(app=kwargs["app"])
-    report.load_runs_from_manifests(
+    load_runs = (
+        report.load_runs_from_history
+        if kwargs.get("from_history")
+        else report.load_runs_from_manifests
+    )
+    load_runs(
         include_local=kwargs.get("include_local"),
         include_latest=kwargs.get("include_latest"),
     )
@@ -256,11 +707,38 @@ def build_application_versions(**kwargs):
         run.package_app()
 
 
+# Commands that can be run by the scheduler, by name:
+SCHEDULED_COMMANDS = {
+    "test-all": run_test_all,
+    "test-latest": run_test_latest,
+    "rebuild-report": rebuild_report,
+    "build": build_application_versions,
+    "merge-manifests": merge_shard_manifests,
+    "load-test": run_load_test,
+}
+
+
 # Detect invocation via CLI versus in a Lambda environment.
 # If filename is other than main.py, must be Lambda environment:
 if len(sys.argv) > 0 and "main.py" in sys.argv[0]:
     args = parse_args()
 
+    tracer.profiling = args.profile
+
+    if args.local_app_files:
+        os.environ["SRT_APPLICATION_FILES"] = "local"
+
+    if args.cassettes is not None:
+        cassettes.configure(
+            args.cassettes,
+            args.cassette_dir or f"/tmp/srt/{args.app}/cassettes",
+            latency=args.replay_latency,
+        )
+
+    if args.app == "all" and args.command != "schedule":
+        logger.error("'all' applies only to schedule")
+        sys.exit(1)
+
     if args.app and args.command:
         rows = None
         if args.rows is not None:
@@ -270,10 +748,14 @@ if len(sys.argv) > 0 and "main.py" in sys.argv[0]:
             run_test_local(
                 app=args.app,
                 rows=rows,
+                shard=args.shard,
+                es_profile=args.es_profile,
                 appdir=args.appdir,
                 description=args.description,
+                use_es_cache=args.use_es_cache,
             )
 
+        if args.command == "test-local" and args.shard is None:
             app_config = AppConfig.for_name(args.app)
             folder_name = "report-local"
             report_url = f"/tmp/srt/{args.app}/{folder_name}/index.html"
@@ -298,14 +780,35 @@ if len(sys.argv) > 0 and "main.py" in sys.argv[0]:
             )
             shell_exec("open", report_url)
 
-        if args.command == "test-all":
-            run_test_all(app=args.app, rows=rows, rebuild=args.rebuild)
+        if args.command == "test-all" and args.fanout:
+            run_test_all_fanout(
+                app=args.app,
+                rows=rows,
+                rebuild=args.rebuild,
+                use_es_cache=args.use_es_cache,
+                shards=args.fanout_shards,
+            )
+        elif args.command == "test-all":
+            run_test_all(
+                app=args.app,
+                rows=rows,
+                shard=args.shard,
+                es_profile=args.es_profile,
+                rebuild=args.rebuild,
+                use_es_cache=args.use_es_cache,
+            )
         if args.command == "test-latest":
             run_test_latest(
                 app=args.app,
                 rows=rows,
+                shard=args.shard,
+                es_profile=args.es_profile,
                 rebuild_graphs=args.rebuild_graphs,
                 persist_to_s3=args.persist_to_s3,
+                use_es_cache=args.use_es_cache,
+                force=args.force,
+                progressive=args.progressive,
+                complete_in_background=args.complete_in_background,
             )
         if args.command == "rebuild-report":
             rebuild_report(
@@ -314,13 +817,74 @@ if len(sys.argv) > 0 and "main.py" in sys.argv[0]:
                 rebuild_graphs=args.rebuild_graphs,
                 include_local=args.include_local,
                 include_latest=args.include_latest,
+                from_history=args.from_history,
             )
         if args.command == "build":
             build_application_versions(app=args.app)
+        if args.command == "load-test":
+            run_load_test(
+                app=args.app,
+                rows=rows,
+                shard=args.shard,
+                commit=args.commit,
+                concurrency=args.concurrency,
+                qps=args.qps,
+                duration=args.duration,
+            )
+        if args.command == "compare":
+            if len(args.runs) != 2:
+                logger.error("compare requires two runs, e.g. COMMIT local")
+                sys.exit(1)
+            try:
+                run_compare(
+                    app=args.app,
+                    runs=args.runs,
+                    depth=args.depth,
+                    format=args.format,
+                    changed_only=args.changed_only,
+                )
+            except run_diff.RunDiffException as e:
+                logger.error(e)
+                sys.exit(1)
+        if args.command == "merge-manifests":
+            try:
+                merge_shard_manifests(app=args.app, rows=rows)
+            except sharding.ManifestMergeException as e:
+                logger.error(e)
+                sys.exit(1)
+        if args.command == "schedule":
+            try:
+                jobs = parse_jobs(args.runs, args.app, os.listdir("./applications"))
+            except SchedulerException as e:
+                logger.error(e)
+                sys.exit(1)
+            summaries = run_schedule(
+                jobs=jobs,
+                max_initializations=args.max_initializations,
+                max_es_requests=args.max_es_requests,
+                job_kwargs={
+                    "rows": rows,
+                    "es_profile": args.es_profile,
+                    "rebuild": args.rebuild,
+                    "use_es_cache": args.use_es_cache,
+                    "rebuild_graphs": args.rebuild_graphs,
+                    "persist_to_s3": args.persist_to_s3,
+                    "force": args.force,
+                    "from_history": args.from_history,
+                },
+            )
+            if not all(summary["ok"] for summary in summaries):
+                sys.exit(1)
 
         if args.command == "lambda-event":
             event = None
             with open(args.event_file, "r") as f:
                 event = json.load(f)
-            response = lambda_handler(event, {})
+            # Handle queued follow-up events (e.g. test-push) in-process:
+            queue = fanout.LocalQueue()
+            response = lambda_handler(event, {}, queue)
             print(f"Lambda response: {response}")
+            queue.drain(lambda queued: lambda_handler(queued, {}, queue))
+
+        if args.command != "lambda-event":
+            write_trace(f"{args.app}-{args.command}", profile=args.profile)
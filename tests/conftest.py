@@ -0,0 +1,47 @@
+import pytest
+
+from lib.models.app_config import AppConfig
+from lib.sharding import shard_targets
+
+
+class LocalAppConfig(AppConfig):
+    """
+    An app whose temp dir is basedir, and whose config, official commits and
+    targets are those given (rather than fetched), where given
+    """
+
+    def __init__(
+        self, basedir, app_name="local-app", config=None, commits=None, targets=None
+    ):
+        super().__init__(app_name)
+        self.basedir = basedir
+        self._config = config
+        self._official_commits = commits
+        self._targets = targets
+
+    def load_targets(self, **kwargs):
+        if self._targets is None:
+            return super().load_targets(**kwargs)
+
+        self.targets = list(self._targets)
+        if kwargs.get("rows", None) is not None:
+            self.targets = [self.targets[r] for r in kwargs["rows"]]
+        if kwargs.get("shard", None) is not None:
+            self.targets = shard_targets(self.targets, *kwargs["shard"])
+        return self.targets
+
+    def local_temp_path(self, folder=None):
+        return str(self.basedir / folder) if folder else str(self.basedir)
+
+
+@pytest.fixture
+def app_config(request, tmp_path, monkeypatch):
+    """
+    An offline LocalAppConfig in tmp_path, returned by AppConfig.for_name.
+    Parametrize it (indirectly) with LocalAppConfig's keyword args, e.g.
+    pytest.mark.parametrize("app_config", [{"config": {}}], indirect=True).
+    """
+    monkeypatch.setenv("SRT_OFFLINE", "true")
+    config = LocalAppConfig(tmp_path, **getattr(request, "param", {}))
+    monkeypatch.setattr(AppConfig, "for_name", lambda app: config)
+    return config
@@ -0,0 +1,61 @@
+import os
+
+from lib.build_store import BuildStore
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_build_store_pack_and_restore(tmp_path):
+    source = str(tmp_path / "source")
+    write(f"{source}/index.js", "index")
+    write(f"{source}/node_modules/dep/index.js", "dep")
+    write(f"{source}/.git", "gitdir: elsewhere")
+    os.symlink("../dep/index.js", f"{source}/node_modules/dep-link")
+
+    store = BuildStore(str(tmp_path / "builds"))
+    store.pack(source, "commit1")
+
+    write(f"{source}/index.js", "index v2")
+    os.remove(f"{source}/node_modules/dep-link")
+    store.pack(source, "commit2")
+
+    destination = str(tmp_path / "app")
+    stats = store.restore("commit1", destination)
+    assert stats["written"] == 2
+    assert read(f"{destination}/index.js") == "index"
+    assert os.readlink(f"{destination}/node_modules/dep-link") == "../dep/index.js"
+    assert not os.path.exists(f"{destination}/.git")
+
+    # Only the changed file is written; removed files are removed:
+    stats = store.restore("commit2", destination)
+    assert stats == {"files": 2, "written": 1, "removed": 1}
+    assert read(f"{destination}/index.js") == "index v2"
+    assert not os.path.lexists(f"{destination}/node_modules/dep-link")
+
+    # Local modifications are detected and overwritten:
+    write(f"{destination}/node_modules/dep/index.js", "modified")
+    stats = store.restore("commit2", destination)
+    assert stats["written"] == 1
+    assert read(f"{destination}/node_modules/dep/index.js") == "dep"
+
+
+def test_build_store_shares_chunks(tmp_path):
+    source = str(tmp_path / "source")
+    write(f"{source}/a.js", "same")
+    write(f"{source}/b.js", "same")
+
+    store = BuildStore(str(tmp_path / "builds"))
+    store.pack(source, "commit1")
+    store.pack(source, "commit2")
+
+    objects = [f for _, _, files in os.walk(store.objects_path) for f in files]
+    assert len(objects) == 1
@@ -0,0 +1,52 @@
+import os
+import pytest
+from unittest.mock import MagicMock
+
+from lib import cassettes
+
+
+@pytest.fixture
+def cassette_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("SRT_OFFLINE", raising=False)
+    yield str(tmp_path)
+    cassettes.configure(None, None)
+    os.environ.pop("SRT_OFFLINE", None)
+
+
+def test_cassette_client_record_and_replay(cassette_dir):
+    client = MagicMock()
+    client.rank_eval.return_value = {"metric_score": 0.5}
+    client.indices.stats.return_value = {"indices": {}}
+
+    cassettes.configure("record", cassette_dir)
+    recorder = cassettes.CassetteClient(client)
+    assert recorder.rank_eval(index="i", requests=[1]) == {"metric_score": 0.5}
+    assert recorder.indices.stats(index="i") == {"indices": {}}
+
+    cassettes.configure("replay", cassette_dir)
+    player = cassettes.CassetteClient()
+    response = player.rank_eval(requests=[1], index="i")
+    assert response == {"metric_score": 0.5}
+    assert response.recorded_elapsed is not None
+    assert player.indices.stats(index="i") == {"indices": {}}
+    assert os.environ["SRT_OFFLINE"] == "true"
+
+    with pytest.raises(cassettes.CassetteMissException):
+        player.rank_eval(requests=[2], index="i")
+
+
+def test_cassette_redacts_recording(cassette_dir):
+    cassettes.configure("record", cassette_dir)
+    config = cassettes.cassette(
+        "es_config",
+        {"commit_id": "abc"},
+        lambda: {"index": "resources", "apiKey": "secret"},
+        redact=lambda c: {"index": c["index"]},
+    )
+    assert config == {"index": "resources", "apiKey": "secret"}
+
+    cassettes.configure("replay", cassette_dir)
+    fetcher = MagicMock()
+    config = cassettes.cassette("es_config", {"commit_id": "abc"}, fetcher)
+    assert config == {"index": "resources"}
+    fetcher.assert_not_called()
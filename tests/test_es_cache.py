@@ -0,0 +1,63 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from lib.es_cache import ResponseCache
+from lib.utils import canonical_json
+
+
+@pytest.fixture
+def mock_es_client():
+    client = MagicMock()
+    client.indices.get_settings.return_value = {
+        "resources-2025": {"settings": {"index": {"uuid": "abc"}}}
+    }
+    client.indices.stats.return_value = {
+        "indices": {
+            "resources-2025": {
+                "primaries": {"docs": {"count": 10, "deleted": 0}},
+                "shards": {
+                    "0": [{"routing": {"primary": True}, "seq_no": {"max_seq_no": 9}}]
+                },
+            }
+        }
+    }
+    with patch("lib.es_cache.es_client", return_value=client):
+        yield client
+
+
+def test_canonical_json():
+    assert canonical_json({"b": 1, "a": [1, 2]}) == canonical_json(
+        {"a": [1, 2], "b": 1}
+    )
+
+
+def test_response_cache_reuses_responses(tmp_path, mock_es_client):
+    cache = ResponseCache(str(tmp_path), "resources-2025")
+    fetcher = MagicMock(return_value={"metric_score": 0.5})
+
+    assert cache.fetch("rank_eval", {"query": {"a": 1}, "b": 2}, fetcher) == {
+        "metric_score": 0.5
+    }
+    assert cache.fetch("rank_eval", {"b": 2, "query": {"a": 1}}, fetcher) == {
+        "metric_score": 0.5
+    }
+    assert fetcher.call_count == 1
+
+    # A different query is a cache miss:
+    cache.fetch("rank_eval", {"query": {"a": 2}, "b": 2}, fetcher)
+    assert fetcher.call_count == 2
+
+
+def test_response_cache_invalidated_by_index_change(tmp_path, mock_es_client):
+    fetcher = MagicMock(return_value={"metric_score": 0.5})
+    ResponseCache(str(tmp_path), "resources-2025").fetch("search", {"q": 1}, fetcher)
+
+    mock_es_client.indices.stats.return_value["indices"]["resources-2025"]["shards"][
+        "0"
+    ][0]["seq_no"]["max_seq_no"] = 10
+    cache = ResponseCache(str(tmp_path), "resources-2025")
+    cache.fetch("search", {"q": 1}, fetcher)
+
+    assert fetcher.call_count == 2
+    # Entries for the previous index state are removed:
+    assert len(list((tmp_path / "resources-2025").iterdir())) == 1
@@ -0,0 +1,107 @@
+import json
+import os
+import pytest
+import subprocess
+
+from lib import es_config_cache
+from lib.models import app_config as app_config_module
+from tests.conftest import LocalAppConfig
+
+pytestmark = pytest.mark.parametrize(
+    "app_config",
+    [
+        {
+            "app_name": "discovery-api",
+            "config": {
+                "es_config_files": ["config/production.env", "lib/load-config.js"]
+            },
+        }
+    ],
+    ids=["discovery-api"],
+    indirect=True,
+)
+
+
+@pytest.fixture
+def checkout(tmp_path, monkeypatch):
+    monkeypatch.setattr(es_config_cache, "_configs", {})
+    path = tmp_path / "app"
+    (path / "config").mkdir(parents=True)
+    (path / "config" / "production.env").write_text("ELASTICSEARCH_URI=abc\n")
+    return path
+
+
+def test_fingerprint(app_config, checkout):
+    key = es_config_cache.fingerprint(app_config, str(checkout))
+    assert key is not None
+    assert es_config_cache.fingerprint(app_config, str(checkout)) == key
+
+    (checkout / "lib").mkdir()
+    (checkout / "lib" / "load-config.js").write_text("module.exports = {}")
+    assert es_config_cache.fingerprint(app_config, str(checkout)) != key
+
+    # Not cacheable without es_config_files, or without a checkout:
+    no_files = LocalAppConfig(checkout, "discovery-api", config={})
+    assert es_config_cache.fingerprint(no_files, str(checkout)) is None
+    assert es_config_cache.fingerprint(app_config, str(checkout / "missing")) is None
+
+
+def test_fingerprint_of_commit(app_config, checkout):
+    def git(*args):
+        return subprocess.run(
+            ["git", "-C", str(checkout), *args], capture_output=True, check=True
+        ).stdout.decode()
+
+    git("init", "-q")
+    git("add", ".")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "First")
+    sha = git("rev-parse", "HEAD").strip()
+    key = es_config_cache.fingerprint(app_config, str(checkout))
+
+    (checkout / "config" / "production.env").write_text("ELASTICSEARCH_URI=def")
+    # The commit's files, regardless of the working tree:
+    assert es_config_cache.fingerprint(app_config, str(checkout), sha) == key
+    assert es_config_cache.fingerprint(app_config, str(checkout), "f" * 40) is None
+
+
+def test_load_es_config_cached(app_config, checkout, monkeypatch):
+    calls = []
+
+    def run(*args, **kwargs):
+        calls.append(args)
+        with open(args[-1], "w") as f:
+            f.write(
+                json.dumps({"nodes": "http://es:9200", "apiKey": "k", "index": "i"})
+            )
+
+    monkeypatch.setattr(app_config_module.shell, "run", run)
+
+    es_config = app_config.load_es_config(str(checkout))
+    es_config["index"] = "overridden"
+    assert app_config.load_es_config(str(checkout))["index"] == "i"
+    assert app_config.cached_es_config(str(checkout))["apiKey"] == "k"
+    assert len(calls) == 1
+
+    # Changed config files are resolved again:
+    (checkout / "config" / "production.env").write_text("ELASTICSEARCH_URI=def")
+    app_config.load_es_config(str(checkout))
+    assert len(calls) == 2
+
+    # Without a key (or the cryptography package), nothing is written to disk:
+    assert not os.path.exists(app_config.local_temp_path("es-config-cache"))
+
+
+def test_encrypted_disk_cache(app_config, checkout, monkeypatch):
+    fernet = pytest.importorskip("cryptography.fernet")
+    monkeypatch.setenv("SRT_ES_CONFIG_CACHE_KEY", fernet.Fernet.generate_key().decode())
+
+    key = es_config_cache.fingerprint(app_config, str(checkout))
+    es_config_cache.put(app_config, key, {"apiKey": "secret"})
+    path = es_config_cache.disk_path(app_config, key)
+    with open(path, "rb") as f:
+        assert b"secret" not in f.read()
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    # A new process (i.e. an empty memory cache) reads it back:
+    monkeypatch.setattr(es_config_cache, "_configs", {})
+    assert es_config_cache.get(app_config, key) == {"apiKey": "secret"}
@@ -0,0 +1,99 @@
+import json
+import pystache
+from unittest.mock import MagicMock
+
+from lib.es_profile import condense_profile
+from lib.models import run as run_module
+from lib.models.run import Run
+
+
+def profiled_response(term_nanos=3000000):
+    def shard(shard_id, scale):
+        return {
+            "id": f"[node][index][{shard_id}]",
+            "searches": [
+                {
+                    "query": [
+                        {
+                            "type": "BooleanQuery",
+                            "description": "+title:crane +title:white",
+                            "time_in_nanos": 5000000 * scale,
+                            "children": [
+                                {
+                                    "type": "TermQuery",
+                                    "description": "title:crane",
+                                    "time_in_nanos": term_nanos * scale,
+                                },
+                                {
+                                    "type": "TermQuery",
+                                    "description": "title:white",
+                                    "time_in_nanos": 1000000 * scale,
+                                },
+                            ],
+                        }
+                    ],
+                    "rewrite_time": 20000,
+                    "collector": [
+                        {"name": "SimpleTopScoreDocCollector", "time_in_nanos": 400000}
+                    ],
+                }
+            ],
+            "fetch": {"time_in_nanos": 700000},
+        }
+
+    return {"took": 42, "profile": {"shards": [shard(0, 1), shard(1, 2)]}}
+
+
+def test_condense_profile():
+    profile = condense_profile(profiled_response())
+
+    assert profile["took_ms"] == 42
+    assert [s["query_ms"] for s in profile["shards"]] == [10.0, 5.0]
+    assert profile["shards"][0]["fetch_ms"] == 0.7
+
+    top = profile["clauses"][0]
+    assert (top["type"], top["description"]) == ("TermQuery", "title:crane")
+    assert top["self_ms"] == 9.0
+    assert top["shards"] == 2
+    # The bool query's own time excludes its children's:
+    bool_clause = [c for c in profile["clauses"] if c["type"] == "BooleanQuery"][0]
+    assert bool_clause["time_ms"] == 15.0
+    assert bool_clause["self_ms"] == 3.0
+
+
+def test_profile_slow_targets(monkeypatch):
+    with open("./tests/fixtures/run-1.json") as f:
+        manifest = json.load(f)
+
+    app_config = MagicMock()
+    app_config.config.return_value = {
+        "es_profile_threshold_ms": 1000,
+        "es_profile_regression": 2,
+    }
+    for response in manifest["responses"]:
+        response["elapsed"] = 100
+    baseline = Run.from_json(app_config, manifest)
+    run = Run.from_json(app_config, manifest)
+    run.es_config = {"index": "resources"}
+    run.responses[0].elapsed = 1500
+    run.responses[1].elapsed = 300
+
+    client = MagicMock()
+    client.search.return_value = profiled_response()
+    monkeypatch.setattr(run_module, "es_client", lambda: client)
+
+    profiled = run.profile_slow_targets(baseline)
+
+    assert profiled == run.responses[0:2]
+    assert client.search.call_args.kwargs["profile"] is True
+    assert run.responses[0].profile["clauses"][0]["description"] == "title:crane"
+    assert run.responses[2].profile is None
+    assert run.responses[0].jsonable()["profile"] == run.responses[0].profile
+
+    # Already profiled targets aren't re-run:
+    assert run.profile_slow_targets(baseline) == []
+
+    renderer = pystache.Renderer(search_dirs="./templates")
+    html = renderer.render("{{>target_run}}", run.responses[0])
+    assert "ES profile (took 42ms)" in html
+    assert "<code>title:crane</code>" in html
@@ -0,0 +1,222 @@
+import json
+import os
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+from lib import fanout, sharding
+from lib.models.run import Run, RunException
+from lib.models.search_target import SearchTarget
+from lib.sharding import shard_file_key, shard_targets
+
+
+def fixture_manifest():
+    with open("./tests/fixtures/run-1.json") as f:
+        return json.load(f)
+
+
+pytestmark = pytest.mark.parametrize(
+    "app_config",
+    [
+        {
+            # Checkpoint (after enriching) every target:
+            "config": {"fanout_shards": 3, "enrichment": {"batch_size": 1}},
+            "commits": [
+                {"commit": "aaa", "description": "First"},
+                {"commit": "bbb", "description": "Second"},
+            ],
+            "targets": [
+                SearchTarget.from_json(r["target"])
+                for r in fixture_manifest()["responses"][0:8]
+            ],
+        }
+    ],
+    ids=["local-app"],
+    indirect=True,
+)
+
+
+@pytest.fixture
+def app_config(app_config, monkeypatch):
+    monkeypatch.setattr(fanout, "Report", MagicMock())
+    return app_config
+
+
+@pytest.fixture
+def fake_es(monkeypatch):
+    """Stub out app initialization and ES calls, failing once on call 5"""
+    calls = {"count": 0}
+
+    def es_rank_eval(self, **kwargs):
+        calls["count"] += 1
+        if calls["count"] == 5:
+            return {"metric_score": 0, "failures": {"report": "boom"}}
+        return {"metric_score": 0.5, "details": {}, "failures": {}}
+
+    def get_commit_date(self):
+        self.commit_date = datetime.fromisoformat("2025-01-01T00:00:00-04:00")
+        return self.commit_date
+
+    monkeypatch.setattr(Run, "initialize_app", lambda self, **kwargs: None)
+    monkeypatch.setattr(Run, "initialize_es_client", MagicMock())
+    monkeypatch.setattr(Run, "es_config", {"index": "i"}, raising=False)
+    monkeypatch.setattr(Run, "response_cache", MagicMock(enabled=False), raising=False)
+    monkeypatch.setattr(Run, "get_query", lambda self, params: {"match_all": {}})
+    monkeypatch.setattr(Run, "es_rank_eval", es_rank_eval)
+    monkeypatch.setattr(Run, "timed_search", lambda self, q: (10, [10]))
+    monkeypatch.setattr(Run, "es_msearch", lambda self, searches: [{}] * len(searches))
+    monkeypatch.setattr(Run, "get_commit_date", get_commit_date)
+    return calls
+
+
+def test_shard_targets_partitions_targets(app_config):
+    targets = app_config.load_targets()
+    shards = [shard_targets(targets, ind, 3) for ind in range(1, 4)]
+
+    assert sorted(t.key for shard in shards for t in shard) == sorted(
+        t.key for t in targets
+    )
+    with pytest.raises(ValueError):
+        shard_targets(targets, 4, 3)
+
+
+def test_fanout_resumes_from_checkpoint_and_merges(app_config, fake_es):
+    queue = fanout.LocalQueue()
+    fanout_id = fanout.start_fanout("local-app", queue)
+    assert len(queue.events) == 6
+
+    queue.drain(lambda event: fanout.handle_event(event, queue))
+
+    # One failure, resumed without re-running completed targets:
+    assert fake_es["count"] == 2 * 8 + 1
+
+    keys = [t.key for t in app_config.load_targets()]
+    for commit in ["aaa", "bbb"]:
+        run = Run.by_manifest_file(app_config, commit)
+        assert [r.target.key for r in run.responses] == keys
+    fanout.Report().build.assert_called_once()
+
+    # Restarting a merged fan-out does nothing new:
+    fanout.start_fanout("local-app", queue, fanout_id=fanout_id)
+    queue.drain(lambda event: fanout.handle_event(event, queue))
+    assert fake_es["count"] == 2 * 8 + 1
+    fanout.Report().build.assert_called_once()
+
+
+def test_fanout_continues_when_out_of_time(app_config, fake_es):
+    fake_es["count"] = 100
+    queue = fanout.LocalQueue(max_attempts=1)
+    fanout.start_fanout("local-app", queue, shards=1)
+
+    handled = []
+
+    def handler(event):
+        handled.append(event["command"])
+        fanout.handle_event(event, queue, remaining_seconds=lambda: 60)
+
+    queue.drain(handler)
+
+    # Each invocation runs one target before handing off, and one more
+    # completes the shard:
+    assert handled.count("test-shard") == 2 * (8 + 1)
+    assert fake_es["count"] == 100 + 2 * 8
+    assert handled[-1] == "merge-shards"
+
+
+def test_merge_shards_claims_merge(app_config, fake_es):
+    fake_es["count"] = 100
+    queue = fanout.LocalQueue()
+    fanout_id = fanout.start_fanout("local-app", queue)
+    merges = []
+    queue.drain(
+        lambda event: (
+            merges.append(event)
+            if event["command"] == "merge-shards"
+            else fanout.handle_event(event, queue)
+        )
+    )
+    store = fanout.FanoutStore(app_config, fanout_id)
+
+    # Another worker is already merging:
+    claim = json.dumps({"merging": datetime.now().isoformat()})
+    assert store.claim("merging.json", claim)
+    assert not store.claim("merging.json", claim)
+    fanout.merge_shards(merges[-1])
+    fanout.Report().build.assert_not_called()
+
+    # A claim older than the lease was abandoned (e.g. by a timed out merge):
+    stale = datetime.now() - timedelta(seconds=fanout.MERGE_LEASE_SECONDS + 1)
+    store.write("merging.json", json.dumps({"merging": stale.isoformat()}))
+    fanout.Report().build.side_effect = SystemExit(1)
+    with pytest.raises(SystemExit):
+        fanout.merge_shards(merges[-1])
+    fanout.Report().build.assert_called_once()
+
+    # A failed merge releases its claim, so a retry can merge:
+    assert store.read("merging.json") is None
+    fanout.Report().build.side_effect = Exception("S3 unavailable")
+    with pytest.raises(Exception, match="S3 unavailable"):
+        fanout.merge_shards(merges[-1])
+    fanout.Report().build.side_effect = None
+    fanout.merge_shards(merges[-1])
+    assert fanout.Report().build.call_count == 3
+    assert store.read("merged.json") is not None
+
+
+def test_run_raises_on_rank_eval_failure(app_config, fake_es):
+    fake_es["count"] = 4
+    app_config.load_targets()
+    run = Run(app_config=app_config, commit_id="aaa")
+
+    with pytest.raises(RunException):
+        run.collect_data()
+
+
+def write_shard_manifests(app_config, file_key, shards, count=2):
+    manifest = fixture_manifest()
+    responses = manifest["responses"][0:8]
+    os.makedirs(app_config.local_temp_path("shards"), exist_ok=True)
+    for index in shards:
+        keys = [t.key for t in shard_targets(app_config.targets, index, count)]
+        shard = {
+            **manifest,
+            "file_key": shard_file_key(file_key, index, count),
+            "responses": [r for r in responses if r["target"]["key"] in keys],
+        }
+        path = os.path.join(
+            app_config.local_temp_path("shards"), f"{shard['file_key']}.json"
+        )
+        with open(path, "w") as f:
+            f.write(json.dumps(shard))
+    return manifest
+
+
+def test_merge_shard_manifests(app_config):
+    app_config.load_targets()
+    manifest = write_shard_manifests(app_config, "local", [1, 2])
+
+    assert sharding.merge_shard_manifests(app_config) == 0
+
+    run = Run.by_manifest_file(app_config, "local")
+    assert run.file_key == "local"
+    assert [r.target.key for r in run.responses] == [t.key for t in app_config.targets]
+    assert run.commit_id == manifest["commit_id"]
+
+
+def test_merge_shard_manifests_validates(app_config):
+    app_config.load_targets()
+    write_shard_manifests(app_config, "aaa", [1])
+    assert sharding.merge_shard_manifests(app_config) == 1
+    assert Run.by_manifest_file(app_config, "aaa") is None
+
+    # A duplicated target:
+    write_shard_manifests(app_config, "aaa", [2])
+    with open(app_config.local_temp_path("shards/aaa.shard-1-of-2.json")) as f:
+        shard = json.load(f)
+    shard["responses"].append(fixture_manifest()["responses"][0])
+    shard["responses"].append(fixture_manifest()["responses"][1])
+    with open(app_config.local_temp_path("shards/aaa.shard-1-of-2.json"), "w") as f:
+        f.write(json.dumps(shard))
+
+    assert sharding.merge_shard_manifests(app_config) == 1
+    assert Run.by_manifest_file(app_config, "aaa") is None
@@ -0,0 +1,132 @@
+import gzip
+import io
+import botocore
+import pytest
+from unittest.mock import MagicMock
+
+from lib import filestore
+from lib.filestore import (
+    IMMUTABLE_CACHE_CONTROL,
+    JsonStore,
+    S3BucketWrapper,
+    gunzip_in_place,
+    upload_args,
+)
+
+
+def test_upload_args():
+    args = upload_args("report/index.html", b"<html></html>", "public-read", "no-cache")
+    assert args["ContentType"] == "text/html; charset=utf-8"
+    assert args["ContentEncoding"] == "gzip"
+    assert args["CacheControl"] == "no-cache"
+    assert gzip.decompress(args["Body"]) == b"<html></html>"
+
+    args = upload_args("manifests/abc.json", b"{}", "private")
+    assert args["ContentType"] == "application/json; charset=utf-8"
+    assert "CacheControl" not in args
+
+    args = upload_args("graphs/overall.png", b"\x89PNG", "public-read")
+    assert args["ContentType"] == "image/png"
+    assert "ContentEncoding" not in args
+    assert args["Body"] == b"\x89PNG"
+
+
+def test_upload_dir_s3(monkeypatch, tmp_path):
+    client = MagicMock()
+    client.get_paginator.return_value.paginate.return_value = []
+    monkeypatch.setattr(filestore.boto3, "client", lambda *args: client)
+    monkeypatch.setattr(filestore.boto3, "resource", lambda *args: MagicMock())
+
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "styles.abc123.css").write_text("body {}")
+    (tmp_path / "index.html").write_text("<html></html>")
+    (tmp_path / "thumb.png").write_bytes(b"\x89PNG")
+
+    S3BucketWrapper("bucket").upload_dir_s3(str(tmp_path), "srt/app/report")
+
+    puts = {
+        call.kwargs["Key"]: call.kwargs for call in client.put_object.call_args_list
+    }
+    assert puts["srt/app/report/assets/styles.abc123.css"]["CacheControl"] == (
+        IMMUTABLE_CACHE_CONTROL
+    )
+    assert puts["srt/app/report/index.html"]["CacheControl"] == "no-cache"
+    assert puts["srt/app/report/index.html"]["ContentEncoding"] == "gzip"
+    # Binary files are uploaded as is:
+    assert client.upload_file.call_args.args[2] == "srt/app/report/thumb.png"
+
+
+def test_gunzip_in_place(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_bytes(gzip.compress(b'{"a": 1}'))
+    gunzip_in_place(str(path))
+    assert path.read_bytes() == b'{"a": 1}'
+
+    # Uncompressed files (e.g. uploaded before compression) are left as is:
+    gunzip_in_place(str(path))
+    assert path.read_bytes() == b'{"a": 1}'
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.delenv("SRT_OFFLINE", raising=False)
+    client = MagicMock()
+    monkeypatch.setattr(filestore.boto3, "client", lambda *args: client)
+    monkeypatch.setattr(filestore.boto3, "resource", lambda *args: MagicMock())
+    return client
+
+
+def precondition_failed(code="PreconditionFailed"):
+    return botocore.exceptions.ClientError({"Error": {"Code": code}}, "PutObject")
+
+
+def test_json_store_lists_keys_without_fetching(s3_client, tmp_path):
+    s3_client.get_paginator.return_value.paginate.return_value = [
+        {"Contents": [{"Key": "srt/app/store/shards/aaa-1-of-2.json"}]},
+        {
+            "Contents": [
+                {"Key": "srt/app/store/shards/aaa-2-of-2.json"},
+                {"Key": "srt/app/store/shards/nested/other.json"},
+            ]
+        },
+    ]
+    store = JsonStore(str(tmp_path), "srt/app/store")
+
+    assert store.list("shards") == ["aaa-1-of-2", "aaa-2-of-2"]
+    assert s3_client.get_paginator.return_value.paginate.call_args.kwargs["Prefix"] == (
+        "srt/app/store/shards/"
+    )
+    s3_client.get_object.assert_not_called()
+
+
+def test_json_store_takes_over_expired_claim(s3_client, tmp_path):
+    store = JsonStore(str(tmp_path), "srt/app/store")
+    s3_client.put_object.side_effect = [precondition_failed(), None]
+    s3_client.get_object.return_value = {
+        "Body": io.BytesIO(gzip.compress(b'{"age": 10}')),
+        "ETag": '"abc"',
+    }
+
+    assert store.claim("claim.json", "{}", expired=lambda claim: claim["age"] > 5)
+    # Replaces only the expired version, so that one caller takes it over:
+    assert s3_client.put_object.call_args.kwargs["IfMatch"] == '"abc"'
+    assert (tmp_path / "claim.json").read_text() == "{}"
+
+    # A claim that hasn't expired is left alone:
+    s3_client.put_object.side_effect = [precondition_failed()]
+    s3_client.get_object.return_value = {
+        "Body": io.BytesIO(b'{"age": 1}'),
+        "ETag": '"def"',
+    }
+    assert not store.claim("claim.json", "{}", expired=lambda claim: claim["age"] > 5)
+
+    # Another caller took it over first:
+    s3_client.put_object.side_effect = [
+        precondition_failed(),
+        precondition_failed(),
+    ]
+    s3_client.get_object.return_value = {
+        "Body": io.BytesIO(b'{"age": 10}'),
+        "ETag": '"ghi"',
+    }
+    assert not store.claim("claim.json", "{}", expired=lambda claim: claim["age"] > 5)
@@ -0,0 +1,96 @@
+import json
+import pytest
+
+from lib.history import History
+from lib.models.run import Run
+from lib.models.search_target import SearchTarget
+
+
+def fixture_manifest(name="run-1"):
+    with open(f"./tests/fixtures/{name}.json") as f:
+        return json.load(f)
+
+
+def fixture_run(app_config, name="run-1"):
+    manifest = fixture_manifest(name)
+    return Run.from_json(app_config, {**manifest, "file_key": manifest["commit_id"]})
+
+
+pytestmark = pytest.mark.parametrize(
+    "app_config",
+    [
+        {
+            "config": {},
+            "commits": [
+                {"commit": fixture_manifest("run-1")["commit_id"]},
+                {"commit": fixture_manifest("run-2")["commit_id"]},
+            ],
+            "targets": [
+                SearchTarget.from_json(r["target"])
+                for r in fixture_manifest()["responses"]
+            ],
+        }
+    ],
+    ids=["local-app"],
+    indirect=True,
+)
+
+
+def test_save_manifest_upserts_history(app_config):
+    run = fixture_run(app_config)
+    run.save_manifest()
+    run.responses[0].response["metric_score"] = 0.123
+    run.save_manifest()
+
+    history = History(app_config)
+    assert history.file_keys() == [run.file_key]
+    rows = history.results([run.file_key])[run.file_key]
+    assert len(rows) == len(run.responses)
+    assert rows[0]["metric_score"] == 0.123
+    assert rows[0]["found"] == run.responses[0].found
+    assert rows[0]["latency_median"] == run.responses[0].elapsed
+
+    # Local runs aren't recorded:
+    run.file_key = "local"
+    run.save_manifest()
+    assert "local" not in History(app_config).file_keys()
+
+
+def test_target_history_and_merge(app_config, tmp_path):
+    run1 = fixture_run(app_config, "run-1")
+    run2 = fixture_run(app_config, "run-2")
+    key = run1.responses[0].target.key
+
+    history = History(app_config)
+    history.upsert_run(run1)
+    other = History(app_config, path=str(tmp_path / "other.sqlite"))
+    other.upsert_run(run2)
+    other.close()
+
+    assert history.merge_from(str(tmp_path / "other.sqlite")) == [run2.file_key]
+    evolution = history.target_history(key)
+    # In commit date order (run2's commit precedes run1's):
+    assert [row["commit_id"] for row in evolution] == [run2.commit_id, run1.commit_id]
+    assert evolution[0]["metric_score"] == run2.responses[0].metric_score
+
+
+def test_all_from_history(app_config):
+    run1 = fixture_run(app_config, "run-1")
+    run2 = fixture_run(app_config, "run-2")
+    # Only run2 is in the history; run1 is backfilled from its manifest:
+    run2.save_manifest()
+    with open(
+        run1.manifest_file_path(app_config.local_temp_path("manifests")), "w"
+    ) as f:
+        f.write(run1.serialize())
+
+    runs = Run.all_from_history(app_config, detailed=1)
+
+    assert [run.commit_id for run in runs] == [run2.commit_id, run1.commit_id]
+    assert run1.file_key in History(app_config).file_keys()
+    summarized, detailed = runs
+    assert summarized.responses[0].matching_documents is None
+    assert summarized.responses[0].metric_score == run2.responses[0].metric_score
+    assert summarized.responses[0].found == run2.responses[0].found
+    assert detailed.responses[0].matching_documents is not None
+    assert detailed.previous_commit_id == run2.commit_id
@@ -0,0 +1,108 @@
+import json
+from unittest.mock import MagicMock
+
+from lib.latency import mann_whitney_u, ranks, wilcoxon_signed_rank
+from lib.models import run as run_module
+from lib.models.run import Run
+
+
+def test_ranks():
+    assert ranks([30, 10, 20, 20]) == [4, 1, 2.5, 2.5]
+
+
+def test_mann_whitney_u():
+    # Exact: every current sample is slower than every baseline sample, which
+    # happens in 1 of C(10, 5) = 252 orderings:
+    u, p = mann_whitney_u([10, 11, 12, 13, 14], [20, 21, 22, 23, 24])
+    assert u == 25
+    assert round(p, 4) == round(1 / 252, 4)
+
+    _, p = mann_whitney_u([20, 21, 22, 23, 24], [10, 11, 12, 13, 14])
+    assert p == 1
+
+    # Ties use the normal approximation:
+    _, p = mann_whitney_u([10, 10, 12, 12, 14], [20, 20, 22, 22, 24])
+    assert 0 < p < 0.01
+
+    _, p = mann_whitney_u([10], [100])
+    assert p == 0.5
+
+
+def test_wilcoxon_signed_rank():
+    _, p = wilcoxon_signed_rank([(10, 20), (10, 12), (10, 13), (10, 14), (10, 15)])
+    assert p == 1 / 32
+
+    _, p = wilcoxon_signed_rank([(10, 10), (10, 10)])
+    assert p == 1
+
+
+def load_runs(baseline_samples, samples, config={}):
+    with open("./tests/fixtures/run-1.json") as f:
+        manifest = json.load(f)
+
+    app_config = MagicMock()
+    app_config.config.return_value = config
+    baseline = Run.from_json(app_config, manifest)
+    run = Run.from_json(app_config, manifest)
+    for response in baseline.responses:
+        response.elapsed_samples = list(baseline_samples)
+    for response in run.responses:
+        response.elapsed_samples = list(baseline_samples)
+    run.responses[0].elapsed_samples = list(samples)
+    return baseline, run
+
+
+def test_has_equivalent_latency():
+    baseline, run = load_runs([100, 101, 102, 103, 104], [100, 103, 101, 104, 102])
+    assert baseline.has_equivalent_latency(run) == (True, None)
+
+    baseline, run = load_runs([100, 101, 102, 103, 104], [200, 203, 201, 204, 202])
+    equivalent, explanation = baseline.has_equivalent_latency(run)
+    assert not equivalent
+    assert (
+        f"{run.responses[0].target.key}: 102ms => 202ms (x1.98, p=0.004)" in explanation
+    )
+
+    # Significant, but within the configured thresholds:
+    baseline, run = load_runs(
+        [100, 101, 102, 103, 104],
+        [200, 203, 201, 204, 202],
+        {"latency_regression": {"min_ratio": 2.5}},
+    )
+    assert baseline.has_equivalent_latency(run) == (True, None)
+
+
+def test_has_equivalent_latency_without_samples():
+    # Manifests predating sampling have one sample (elapsed) per target,
+    # too few to show a regression in any one target:
+    baseline, run = load_runs([], [])
+    for response in run.responses:
+        response.elapsed = response.elapsed * 10
+    equivalent, explanation = baseline.has_equivalent_latency(run)
+    assert not equivalent
+    assert explanation.startswith("Latency regressed: Overall: ")
+
+
+def test_timed_search_samples(monkeypatch):
+    app_config = MagicMock()
+    app_config.config.return_value = {
+        "latency_samples": 3,
+        "search_options": {"size": 50},
+    }
+    run = Run(app_config=app_config, commit_id="abc")
+    run.es_config = {"index": "resources"}
+
+    client = MagicMock()
+    client.search.return_value = {"took": 2, "hits": {"total": {"value": 0}}}
+    monkeypatch.setattr(run_module, "es_client", lambda: client)
+
+    elapsed, samples = run.timed_search({"match_all": {}})
+    assert client.search.call_count == 3
+    assert len(samples) == 3
+    assert samples[0] == elapsed
+    # Searched as the app would, without report enrichment:
+    assert client.search.call_args.kwargs == {
+        "index": "resources",
+        "query": {"match_all": {}},
+        "size": 50,
+    }
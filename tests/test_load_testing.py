@@ -0,0 +1,71 @@
+import json
+import pystache
+import pytest
+from unittest.mock import MagicMock
+
+from lib.load_testing import LoadTest, percentile, schedule
+from lib.models.search_target_response import SearchTargetResponse
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([5], 90) == 5
+    assert percentile([], 50) is None
+
+
+def test_schedule_constant_and_ramped():
+    assert len(schedule(5, 5, 2)) == 10
+    assert schedule(5, 5, 2)[0] == pytest.approx(0.2)
+
+    # Ramping from 0 to 10 QPS over 2s sends 10 requests, mostly at the end:
+    offsets = schedule(0, 10, 2)
+    assert len(offsets) == 10
+    assert offsets == sorted(offsets)
+    assert offsets[4] > 1
+
+    with pytest.raises(ValueError):
+        schedule(5, 5, 0)
+
+
+def test_load_test_records_per_target_results():
+    def search(query):
+        if query == "bad":
+            raise Exception("Timed out")
+
+    load_test = LoadTest(
+        search, [("a", "good"), ("b", "bad")], concurrency=2, qps_start=40, duration=0.5
+    )
+    results = load_test.run()
+
+    assert results["overall"]["requests"] == 20
+    assert results["overall"]["errors"] == 10
+    assert results["targets"]["a"]["error_rate"] == 0
+    assert results["targets"]["a"]["p99_ms"] is not None
+    assert results["targets"]["b"]["error_rate"] == 1
+    assert results["targets"]["b"]["p50_ms"] is None
+    assert results["error_messages"] == {"Timed out": 10}
+
+
+def test_target_run_renders_load_test_stats():
+    with open("./tests/fixtures/run-1.json") as f:
+        obj = json.load(f)["responses"][0]
+    run = MagicMock()
+    response = SearchTargetResponse.from_json(obj, run=run)
+    run.load_test = {
+        "params": {"concurrency": 4, "qps_start": 5, "qps_end": 50, "duration": 60},
+        "targets": {
+            response.target.key: {
+                "requests": 100,
+                "errors": 2,
+                "p50_ms": 35.5,
+                "p99_ms": 410.0,
+            }
+        },
+    }
+
+    renderer = pystache.Renderer(search_dirs="./templates")
+    html = renderer.render("{{>target_run}}", response)
+
+    assert "under load: p50 35.5ms, p99 410.0ms, 2 of 100 failed" in html
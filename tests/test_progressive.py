@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from lib import progressive
+from lib.models.run import Run
+
+
+def fake_target(key):
+    return SimpleNamespace(key=key)
+
+
+def fake_run(scores):
+    return SimpleNamespace(
+        responses=[
+            SimpleNamespace(target=fake_target(key), metric_score=score)
+            for key, score in scores.items()
+        ]
+    )
+
+
+# "a" changes in every run, "b" once, the rest never:
+RUNS = [
+    fake_run({"a": 0.1, "b": 0.5, "c": 1.0, "d": 1.0}),
+    fake_run({"a": 0.2, "b": 0.5, "c": 1.0, "d": 1.0}),
+    fake_run({"a": 0.3, "b": 0.6, "c": 1.0, "d": 1.0}),
+    fake_run({"a": 0.4, "b": 0.6, "c": 1.0, "d": 1.0}),
+]
+TARGETS = [fake_target(key) for key in ["d", "c", "b", "a", "new"]]
+
+
+def test_change_counts():
+    assert progressive.change_counts(RUNS) == ({"a": 3, "b": 1, "c": 0, "d": 0}, 3)
+
+
+def test_select_sentinels_by_change_frequency():
+    sentinels, explanation = progressive.select_sentinels(
+        TARGETS, RUNS, coverage=0.75, min_sentinels=1, min_history=3
+    )
+    # The most frequently changed target covers 3 of 4 changes; Targets
+    # without history are always sentinels:
+    assert [t.key for t in sentinels] == ["a", "new"]
+    assert "75% of 4 score changes in 4 runs" in explanation
+
+    sentinels, _ = progressive.select_sentinels(
+        TARGETS, RUNS, coverage=1, min_sentinels=1, min_history=3
+    )
+    assert [t.key for t in sentinels] == ["a", "b", "new"]
+
+
+def test_select_sentinels_needs_history():
+    sentinels, explanation = progressive.select_sentinels(TARGETS, RUNS, min_history=4)
+    assert sentinels is None
+    assert "Only 3 pairs" in explanation
+
+    sentinels, explanation = progressive.select_sentinels(
+        TARGETS, RUNS, min_sentinels=5, min_history=1
+    )
+    assert sentinels is None
+
+
+def test_has_equivalent_scores_of_targets():
+    app_config = MagicMock()
+    app_config.local_temp_path.return_value = "./tests/fixtures"
+    run1 = Run.by_manifest_file(app_config, "run-1")
+    run2 = Run.by_manifest_file(app_config, "run-2")
+    unchanged = [
+        r1.target.key
+        for r1, r2 in zip(run1.responses, run2.responses)
+        if r1.metric_score == r2.metric_score
+    ]
+    changed = run1.responses[0].target.key
+
+    assert run1.has_equivalent_scores(run2, target_keys=unchanged) == (True, None)
+    equivalent, explanation = run1.has_equivalent_scores(run2, target_keys=[changed])
+    assert not equivalent
+    assert explanation.startswith(f"Mismatched scores: {changed}")
+    assert not run1.has_equivalent_scores(run2, target_keys=["missing"])[0]
@@ -0,0 +1,61 @@
+import pytest
+
+from lib import pushes
+from lib.fanout import LocalQueue
+
+
+@pytest.fixture
+def app_config(app_config, monkeypatch):
+    monkeypatch.setattr(pushes, "CANCEL_CHECK_INTERVAL", 0)
+    return app_config
+
+
+def test_queued_pushes_coalesce(app_config):
+    queue = LocalQueue()
+    for sha in ["aaa", "bbb", "ccc"]:
+        pushes.receive_push("local-app", sha, queue, ref="refs/heads/main")
+
+    evaluated = []
+
+    def run_test_latest(**kwargs):
+        evaluated.append(kwargs["head"])
+
+    queue.drain(lambda event: pushes.handle_push_event(event, run_test_latest))
+
+    assert evaluated == ["ccc"]
+    assert pushes.PushStore(app_config).latest()["sha"] == "ccc"
+
+
+def test_running_push_cancelled_by_newer_push(app_config):
+    queue = LocalQueue()
+    pushes.receive_push("local-app", "aaa", queue)
+
+    evaluated = []
+
+    def run_test_latest(**kwargs):
+        evaluated.append(kwargs["head"])
+        if kwargs["head"] == "aaa":
+            # A push arrives mid-run:
+            kwargs["cancel"]()
+            pushes.receive_push("local-app", "bbb", queue)
+            with pytest.raises(pushes.PushCancelledException, match="bbb"):
+                kwargs["cancel"]()
+        else:
+            kwargs["cancel"]()
+
+    queue.drain(lambda event: pushes.handle_push_event(event, run_test_latest))
+
+    assert evaluated == ["aaa", "bbb"]
+
+
+def test_cancel_token_checks_at_interval(app_config, monkeypatch):
+    push = pushes.PushStore(app_config).record("aaa")
+    token = pushes.CancelToken(app_config, push["push_id"], interval=60)
+    token.check()
+
+    pushes.PushStore(app_config).record("bbb")
+    # Not re-checked within the interval:
+    token.check()
+    token.last_checked -= 61
+    with pytest.raises(pushes.PushCancelledException):
+        token.check()
@@ -0,0 +1,85 @@
+import json
+import pytest
+from PIL import Image
+from unittest.mock import MagicMock
+
+from lib.graphs import create_thumbnail_sprite, graph_view
+from lib.models.run import Run
+from lib.report_rendering import (
+    TemplateRenderer,
+    expand_partials,
+    run_view,
+    target_nav_view,
+    target_view,
+    write_asset,
+)
+
+
+def test_expand_partials(tmp_path):
+    (tmp_path / "outer.mustache").write_text("<ul>{{#items}}{{> item }}{{/items}}</ul>")
+    (tmp_path / "item.mustache").write_text("<li>{{name}}</li>")
+    (tmp_path / "loop.mustache").write_text("{{>loop}}")
+
+    assert expand_partials("outer", str(tmp_path)) == (
+        "<ul>{{#items}}<li>{{name}}</li>{{/items}}</ul>"
+    )
+    html = TemplateRenderer(str(tmp_path)).render(
+        "outer", {"items": [{"name": "a"}, {"name": "<b>"}]}
+    )
+    assert html == "<ul><li>a</li><li>&lt;b&gt;</li></ul>"
+
+    with pytest.raises(ValueError, match="Recursive partial"):
+        expand_partials("loop", str(tmp_path))
+
+
+def test_render_target(monkeypatch):
+    monkeypatch.setenv("SRT_OFFLINE", "true")
+    with open("./tests/fixtures/run-1.json") as f:
+        manifest = json.load(f)
+
+    app_config = MagicMock()
+    app_config.official_commit_index.return_value = 2
+    run = Run.from_json(app_config, manifest, previous_commit_id="abc")
+    run_views = {id(run): run_view(run)}
+    assert run_views[id(run)]["app_version"] == "V3"
+
+    response = run.responses[0]
+    graph = {"src": "./graphs/key.png?v=abc", "width": 500, "height": 150}
+    view = target_view(response.target, 1, [response], run_views, graph=graph)
+    html = TemplateRenderer().render("target", {}, view)
+
+    assert f'<a name="{response.target.key}"></a>' in html
+    assert (
+        '<img src="./graphs/key.png?v=abc" width="500" height="150" loading="lazy" />'
+        in html
+    )
+    assert ">V3</a>" in html
+    assert f"score {response.metric_score_formatted()}" in html
+    doc = response.matching_documents[0]
+    assert f"{doc['_id']}: {doc['_source']['title']}" in html.replace("&#x27;", "'")
+
+
+def test_thumbnail_sprite(tmp_path):
+    (tmp_path / "graphs").mkdir()
+    for key, color, height in [("a", "red", 40), ("b", "blue", 30)]:
+        Image.new("RGB", (60, height), color).save(
+            tmp_path / "graphs" / f"{key}-thumb.png"
+        )
+    Image.new("RGB", (500, 150)).save(tmp_path / "graphs" / "a.png")
+
+    sprite, offsets = create_thumbnail_sprite(str(tmp_path), ["a", "b"])
+    assert offsets["b"] == {"y": 40, "width": 60, "height": 30}
+    path = write_asset(str(tmp_path), "thumbs", "png", sprite)
+    with Image.open(tmp_path / path) as image:
+        assert image.size == (60, 70)
+        assert image.getpixel((0, 45))[0:3] == (0, 0, 255)
+
+    # Graphs are versioned by content:
+    graph = graph_view(str(tmp_path), "a")
+    assert (graph["width"], graph["height"]) == (500, 150)
+    Image.new("RGB", (500, 150), "red").save(tmp_path / "graphs" / "a.png")
+    assert graph_view(str(tmp_path), "a")["src"] != graph["src"]
+
+    nav = target_nav_view(MagicMock(key="b"), 2, offsets["b"])
+    html = TemplateRenderer().render("report_head", {"targets": [nav]})
+    assert 'style="width: 60px; height: 30px; background-position: 0 -40px"' in html
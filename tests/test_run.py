@@ -1,7 +1,11 @@
+import json
 import pytest
 from unittest.mock import MagicMock
 
+from lib.es_cache import ResponseCache
+from lib.models import run as run_module
 from lib.models.run import Run
+from lib.models.search_target import SearchTarget
 
 
 def test_run_for_path():
@@ -56,3 +60,69 @@ def test_run_has_equivalent_scores_other(mock_app_config):
 
     equiv, rationale = run1.has_equivalent_scores(run2)
     assert equiv is False
+
+
+def test_run_targets_enriches_in_batches(monkeypatch, tmp_path):
+    with open("./tests/fixtures/run-1.json") as f:
+        manifest = json.load(f)
+    app_config = MagicMock()
+    app_config.config.return_value = {"enrichment": {"batch_size": 2}}
+    app_config.targets = [
+        SearchTarget.from_json(r["target"]) for r in manifest["responses"][0:3]
+    ]
+    target = app_config.targets[0]
+
+    client = MagicMock()
+    client.msearch.side_effect = lambda searches: {
+        "responses": [
+            {
+                "hits": {
+                    "total": {"value": 7},
+                    "hits": [
+                        {
+                            "_id": target.relevant[0],
+                            "_source": {"title": ["A title", "Another"]},
+                            "highlight": {"title": ["<em>A</em> title"]},
+                        }
+                    ],
+                }
+            }
+            for _ in searches[1::2]
+        ]
+    }
+    monkeypatch.setattr(run_module, "es_client", lambda: client)
+    monkeypatch.setattr(
+        Run, "get_query", lambda self, params: {"match": {"title": params["q"]}}
+    )
+    monkeypatch.setattr(Run, "timed_search", lambda self, query: (10, [10]))
+    monkeypatch.setattr(
+        Run, "es_rank_eval", lambda self, **kwargs: {"metric_score": 1, "failures": {}}
+    )
+
+    def run_targets():
+        run = Run(app_config=app_config, commit_id="abc")
+        run.es_config = {"index": "resources"}
+        run.response_cache = ResponseCache(str(tmp_path), "resources")
+        run.response_cache._fingerprint = "fingerprint"
+        checkpoints = []
+        run.run_targets(
+            None, checkpoint=lambda run: checkpoints.append(len(run.responses))
+        )
+        return run, checkpoints
+
+    run, checkpoints = run_targets()
+
+    # One msearch (and checkpoint) per batch of two targets:
+    assert [len(c.kwargs["searches"]) for c in client.msearch.call_args_list] == [4, 2]
+    assert checkpoints == [2, 3]
+    response = run.responses[0]
+    assert response.count == 7
+    doc = response.matching_documents[0]
+    assert doc["_source"]["title"] == "A title"
+    assert doc["highlight"] == [{"field": "title", "values": ["<em>A</em> title"]}]
+    assert doc["relevant"] and doc["within_metric"]
+
+    # Enrichment searches are cached:
+    run, _ = run_targets()
+    assert client.msearch.call_count == 2
+    assert run.responses[2].count == 7
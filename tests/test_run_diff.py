@@ -0,0 +1,91 @@
+import json
+import numpy as np
+import pytest
+import shutil
+from unittest.mock import MagicMock
+
+from lib.run_diff import (
+    RunDiffException,
+    diff_manifests,
+    format_table,
+    load_manifest,
+    rank_biased_overlap,
+    rank_matrix,
+)
+
+
+def load_fixture(name):
+    with open(f"./tests/fixtures/{name}.json") as f:
+        return json.load(f)
+
+
+def rbo(a, b):
+    ids = [a, b]
+    vocabulary = np.unique(np.array(a + b + [""]))
+    depth = max(len(a), len(b), 1)
+    ranks_a = rank_matrix([ids[0]], vocabulary, depth)
+    ranks_b = rank_matrix([ids[1]], vocabulary, depth)
+    return rank_biased_overlap(ranks_a, ranks_b)[0]
+
+
+def test_rank_biased_overlap():
+    assert rbo(["a", "b", "c"], ["a", "b", "c"]) == pytest.approx(1)
+    assert rbo(["a", "b", "c"], ["d", "e", "f"]) == 0
+    assert rbo([], []) == 1
+    # Top-weighted: swapping the top two costs more than swapping the bottom two
+    swapped_top = rbo(["a", "b", "c", "d"], ["b", "a", "c", "d"])
+    swapped_bottom = rbo(["a", "b", "c", "d"], ["a", "b", "d", "c"])
+    assert swapped_top < swapped_bottom < 1
+
+
+def test_diff_manifests():
+    run1 = load_fixture("run-1")
+    run2 = load_fixture("run-2")
+
+    diff = diff_manifests(run1, run1)
+    assert diff["summary"]["scores_changed"] == 0
+    assert diff["summary"]["mean_rbo"] == 1
+    assert all(t["added"] == 0 and t["removed"] == 0 for t in diff["targets"])
+
+    diff = diff_manifests(run1, run2)
+    assert diff["summary"]["targets"] == 38
+    assert diff["summary"]["scores_changed"] == 7
+
+    target = [t for t in diff["targets"] if t["key"].startswith("liberator")][0]
+    response1 = [r for r in run1["responses"] if r["target"]["key"] == target["key"]][0]
+    response2 = [r for r in run2["responses"] if r["target"]["key"] == target["key"]][0]
+    ids1 = set([d["_id"] for d in response1["matching_documents"]])
+    ids2 = set([d["_id"] for d in response2["matching_documents"]])
+    assert target["score_delta"] == -0.5
+    assert target["added"] == len(ids2 - ids1)
+    assert target["removed"] == len(ids1 - ids2)
+    assert target["count_delta"] == response2["count"] - response1["count"]
+
+    # Targets missing from one run are listed, not compared:
+    run2["responses"] = run2["responses"][1:]
+    diff = diff_manifests(run1, run2)
+    assert diff["summary"]["targets"] == 37
+    assert diff["only_in_a"] == [run1["responses"][0]["target"]["key"]]
+
+
+def test_format_table():
+    diff = diff_manifests(load_fixture("run-1"), load_fixture("run-2"))
+    table = format_table(diff, changed_only=True)
+    lines = table.split("\n")
+    assert "7 of 38 scores changed" in lines[0]
+    # Largest score change first:
+    assert lines[4].startswith("Descent_Into_Hell")
+    assert "+1.00" in lines[4]
+
+
+def test_load_manifest(tmp_path):
+    shutil.copy("./tests/fixtures/run-1.json", tmp_path / "0c773a76f2e2.json")
+    shutil.copy("./tests/fixtures/run-2.json", tmp_path / "0c77ffff.json")
+    app_config = MagicMock()
+    app_config.local_temp_path.return_value = str(tmp_path)
+
+    assert load_manifest(app_config, "0c773")["commit_id"].startswith("0c773a76")
+    with pytest.raises(RunDiffException, match="ambiguous"):
+        load_manifest(app_config, "0c77")
+    with pytest.raises(RunDiffException, match="No manifest"):
+        load_manifest(app_config, "local")
@@ -0,0 +1,168 @@
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock
+
+from lib import elasticsearch, limits
+from lib.scheduler import Scheduler, SchedulerException, format_summary, parse_jobs
+
+APPLICATIONS = ["app-a", "app-b"]
+
+
+def test_parse_jobs():
+    assert parse_jobs(["app-b:test-all", "rebuild-report"], "app-a", APPLICATIONS) == [
+        ("app-b", "test-all"),
+        ("app-a", "rebuild-report"),
+    ]
+    assert parse_jobs(["test-latest"], "all", APPLICATIONS) == [
+        ("app-a", "test-latest"),
+        ("app-b", "test-latest"),
+    ]
+
+    with pytest.raises(SchedulerException, match="Unknown application"):
+        parse_jobs(["app-c:test-all"], "all", APPLICATIONS)
+    with pytest.raises(SchedulerException, match="Can't schedule test-local"):
+        parse_jobs(["test-local"], "app-a", APPLICATIONS)
+    with pytest.raises(SchedulerException, match="No jobs"):
+        parse_jobs([], "all", APPLICATIONS)
+
+
+def test_scheduler_runs_apps_concurrently():
+    calls = []
+    both_started = threading.Barrier(2, timeout=5)
+
+    def test_all(**kwargs):
+        calls.append((kwargs["app"], "test-all", kwargs["rows"]))
+        # Deadlocks (times out) unless both apps run at once:
+        both_started.wait()
+
+    def rebuild_report(**kwargs):
+        calls.append((kwargs["app"], "rebuild-report", kwargs["rows"]))
+
+    scheduler = Scheduler({"test-all": test_all, "rebuild-report": rebuild_report})
+    summaries = scheduler.run(
+        [
+            ("app-a", "test-all"),
+            ("app-b", "test-all"),
+            ("app-a", "rebuild-report"),
+        ],
+        rows=[1],
+    )
+
+    assert [summary["app"] for summary in summaries] == ["app-a", "app-b"]
+    assert all(summary["ok"] for summary in summaries)
+    assert [job["command"] for job in summaries[0]["jobs"]] == [
+        "test-all",
+        "rebuild-report",
+    ]
+    # Each app's jobs run in order:
+    assert calls.index(("app-a", "test-all", [1])) < calls.index(
+        ("app-a", "rebuild-report", [1])
+    )
+    assert "app-a:" in format_summary(summaries)
+
+
+def test_scheduler_skips_jobs_after_failure():
+    rebuild_report = MagicMock()
+
+    def test_all(**kwargs):
+        raise Exception("ES unreachable")
+
+    summaries = Scheduler({"test-all": test_all, "rebuild-report": rebuild_report}).run(
+        [("app-a", "test-all"), ("app-a", "rebuild-report")]
+    )
+
+    assert not summaries[0]["ok"]
+    assert [job["status"] for job in summaries[0]["jobs"]] == ["failed", "skipped"]
+    rebuild_report.assert_not_called()
+
+
+def test_scheduler_fails_jobs_that_exit():
+    def test_all(**kwargs):
+        exit(1)
+
+    summaries = Scheduler({"test-all": test_all, "rebuild-report": MagicMock()}).run(
+        [("app-a", "test-all"), ("app-b", "rebuild-report")]
+    )
+
+    # Only the exiting app's job fails:
+    assert [summary["ok"] for summary in summaries] == [False, True]
+    assert summaries[0]["jobs"][0]["status"] == "failed"
+
+
+def test_initialization_slots():
+    limits.configure(initializations=1)
+    active = []
+    overlaps = []
+
+    def initialize():
+        with limits.initialization_slot():
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.01)
+            active.pop()
+
+    try:
+        threads = [threading.Thread(target=initialize) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        limits.configure()
+
+    assert overlaps == [1, 1, 1, 1]
+
+
+def test_throttled_es_client(monkeypatch):
+    client = MagicMock()
+    monkeypatch.setattr(elasticsearch, "Elasticsearch", lambda *args, **kwargs: client)
+    # Created before (and so outliving) the limits it's throttled by:
+    throttled = elasticsearch.create_es_client({"nodes": "http://es-1:9200"})
+    limits.configure(es_requests_per_cluster=2)
+    try:
+
+        def free_slots(**kwargs):
+            return limits.es_request_slots("http://es-1:9200")._value
+
+        client.search.side_effect = free_slots
+        client.indices.stats.side_effect = free_slots
+
+        assert isinstance(throttled, elasticsearch.ThrottledClient)
+        # Calls hold one of the cluster's two slots:
+        assert throttled.search(index="a") == 1
+        assert throttled.indices.stats(index="a") == 1
+        assert free_slots() == 2
+
+        # A later schedule's limits apply to the same client:
+        limits.configure(es_requests_per_cluster=3)
+        assert throttled.search(index="a") == 2
+    finally:
+        limits.configure()
+
+
+def test_es_config_per_thread(monkeypatch):
+    monkeypatch.setattr(
+        elasticsearch, "create_es_client", lambda config: config["nodes"]
+    )
+    monkeypatch.setattr(elasticsearch, "_es_clients", {})
+    clients = {}
+
+    def use_config(nodes):
+        elasticsearch.set_es_config({"nodes": nodes})
+        time.sleep(0.01)
+        clients[nodes] = elasticsearch.es_client()
+
+    threads = [
+        threading.Thread(target=use_config, args=(nodes,))
+        for nodes in ["http://es-1:9200", "http://es-2:9200"]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert clients == {
+        "http://es-1:9200": "http://es-1:9200",
+        "http://es-2:9200": "http://es-2:9200",
+    }
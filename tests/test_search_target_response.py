@@ -0,0 +1,41 @@
+import json
+
+from lib.models.search_target_response import SearchTargetResponse
+
+
+def fixture_responses():
+    with open("./tests/fixtures/run-1.json") as f:
+        return json.load(f)["responses"]
+
+
+def test_search_target_response_round_trips_manifest_json():
+    for obj in fixture_responses():
+        response = SearchTargetResponse.from_json(obj)
+        serialized = response.jsonable()
+
+        assert serialized["matching_documents"] == obj["matching_documents"]
+        assert serialized["response"] == obj["response"]
+        assert serialized["target"] == {
+            **obj["target"],
+            "rc_search_scope": response.target.rc_search_scope,
+        }
+
+
+def test_search_target_response_shares_targets_by_key():
+    obj = fixture_responses()[0]
+    response1 = SearchTargetResponse.from_json(obj)
+    response2 = SearchTargetResponse.from_json(json.loads(json.dumps(obj)))
+
+    assert response1.target is response2.target
+    assert response1.for_run("run").target is response1.target
+
+
+def test_search_target_response_derived_values():
+    obj = fixture_responses()[0]
+    response = SearchTargetResponse.from_json(obj)
+    report = obj["response"]["details"]["report"]
+
+    assert response.metric_score == obj["response"]["metric_score"]
+    assert response.found == len(
+        [h for h in report["hits"] if h.get("rating") is not None]
+    )
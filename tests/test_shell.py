@@ -0,0 +1,57 @@
+import logging
+import pytest
+import time
+
+from lib import shell
+from lib.tracing import tracer
+
+
+def test_run_captures_stdout_and_records_span():
+    with tracer.span("test run", category="run") as span_id:
+        result = shell.run(
+            "bash", "-c", "echo one; echo two >&2; echo three", name="count"
+        )
+
+    assert result.ok
+    assert result.stdout == "one\nthree"
+    assert set(result.output_tail) == {"one", "two", "three"}
+    assert tracer.summary(within=span_id)["shell count"]["count"] == 1
+
+
+def test_run_streams_output_to_log(caplog):
+    with caplog.at_level(logging.DEBUG):
+        shell.run("bash", "-c", "echo streamed", name="greet", log_level=logging.INFO)
+    assert "[greet] streamed" in caplog.text
+
+
+def test_run_raises_on_failure():
+    with pytest.raises(shell.ShellException, match="exited 3") as e:
+        shell.run("bash", "-c", "echo broken >&2; exit 3", name="fail")
+    assert e.value.result.output_tail == ["broken"]
+
+    # Unchecked failures are returned:
+    assert shell.run("bash", "-c", "exit 1", check=False).returncode == 1
+
+
+def test_run_kills_command_after_timeout():
+    start = time.perf_counter()
+    with pytest.raises(shell.ShellTimeoutException, match="timed out"):
+        # The child sleep is killed along with bash:
+        shell.run("bash", "-c", "sleep 30 & wait", timeout=0.2)
+    assert time.perf_counter() - start < 5
+
+
+def test_commands_run_concurrently():
+    start = time.perf_counter()
+    processes = [shell.start("sleep", "0.5") for _ in range(4)]
+    results = [process.wait() for process in processes]
+    assert all(result.ok for result in results)
+    assert time.perf_counter() - start < 1.5
+
+
+def test_command_name():
+    assert (
+        shell.command_name(["bash", "./applications/x/get-query.sh", "a"])
+        == "get-query"
+    )
+    assert shell.command_name(["git", "-C", "."]) == "git"
@@ -0,0 +1,53 @@
+import json
+
+from lib.tracing import Tracer
+
+
+def test_tracer_summary_within_span():
+    tracer = Tracer()
+
+    with tracer.span("run a", category="run") as run_a:
+        with tracer.span("target 1", category="target"):
+            with tracer.span("get_query"):
+                pass
+            with tracer.span("get_query"):
+                pass
+    with tracer.span("run b", category="run"):
+        with tracer.span("get_query"):
+            pass
+
+    assert tracer.summary(within=run_a)["get_query"]["count"] == 2
+    assert tracer.summary()["get_query"]["count"] == 3
+    assert tracer.summary(category="run").keys() == {"run a", "run b"}
+
+
+def test_tracer_writes_chrome_trace_and_profile(tmp_path):
+    tracer = Tracer()
+    tracer.profiling = True
+
+    with tracer.span("fast"):
+        pass
+    with tracer.span("slow"):
+        sum(range(100000))
+
+    tracer.write_chrome_trace(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json") as f:
+        trace = json.load(f)
+    assert [e["name"] for e in trace["traceEvents"]] == ["fast", "slow"]
+    assert all(e["ph"] == "X" for e in trace["traceEvents"])
+
+    assert tracer.write_slowest_profile(str(tmp_path / "profile")) == "slow"
+    assert (tmp_path / "profile.prof").exists()
+
+
+def test_tracer_reset():
+    tracer = Tracer()
+    with tracer.span("first invocation"):
+        pass
+
+    tracer.reset()
+    with tracer.span("second invocation") as span_id:
+        pass
+
+    assert [e["name"] for e in tracer.events] == ["second invocation"]
+    assert span_id == 1
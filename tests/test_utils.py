@@ -0,0 +1,127 @@
+import json
+import pytest
+import requests
+
+from lib import utils
+from lib.utils import (
+    download_file,
+    github_changed_files,
+    local_application_file,
+    matching_paths,
+)
+
+
+def test_matching_paths():
+    paths = ["lib/resources.js", "lib/elasticsearch/config.js", "README.md"]
+
+    assert matching_paths(paths, ["lib/resources.js", "lib/elasticsearch/"]) == [
+        "lib/resources.js",
+        "lib/elasticsearch/config.js",
+    ]
+    assert matching_paths(paths, ["lib/elasticsearch/*"]) == [
+        "lib/elasticsearch/config.js"
+    ]
+    assert matching_paths(paths, ["test/"]) == []
+
+
+def test_github_changed_files(requests_mock):
+    url = "https://api.github.com/repos/NYPL/discovery-api/compare/abc...main"
+    comparison = {
+        "base_commit": {"sha": "abc"},
+        "commits": [{"sha": "def"}, {"sha": "123"}],
+        "files": [
+            {"filename": "README.md"},
+            {"filename": "lib/new.js", "previous_filename": "lib/resources.js"},
+        ],
+    }
+    requests_mock.get(url, text=json.dumps(comparison))
+
+    head_sha, paths = github_changed_files("NYPL/discovery-api", "abc", "main")
+    assert head_sha == "123"
+    assert paths == ["README.md", "lib/new.js", "lib/resources.js"]
+
+
+def test_github_changed_files_identical(requests_mock):
+    url = "https://api.github.com/repos/NYPL/discovery-api/compare/abc...main"
+    comparison = {"base_commit": {"sha": "abc"}, "commits": [], "files": []}
+    requests_mock.get(url, text=json.dumps(comparison))
+
+    assert github_changed_files("NYPL/discovery-api", "abc", "main") == ("abc", [])
+
+
+def test_github_changed_files_many_commits(requests_mock):
+    url = "https://api.github.com/repos/NYPL/discovery-api/compare/abc...main"
+    comparison = {
+        "base_commit": {"sha": "abc"},
+        "total_commits": 300,
+        "commits": [{"sha": f"sha{ind}"} for ind in range(250)],
+        "files": [{"filename": "README.md"}],
+    }
+    requests_mock.get(url, text=json.dumps(comparison))
+    requests_mock.get(
+        "https://api.github.com/repos/NYPL/discovery-api/commits/main", text="fff\n"
+    )
+
+    # The truncated commit list doesn't end at head:
+    assert github_changed_files("NYPL/discovery-api", "abc", "main") == (
+        "fff",
+        ["README.md"],
+    )
+
+
+def test_download_file_conditional_get(requests_mock, tmp_path):
+    url = "https://example.com/targets.yaml"
+    local_path = str(tmp_path / "targets.yaml")
+    requests_mock.get(
+        url, text="v1", headers={"ETag": '"abc"', "Last-Modified": "Mon, 1 Jan 2024"}
+    )
+    download_file(url, local_path)
+    with open(local_path) as f:
+        assert f.read() == "v1"
+
+    # Validators from the first download are sent, and a 304 keeps the file:
+    requests_mock.get(url, status_code=304)
+    download_file(url, local_path)
+    headers = requests_mock.last_request.headers
+    assert headers["If-None-Match"] == '"abc"'
+    assert headers["If-Modified-Since"] == "Mon, 1 Jan 2024"
+    with open(local_path) as f:
+        assert f.read() == "v1"
+
+    requests_mock.get(url, text="v2", headers={"ETag": '"def"'})
+    download_file(url, local_path)
+    with open(local_path) as f:
+        assert f.read() == "v2"
+
+    # Failures fall back on the previous download:
+    requests_mock.get(url, exc=requests.exceptions.ConnectTimeout)
+    download_file(url, local_path)
+    with open(local_path) as f:
+        assert f.read() == "v2"
+
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        download_file(url, str(tmp_path / "other.yaml"))
+
+
+def test_local_application_file(requests_mock, monkeypatch, tmp_path):
+    monkeypatch.setattr(utils, "_application_files", {})
+    monkeypatch.setattr(utils, "APPLICATION_FILES_DIR", str(tmp_path))
+    monkeypatch.delenv("SRT_OFFLINE", raising=False)
+    url = (
+        "https://raw.githubusercontent.com/NYPL/search-relevance-tests/refs/heads/main"
+        "/applications/test-app/commits.csv"
+    )
+    requests_mock.get(url, text="commit,description")
+
+    path = local_application_file("test-app", "commits.csv")
+    assert path == f"{tmp_path}/test-app/commits.csv"
+    # Memoized within the process:
+    assert local_application_file("test-app", "commits.csv") == path
+    assert requests_mock.call_count == 1
+
+    monkeypatch.setenv("SRT_APPLICATION_FILES", "local")
+    assert (
+        local_application_file("test-app", "commits.csv")
+        == "./applications/test-app/commits.csv"
+    )
+    assert requests_mock.call_count == 1